@@ -0,0 +1,64 @@
+"""
+Compare the IVF approximate nearest-neighbour index to the exact scan on a
+synthetic catalog of clustered description vectors, reporting recall@k and
+queries per second for several `n_probe` settings.
+
+    python -m benchmarks.ann --functions 200000 --dim 96 --k 5
+"""
+import time
+import argparse
+import numpy as np
+from functionsai.index import IVFIndex, normalize, recall_at_k
+
+
+def clustered(rng, count, dim, centers):
+    labels = rng.integers(len(centers), size=count)
+    noise = rng.normal(scale=0.35, size=(count, dim))
+    return normalize(centers[labels] + noise)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--functions", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--dim", type=int, default=96)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--lists", type=int, default=None)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(1000, args.dim))
+    vectors = clustered(rng, args.functions, args.dim, centers)
+    queries = clustered(rng, args.queries, args.dim, centers)
+
+    start = time.perf_counter()
+    exact = queries @ vectors.T
+    exact_seconds = time.perf_counter() - start
+    print(
+        f"exact       qps={args.queries / exact_seconds:10.1f}  recall@{args.k}=1.000"
+    )
+
+    start = time.perf_counter()
+    ivf = IVFIndex(n_lists=args.lists).fit(vectors)
+    print(
+        f"fit         {time.perf_counter() - start:.2f}s  lists={ivf.n_lists}"
+    )
+
+    for n_probe in args.probes:
+        ivf.n_probe = n_probe
+        start = time.perf_counter()
+        results = ivf.search(queries)
+        seconds = time.perf_counter() - start
+        approximate = np.zeros_like(exact)
+        for row, (ids, scores) in enumerate(results):
+            approximate[row, ids] = scores
+        recall = recall_at_k(exact, approximate, args.k)
+        print(
+            f"n_probe={n_probe:<3} qps={args.queries / seconds:10.1f}  "
+            f"recall@{args.k}={recall:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
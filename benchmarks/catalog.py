@@ -0,0 +1,108 @@
+"""
+Generate synthetic catalogs of functions with docstrings in the repo's style
+and a few example prompts each, for benchmarking without a real package.
+"""
+import types
+import numpy as np
+from typing import List
+from functionsai import Function
+
+VERBS = (
+    "get list create update delete plot summarize search export import "
+    "validate convert merge sort filter schedule send fetch resize "
+    "translate"
+).split()
+NOUNS = (
+    "weather invoice customer order report timeseries image document "
+    "calendar email user payment ticket forecast playlist recipe flight "
+    "contract sensor dataset account message shipment budget article"
+).split()
+TYPES = [("int", int), ("str", str), ("float", float), ("bool", bool)]
+PHRASES = [
+    "Can you {verb} the {noun} for me",
+    "I need to {verb} my {noun}",
+    "please {verb} this {noun} from {other}",
+    "how do I {verb} a {noun}",
+    "{verb} every {noun} that mentions {other}",
+]
+
+
+def _template(count: int):
+    params = ", ".join(f"p{i}" for i in range(count))
+    namespace = {}
+    exec(f"def template({params}):\n    return None\n", namespace)
+    return namespace["template"]
+
+
+def catalog(size: int, prompts: int = 3, seed: int = 0) -> List[Function]:
+    """
+    Generate a catalog of functions.
+
+    Args:
+        size (int): The number of functions.
+        prompts (int, optional): The largest number of example prompts per function. Defaults to 3.
+        seed (int, optional): The seed of the generator. Defaults to 0.
+
+    Returns:
+        List[Function]: The functions, each with between zero and `prompts` example prompts.
+    """
+    rng = np.random.default_rng(seed)
+    templates = [_template(count) for count in range(5)]
+    functions = []
+    for position in range(size):
+        verb, noun, other = (
+            rng.choice(VERBS),
+            rng.choice(NOUNS),
+            rng.choice(NOUNS),
+        )
+        template = templates[rng.integers(len(templates))]
+        name = f"{verb}_{noun}_{position}"
+        code = template.__code__.replace(co_name=name, co_qualname=name)
+        function = types.FunctionType(code, template.__globals__, name)
+        function.__module__ = "catalog"
+
+        lines = [
+            f"{verb.capitalize()} the {noun} of a {other} and return it.",
+            "",
+            "Args:",
+        ]
+        for param in code.co_varnames[: code.co_argcount]:
+            annotation, type = TYPES[rng.integers(len(TYPES))]
+            function.__annotations__[param] = type
+            lines.append(
+                f"    {param} ({annotation}): The {rng.choice(NOUNS)} to use."
+            )
+        lines.extend(["", "Returns:", f"    dict: The {noun}."])
+        function.__doc__ = "\n".join(f"    {line}" for line in lines)
+
+        examples = [
+            PHRASES[rng.integers(len(PHRASES))].format(
+                verb=verb, noun=noun, other=rng.choice(NOUNS)
+            )
+            for _ in range(rng.integers(prompts + 1))
+        ]
+        functions.append(Function(function, examples or None))
+    return functions
+
+
+def queries(count: int, seed: int = 1) -> List[str]:
+    """
+    Generate user prompts drawn from the catalog's vocabulary.
+
+    Args:
+        count (int): The number of prompts.
+        seed (int, optional): The seed of the generator. Defaults to 1.
+
+    Returns:
+        List[str]: The prompts.
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        PHRASES[rng.integers(len(PHRASES))].format(
+            verb=rng.choice(VERBS),
+            noun=rng.choice(NOUNS),
+            other=rng.choice(NOUNS),
+        )
+        + f" {i}"
+        for i in range(count)
+    ]
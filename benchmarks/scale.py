@@ -0,0 +1,167 @@
+"""
+Measure how FunctionsAI scales with the size of its catalog: build time,
+single-query p50/p99 latency of `top` and `sort`, batched `top_many`
+throughput and peak memory. Each size runs in its own process so peak memory
+is not carried over, and the results are written as JSON so that runs on
+different commits can be compared.
+
+    python -m benchmarks.scale --sizes 100 1000 10000 100000 --output scale.json
+    python -m benchmarks.scale --embedder spacy
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import numpy as np
+from functionsai import FunctionsAI, HashingEmbedder, SpacyEmbedder
+from .catalog import catalog, queries
+
+
+def percentiles(seconds):
+    p50, p99 = np.percentile(seconds, [50, 99]) * 1000
+    return {"p50_ms": round(float(p50), 4), "p99_ms": round(float(p99), 4)}
+
+
+def cold(functionsai):
+    # Forget the word matches memoized by earlier measurements
+    functionsai.index.name_index.match.cache_clear()
+
+
+def latencies(search, prompts):
+    seconds = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        search(prompt)
+        seconds.append(time.perf_counter() - start)
+    return percentiles(seconds)
+
+
+def measure(size, embedder, query_count, batch_size):
+    functions = catalog(size)
+    # Each measurement gets its own prompts, so none reuses another's memos
+    warmup = queries(1, seed=1)
+    top_prompts = queries(query_count, seed=2)
+    sort_prompts = queries(max(1, query_count // 4), seed=3)
+    batched_prompts = queries(query_count, seed=4)
+
+    start = time.perf_counter()
+    functionsai = FunctionsAI(
+        *functions,
+        embedder=SpacyEmbedder() if embedder == "spacy" else HashingEmbedder(),
+        query_cache_size=0,
+    )
+    build_seconds = time.perf_counter() - start
+
+    functionsai.top(warmup[0])
+    cold(functionsai)
+    top = latencies(functionsai.top, top_prompts)
+    cold(functionsai)
+    sort = latencies(functionsai.sort, sort_prompts)
+
+    cold(functionsai)
+    start = time.perf_counter()
+    for first in range(0, query_count, batch_size):
+        functionsai.top_many(batched_prompts[first : first + batch_size])
+    batched_seconds = time.perf_counter() - start
+
+    return {
+        "functions": size,
+        "texts": functionsai.build_stats.texts,
+        "build_seconds": round(build_seconds, 4),
+        "top": top,
+        "sort": sort,
+        "top_many_qps": round(query_count / batched_seconds, 2),
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2
+        ),
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 10_000, 100_000]
+    )
+    parser.add_argument(
+        "--embedder", choices=["hashing", "spacy"], default="hashing"
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--output", default=None)
+    parser.add_argument(
+        "--worker", type=int, default=None, help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        result = measure(
+            args.worker, args.embedder, args.queries, args.batch_size
+        )
+        print(json.dumps(result))
+        return
+
+    results = []
+    for size in args.sizes:
+        worker = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.scale",
+                "--worker",
+                str(size),
+                "--embedder",
+                args.embedder,
+                "--queries",
+                str(args.queries),
+                "--batch-size",
+                str(args.batch_size),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(worker.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(
+            f"{size:>7} functions  build={result['build_seconds']:8.3f}s  "
+            f"top p50={result['top']['p50_ms']:8.3f}ms "
+            f"p99={result['top']['p99_ms']:8.3f}ms  "
+            f"sort p99={result['sort']['p99_ms']:9.3f}ms  "
+            f"top_many={result['top_many_qps']:9.1f}qps  "
+            f"rss={result['peak_rss_mb']:8.1f}MB",
+            file=sys.stderr,
+        )
+
+    report = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "embedder": args.embedder,
+        "queries": args.queries,
+        "batch_size": args.batch_size,
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
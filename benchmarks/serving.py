@@ -0,0 +1,65 @@
+"""
+Compare the latency of concurrent requests served by offloading each `top`
+call to its own thread against `atop`, which micro-batches the requests that
+are waiting into one embed-and-score call.
+
+    python -m benchmarks.serving --requests 2000 --concurrency 64
+"""
+import time
+import asyncio
+import argparse
+import numpy as np
+import functionsai as fai
+from functionsai import FunctionsAI, HashingEmbedder
+
+
+async def serve(search, prompts, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request(prompt):
+        async with limit:
+            start = time.perf_counter()
+            await search(prompt)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request(prompt) for prompt in prompts))
+    return np.array(latencies), time.perf_counter() - start
+
+
+def report(label, latencies, seconds):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(
+        f"{label:<10} qps={len(latencies) / seconds:9.1f}  "
+        f"p50={p50:7.2f}ms  p99={p99:7.2f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    functionsai = FunctionsAI(fai, embedder=HashingEmbedder())
+    words = ["plot", "sort", "embed", "prompt", "index", "search", "cache"]
+    rng = np.random.default_rng(0)
+    prompts = [
+        " ".join(rng.choice(words, size=6)) + f" {i}"
+        for i in range(args.requests)
+    ]
+
+    async def threaded(prompt):
+        return await asyncio.to_thread(functionsai.top, prompt, args.top)
+
+    async def batched(prompt):
+        return await functionsai.atop(prompt, args.top)
+
+    report("threads", *asyncio.run(serve(threaded, prompts, args.concurrency)))
+    report("atop", *asyncio.run(serve(batched, prompts, args.concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Measure the `top_many` throughput of a synthetic catalog scored in this
+process against the same catalog partitioned across worker processes by a
+ShardPool, for several worker counts.
+
+    OMP_NUM_THREADS=1 python -m benchmarks.sharding --functions 500000 --workers 1 2 4 8
+"""
+import time
+import argparse
+from functionsai import FunctionsAI, HashingEmbedder, ShardPool
+from .catalog import catalog, queries
+
+
+def throughput(functionsai, prompts, batch_size):
+    functionsai.top_many(prompts[:batch_size])
+    start = time.perf_counter()
+    for first in range(0, len(prompts), batch_size):
+        functionsai.top_many(prompts[first : first + batch_size])
+    return len(prompts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--functions", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shard-size", type=int, default=None)
+    args = parser.parse_args()
+
+    functions = catalog(args.functions)
+    prompts = queries(args.queries)
+
+    local = FunctionsAI(*functions, embedder=HashingEmbedder())
+    baseline = throughput(local, prompts, args.batch_size)
+    print(f"in-process  qps={baseline:9.1f}")
+
+    for workers in args.workers:
+        sharded = FunctionsAI(
+            *functions,
+            embedder=HashingEmbedder(),
+            shards=ShardPool(workers, args.shard_size),
+        )
+        qps = throughput(sharded, prompts, args.batch_size)
+        sharded.close()
+        print(
+            f"workers={workers:<3} qps={qps:9.1f}  "
+            f"speedup={qps / baseline:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,696 @@
 """
 """
-import spacy
-import inspect
-from types import ModuleType
-from typing import Callable, List, Tuple
+import copy
+import time
+import threading
+import numpy as np
+from types import FunctionType, ModuleType
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Tuple
+from .batching import MicroBatcher
+from .embedding import (
+    BuildStats,
+    Embedder,
+    EmbeddingCache,
+    QueryCache,
+    SpacyEmbedder,
+    HashingEmbedder,
+)
 from .functions import Function
+from .index import (
+    FunctionIndex,
+    IVFIndex,
+    Storage,
+    StorageReport,
+    normalize,
+    recall_at_k,
+)
+from .metrics import LatencyHistogram, Metrics
 from .modules import Module
-from .scoring import Scoring
+from .routing import Router
+from .scoring import Scoring, top_k
+from .sharding import ShardPool
+from .snapshot import Snapshot
 
 
 class FunctionsAI:
     """
     The FunctionsAI class is the main class for the FunctionsAI package. It is used to search
     through functions and modules to find the most relevant functions given a prompt.
+
+    Queries read the current `snapshot` once and run without locks, so any
+    number of threads can score in parallel. `add`, `remove`, `update_prompts`
+    and the `scoring` setter are serialized, build a new snapshot, and publish
+    it with a single assignment.
     """
 
-    _functions: List[Function]
-    _modules: List[Module]
-    _nlp: spacy.language.Language = spacy.load("en_core_web_sm")
-    _scoring: Scoring = Scoring()
+    _embedder: Embedder
+    _cache: EmbeddingCache
+    _query_cache: QueryCache
+    _build_stats: BuildStats
+    _snapshot: Snapshot
+    _lock: threading.Lock
+    _metrics: Metrics
+    _top_batcher: MicroBatcher
+    _sort_batcher: MicroBatcher
+    _shard_pool: ShardPool
+
+    def __init__(
+        self,
+        *args,
+        embedder: Embedder = None,
+        cache_dir: str = None,
+        index_path: str = None,
+        query_cache_size: int = 1024,
+        ann: IVFIndex = None,
+        storage: Storage = None,
+        router: Router = None,
+        shards: ShardPool = None,
+        executor: Executor = None,
+        max_batch_size: int = 64,
+        max_concurrency: int = 1,
+        metrics: Metrics = None,
+    ) -> None:
+        """
+        Args:
+            *args: A list of modules and functions. Pass a Module object to control how a module is searched, or a Function object to register example prompts.
+            embedder (Embedder, optional): The embedder used for descriptions and prompts. Defaults to a lazily loaded SpacyEmbedder.
+            cache_dir (str, optional): A directory where description and prompt vectors are cached across runs. Defaults to None.
+            index_path (str, optional): An index file written by `save_index` for the same functions, memory-mapped instead of embedding the catalog. Defaults to None.
+            query_cache_size (int, optional): The number of recent prompt vectors kept in memory, or 0 to disable the cache. Defaults to 1024.
+            ann (IVFIndex, optional): An unfitted approximate nearest-neighbour index used instead of exact description and prompt scoring. Defaults to None.
+            storage (Storage, optional): How description and prompt vectors are stored, for example as int8 or projected on fewer dimensions. Ignored when loading `index_path`. Defaults to float32 with every dimension.
+            router (Router, optional): An unfitted router that sends each prompt to its best modules, so that only their functions are scored. Defaults to None.
+            shards (ShardPool, optional): Worker processes the index is partitioned across and scored on in parallel, instead of routing and scoring in this process. Defaults to None.
+            executor (Executor, optional): The executor `atop` and `asort` run embedding and scoring on. Defaults to the event loop's default executor.
+            max_batch_size (int, optional): The largest number of concurrent `atop` or `asort` prompts embedded and scored together. Defaults to 64.
+            max_concurrency (int, optional): The largest number of batches `atop` and `asort` each run at once. Defaults to 1.
+            metrics (Metrics, optional): Receives the duration of every stage of each query and index build. Defaults to None.
+        """
+        self._metrics = metrics
+        self._embedder = embedder if embedder is not None else SpacyEmbedder()
+        self._cache = (
+            EmbeddingCache(cache_dir) if cache_dir is not None else None
+        )
+        self._query_cache = (
+            QueryCache(query_cache_size) if query_cache_size > 0 else None
+        )
+        self._lock = threading.Lock()
+        modules, functions = self._register(args)
+        descriptions = prompts = None
+
+        if index_path is not None:
+            start = time.perf_counter()
+            index = FunctionIndex.load(index_path, functions)
+            self._build_stats = BuildStats(0, 0, time.perf_counter() - start)
+        else:
+            descriptions, prompts, self._build_stats = self._embed(functions)
+            start = time.perf_counter()
+            index = FunctionIndex(
+                functions,
+                description_vectors=descriptions,
+                prompts_vectors=prompts,
+                storage=storage,
+            )
+            self._record("build.index", start, len(functions))
+        if ann is not None:
+            start = time.perf_counter()
+            index.build_ann(ann)
+            self._record("build.ann", start, len(functions))
+        if router is not None:
+            start = time.perf_counter()
+            router = router.fit(
+                modules,
+                self._module_vectors(modules, functions, descriptions, prompts),
+                self._standalone(args),
+            )
+            self._record("build.route", start, len(modules))
+        self._shard_pool = shards
+        self._snapshot = Snapshot(
+            index,
+            Scoring(),
+            modules,
+            router,
+            shards.partition(index) if shards is not None else None,
+        )
+        self._top_batcher = MicroBatcher(
+            self._top_batch, executor, max_batch_size, max_concurrency
+        )
+        self._sort_batcher = MicroBatcher(
+            self.sort_many, executor, max_batch_size, max_concurrency
+        )
+
+    def save_index(self, path: str) -> None:
+        """
+        Write the index to a file that other processes can memory-map through
+        the `index_path` argument, sharing its pages instead of each holding a copy.
+
+        Args:
+            path (str): The file to write.
+        """
+        self._snapshot.index.save(path)
+
+    def compare_storage(
+        self, storage: Storage, prompts: List[str], k: int = 10
+    ) -> StorageReport:
+        """
+        Measure what storing the index's vectors with another Storage would
+        save, and how much of the current top-k rankings it would keep.
+
+        Args:
+            storage (Storage): The storage to be compared.
+            prompts (List[str]): Sample prompts whose rankings are compared.
+            k (int, optional): The number of results compared per prompt. Defaults to 10.
+
+        Returns:
+            StorageReport: The bytes taken by the current and compared vectors, and the mean share of the current top-k kept.
+        """
+        snapshot = self._snapshot
+        compared = snapshot._replace(
+            index=snapshot.index.quantize(storage), shards=None
+        )
+        # Quantizing compacts the index, which keeps alive positions in order
+        reference = self._score_many(prompts, snapshot)[:, snapshot.index.alive]
+        scores = self._score_many(prompts, compared)
+        return StorageReport(
+            snapshot.index.nbytes,
+            compared.index.nbytes,
+            recall_at_k(reference, scores, k),
+        )
+
+    def add(self, *args) -> BuildStats:
+        """
+        Register more modules and functions. Only their descriptions and prompts
+        are embedded, and they are appended to the existing index.
+
+        Args:
+            *args: A list of modules, Module objects, functions and Function objects.
+
+        Returns:
+            BuildStats: The number of texts embedded for the new functions and how long it took.
+        """
+        with self._lock:
+            modules, functions = self._register(args)
+            descriptions, prompts, build_stats = self._embed(functions)
+            start = time.perf_counter()
+            index = self._snapshot.index.copy()
+            added = index.add(functions, descriptions, prompts)
+            self._record("build.index", start, len(functions))
+            router = self._snapshot.router
+            if router is not None:
+                start = time.perf_counter()
+                router = router.add(
+                    modules,
+                    self._module_vectors(
+                        modules, functions, descriptions, prompts
+                    ),
+                    self._standalone(args),
+                )
+                self._record("build.route", start, len(modules))
+            self._publish(
+                index,
+                modules=self._snapshot.modules + modules,
+                router=router,
+                changed=added,
+            )
+        return build_stats
+
+    def remove(self, *args) -> None:
+        """
+        Unregister modules and functions. Their positions are tombstoned in the
+        index, which is compacted once enough of it has been removed.
 
-    def __init__(self, *args) -> None:
+        Args:
+            *args: A list of modules, functions, or Function objects.
         """
+        with self._lock:
+            index = self._snapshot.index.copy()
+            modules = list(self._snapshot.modules)
+            removed = []
+            positions = []
+            for arg in args:
+                if isinstance(arg, (Module, ModuleType)):
+                    module = arg.module if isinstance(arg, Module) else arg
+                    for registered in list(modules):
+                        if registered.module == module:
+                            modules.remove(registered)
+                            removed.append(registered)
+                            for function in registered.functions:
+                                positions.extend(index.positions(function))
+                else:
+                    positions.extend(index.positions(self._callable(arg)))
+            index.remove(positions)
+            router = self._snapshot.router
+            if router is not None:
+                router = router.remove(removed)
+            self._publish(
+                index, modules=modules, router=router, changed=positions
+            )
+
+    def update_prompts(self, function: Callable, prompts: List[str]) -> None:
+        """
+        Replace the example prompts of a registered function. Only the new
+        prompts are embedded.
+
+        Args:
+            function (Callable): The function, or its Function object.
+            prompts (List[str]): The new prompts related to the function.
+        """
+        with self._lock:
+            index = self._snapshot.index.copy()
+            positions = index.positions(self._callable(function))
+            if not positions:
+                raise ValueError(f"{function} is not registered")
+            vectors = None
+            if prompts:
+                text_vectors = self._embed_texts(prompts)[0]
+                vectors = [text_vectors[prompt] for prompt in prompts]
+            for position in positions:
+                updated = copy.copy(index.functions[position])
+                updated.prompts = prompts
+                index.functions[position] = updated
+            index.update_prompts(positions, vectors)
+            self._publish(index, changed=positions)
+
+    def _publish(
+        self,
+        index: FunctionIndex = None,
+        scoring: Scoring = None,
+        modules: List[Module] = None,
+        router: Router = None,
+        changed: List[int] = None,
+    ) -> None:
+        """
+        Swap in a new snapshot.
+
         Args:
-            *args: A list of modules and functions.
+            index (FunctionIndex, optional): The new index. Defaults to the current one.
+            scoring (Scoring, optional): The new scoring. Defaults to the current one.
+            modules (List[Module], optional): The new modules. Defaults to the current ones.
+            router (Router, optional): The new router. Defaults to the current one.
+            changed (List[int], optional): The positions of the new index added, removed or updated since the current one, so that only their shards are written again. Defaults to every position.
+        """
+        snapshot = self._snapshot
+        shards = snapshot.shards
+        if index is not None and self._shard_pool is not None:
+            shards = self._shard_pool.partition(index, shards, changed)
+        self._snapshot = Snapshot(
+            index if index is not None else snapshot.index,
+            scoring if scoring is not None else snapshot.scoring,
+            modules if modules is not None else snapshot.modules,
+            router if router is not None else snapshot.router,
+            shards,
+        )
+
+    @staticmethod
+    def _register(args) -> Tuple[List[Module], List[Function]]:
+        """
+        Wrap modules and functions into Module and Function objects.
+
+        Args:
+            args: A list of modules, Module objects, functions and Function objects.
+
+        Returns:
+            Tuple[List[Module], List[Function]]: The wrapped modules, and every wrapped function.
         """
-        self._functions = []
-        self._modules = []
         for arg in args:
-            if isinstance(arg, ModuleType):
-                module = Module(arg)
-                self._modules.append(module)
-                for function in module.functions:
-                    self._functions.append(Function(function))
-            elif inspect.isfunction(arg):
-                self._functions.append(Function(arg))
-            else:
+            if not isinstance(
+                arg, (Function, Module, ModuleType, FunctionType)
+            ):
                 raise TypeError(
                     "FunctionsAI only accepts Modules and Functions"
                 )
+        modules = []
+        functions = []
+        for arg in args:
+            if isinstance(arg, Function):
+                functions.append(arg)
+                continue
+            if isinstance(arg, FunctionType):
+                functions.append(Function(arg))
+                continue
+            module = arg if isinstance(arg, Module) else Module(arg)
+            modules.append(module)
+            for function in module.functions:
+                functions.append(Function(function))
+        return modules, functions
 
-        for function in self.functions:
-            if function.description is not None:
-                function.description_vector = self._nlp(
-                    function.description
-                ).vector
+    @staticmethod
+    def _callable(function: Callable) -> Callable:
+        return function.function if isinstance(function, Function) else function
 
-        for function in self.functions:
+    @classmethod
+    def _standalone(cls, args) -> List[Callable]:
+        return [
+            cls._callable(arg)
+            for arg in args
+            if isinstance(arg, (Function, FunctionType))
+        ]
+
+    def _module_vectors(
+        self,
+        modules: List[Module],
+        functions: List[Function],
+        descriptions: List[np.ndarray],
+        prompts: List[List[np.ndarray]],
+    ) -> List[List[np.ndarray]]:
+        """
+        Get the vectors a router represents each module by: its description,
+        its prompts, and the mean of its functions' description and prompt
+        vectors when they are known.
+
+        Args:
+            modules (List[Module]): The modules.
+            functions (List[Function]): The functions registered with the modules.
+            descriptions (List[np.ndarray]): The description vector of each function, or None when the index was loaded from a file.
+            prompts (List[List[np.ndarray]]): The prompt vectors of each function, or None when the index was loaded from a file.
+
+        Returns:
+            List[List[np.ndarray]]: The vectors of each module.
+        """
+        function_vectors = {}
+        if descriptions is not None:
+            for function, description, vectors in zip(
+                functions, descriptions, prompts
+            ):
+                known = function_vectors.setdefault(function.function, [])
+                if description is not None:
+                    known.append(description)
+                known.extend(vectors or [])
+
+        texts = []
+        for module in modules:
+            if module.description is not None:
+                texts.append(module.description)
+            texts.extend(module.prompts or [])
+        text_vectors = self._embed_texts(texts)[0]
+
+        modules_vectors = []
+        for module in modules:
+            vectors = [text_vectors[prompt] for prompt in module.prompts or []]
+            if module.description is not None:
+                vectors.append(text_vectors[module.description])
+            members = [
+                vector
+                for function in module.functions
+                for vector in function_vectors.get(function, [])
+            ]
+            if members:
+                vectors.append(normalize(members).mean(axis=0))
+            modules_vectors.append(vectors)
+        return modules_vectors
+
+    def _embed(
+        self, functions: List[Function]
+    ) -> Tuple[List[np.ndarray], List[List[np.ndarray]], BuildStats]:
+        """
+        Embed every description and prompt of a list of functions in a single
+        batch. The vectors are handed to the index rather than kept on the functions.
+
+        Args:
+            functions (List[Function]): The functions to be embedded.
+
+        Returns:
+            Tuple[List[np.ndarray], List[List[np.ndarray]], BuildStats]: The description vector and prompt vectors of each function, and how long embedding took.
+        """
+        texts = []
+        for function in functions:
+            if function.description is not None:
+                texts.append(function.description)
             if function.prompts is not None:
-                function.prompts_vector = [
-                    self._nlp(prompt).vector for prompt in function.prompts
-                ]
+                texts.extend(function.prompts)
+
+        text_vectors, build_stats = self._embed_texts(texts)
+        if self._metrics is not None:
+            self._metrics.record(
+                "build.embed", build_stats.seconds, build_stats.texts
+            )
+        description_vectors = [
+            text_vectors.get(function.description) for function in functions
+        ]
+        prompts_vectors = [
+            [text_vectors[prompt] for prompt in function.prompts]
+            if function.prompts is not None
+            else None
+            for function in functions
+        ]
+        return description_vectors, prompts_vectors, build_stats
+
+    def _embed_texts(
+        self, texts: List[str]
+    ) -> Tuple[Dict[str, np.ndarray], BuildStats]:
+        """
+        Embed catalog texts in a single batch, through the on-disk cache if there is one.
+        Identical texts are only embedded once.
+
+        Args:
+            texts (List[str]): The texts to be embedded.
+
+        Returns:
+            Tuple[Dict[str, np.ndarray], BuildStats]: The vector of each text, and how long embedding took.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        hits = self._cache.hits if self._cache is not None else 0
+        start = time.perf_counter()
+        if not unique_texts:
+            vectors = []
+        elif self._cache is not None:
+            vectors = self._cache.embed_many(self._embedder, unique_texts)
+        else:
+            vectors = self._embedder.embed_many(unique_texts)
+        seconds = time.perf_counter() - start
+        cached = self._cache.hits - hits if self._cache is not None else 0
+        return dict(zip(unique_texts, vectors)), BuildStats(
+            len(texts), len(unique_texts) - cached, seconds, cached
+        )
+
+    def _embed_prompts(self, prompts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of user prompts through the query cache, if there is one.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+
+        Returns:
+            np.ndarray: The vector representations of the prompts, one row per prompt.
+        """
+        start = time.perf_counter() if self._metrics is not None else 0.0
+        if self._query_cache is not None:
+            prompt_vectors = self._query_cache.embed_many(
+                self._embedder, prompts
+            )
+        else:
+            prompt_vectors = self._embedder.embed_many(prompts)
+        self._record("embed", start, len(prompts))
+        return prompt_vectors
+
+    def _score_many(
+        self, prompts: List[str], snapshot: Snapshot, top: int = None
+    ) -> np.ndarray:
+        """
+        Embed a batch of prompts and score every function against each of them.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            snapshot (Snapshot): The snapshot the prompts are scored against.
+            top (int, optional): The number of results needed per prompt. When the index is sharded, functions outside each shard's top results score -inf. Defaults to every function.
+
+        Returns:
+            np.ndarray: The similarity scores, one row per prompt and one column per function.
+        """
+        if snapshot.shards is not None:
+            start = time.perf_counter() if self._metrics is not None else 0.0
+            similarity_scores = self._shard_pool.score(
+                snapshot.shards,
+                prompts,
+                self._embed_prompts,
+                snapshot.index,
+                snapshot.scoring,
+                top,
+                self._metrics,
+            )
+            self._record("shards", start, len(prompts) * len(snapshot.index))
+        elif snapshot.router is not None and snapshot.router.routed:
+            similarity_scores = self._score_routed(prompts, snapshot)
+        else:
+            similarity_scores = self._score_index(
+                prompts, self._embed_prompts, snapshot.index, snapshot.scoring
+            )
+        alive = snapshot.index.alive
+        if not alive.all():
+            similarity_scores[:, ~alive] = -np.inf
+        return similarity_scores
+
+    def _score_index(
+        self,
+        prompts: List[str],
+        embed: Callable[[List[str]], np.ndarray],
+        index: FunctionIndex,
+        scoring: Scoring,
+        positions: np.ndarray = None,
+    ) -> np.ndarray:
+        """
+        Score every function of an index against a batch of prompts.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            embed (Callable[[List[str]], np.ndarray]): Embeds a list of prompts, one row per prompt.
+            index (FunctionIndex): The index of the functions to be scored.
+            scoring (Scoring): The scoring used.
+            positions (np.ndarray, optional): The positions of the only functions scored on descriptions and prompts. Defaults to every position.
+
+        Returns:
+            np.ndarray: The similarity scores, one row per prompt and one column per function, or per position when `positions` is set.
+        """
+        if scoring.cascades:
+            return scoring.score_cascade(
+                prompts, embed, index, self._metrics, positions
+            )
+        return scoring.score_many(
+            prompts, embed(prompts), index, self._metrics, positions
+        )
+
+    def _score_routed(
+        self, prompts: List[str], snapshot: Snapshot
+    ) -> np.ndarray:
+        """
+        Score each prompt of a batch against the functions of the modules it
+        is routed to, and every prompt the router is not confident about, or
+        whose modules hold no function, against every function. Functions a
+        prompt is not routed to score -inf. Names and lexical matches are
+        scored on the whole index, whose name and lexical indexes are cached,
+        and only descriptions and prompts on the routed functions.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            snapshot (Snapshot): The snapshot the prompts are scored against.
+
+        Returns:
+            np.ndarray: The similarity scores, one row per prompt and one column per function.
+        """
+        prompt_vecs = np.asarray(self._embed_prompts(prompts))
+        vectors = dict(zip(prompts, prompt_vecs))
+
+        def embed(prompts: List[str]) -> np.ndarray:
+            return np.array([vectors[prompt] for prompt in prompts])
+
+        start = time.perf_counter() if self._metrics is not None else 0.0
+        router, index = snapshot.router, snapshot.index
+        routes = router.route(prompt_vecs)
+        rows_positions = {}
+        for row, modules in enumerate(routes):
+            if modules is None:
+                continue
+            functions = [f for module in modules for f in module.functions]
+            positions = [
+                position
+                for function in functions + router.standalone
+                for position in index.positions(function)
+            ]
+            if positions:
+                rows_positions[row] = np.unique(positions)
+        self._record("route", start, len(prompts) * len(router.routed))
+
+        scores = np.full((len(prompts), len(index)), -np.inf, dtype=np.float32)
+        routed = list(rows_positions)
+        full = [row for row in range(len(prompts)) if row not in rows_positions]
+        if full:
+            scores[full] = self._score_index(
+                [prompts[row] for row in full], embed, index, snapshot.scoring
+            )
+        if routed:
+            positions = np.unique(
+                np.concatenate([rows_positions[row] for row in routed])
+            )
+            subset_scores = self._score_index(
+                [prompts[row] for row in routed],
+                embed,
+                index,
+                snapshot.scoring,
+                positions,
+            )
+            for row, row_scores in zip(routed, subset_scores):
+                columns = np.searchsorted(positions, rows_positions[row])
+                scores[row, rows_positions[row]] = row_scores[columns]
+        return scores
+
+    def close(self) -> None:
+        """
+        Stop the shard worker processes, if any, and delete their files.
+        """
+        if self._shard_pool is not None:
+            self._shard_pool.close()
+
+    def _record(self, stage: str, start: float, count: int) -> None:
+        if self._metrics is not None:
+            self._metrics.record(stage, time.perf_counter() - start, count)
+
+    def _query(
+        self, prompts: List[str], tops: List[int], select: Callable
+    ) -> list:
+        """
+        Score a batch of prompts against the current snapshot and select the
+        results of each one.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            tops (List[int]): The number of results of each prompt, or None for every function.
+            select (Callable): Turns the scores of a prompt, its number of results and the snapshot into its results.
+
+        Returns:
+            list: The results of each prompt.
+        """
+        metrics = self._metrics
+        start = time.perf_counter() if metrics is not None else 0.0
+        snapshot = self._snapshot
+        needed = None if None in tops else max(tops, default=None)
+        similarity_scores = self._score_many(prompts, snapshot, needed)
+        selecting = time.perf_counter() if metrics is not None else 0.0
+        results = [
+            select(row, top, snapshot)
+            for row, top in zip(similarity_scores, tops)
+        ]
+        if metrics is not None:
+            end = time.perf_counter()
+            metrics.record("select", end - selecting, len(prompts))
+            metrics.record("query", end - start, len(prompts))
+        return results
+
+    @staticmethod
+    def _sorted(
+        similarity_scores: np.ndarray, top: int, snapshot: Snapshot
+    ) -> List[Tuple[Function, float]]:
+        order = np.argsort(-similarity_scores, kind="stable")
+        order = order[snapshot.index.alive[order]][:top]
+        return [
+            (snapshot.index.functions[position], similarity_scores[position])
+            for position in order
+        ]
+
+    @staticmethod
+    def _top(
+        similarity_scores: np.ndarray, top: int, snapshot: Snapshot
+    ) -> List[dict]:
+        # Schemas are shared by every query, so callers get their own copies
+        alive = int(snapshot.index.alive.sum())
+        return [
+            copy.deepcopy(snapshot.index.functions[position].schema)
+            for position in top_k(similarity_scores, min(top, alive))
+        ]
+
+    @staticmethod
+    def _top_json(
+        similarity_scores: np.ndarray, top: int, snapshot: Snapshot
+    ) -> bytes:
+        alive = int(snapshot.index.alive.sum())
+        return b"[%s]" % b",".join(
+            snapshot.index.functions[position].schema_json
+            for position in top_k(similarity_scores, min(top, alive))
+        )
+
+    def _top_batch(self, requests: List[Tuple[str, int]]) -> List[List[dict]]:
+        prompts, tops = zip(*requests)
+        return self._query(list(prompts), tops, self._top)
 
     def sort(self, prompt: str) -> List[Tuple[Function, float]]:
         """
@@ -62,18 +702,26 @@ class FunctionsAI:
         Returns:
             List[Tuple[Function, float]]: A list of functions and their similarity scores.
         """
-        prompt_vector = self._nlp(prompt).vector
-        similarity_scores = self.scoring.score(
-            prompt, prompt_vector, self.functions
-        )
-        paired_functions_scores = zip(self.functions, similarity_scores)
-        sorted_pairs = sorted(
-            paired_functions_scores, key=lambda x: x[1], reverse=True
-        )
+        return self._query([prompt], [None], self._sorted)[0]
+
+    def sort_many(
+        self, prompts: List[str]
+    ) -> List[List[Tuple[Function, float]]]:
+        """
+        Sort the functions by their similarity to each prompt of a batch. The
+        prompts are embedded and scored together.
 
-        return sorted_pairs
+        Args:
+            prompts (List[str]): The user's prompts.
+
+        Returns:
+            List[List[Tuple[Function, float]]]: For each prompt, a list of functions and their similarity scores.
+        """
+        if not prompts:
+            return []
+        return self._query(prompts, [None] * len(prompts), self._sorted)
 
-    def top(self, prompt: str, top: int = 5) -> List[Function]:
+    def top(self, prompt: str, top: int = 5) -> List[dict]:
         """
         Search the functions and modules for the most relevant functions.
 
@@ -82,32 +730,84 @@ class FunctionsAI:
             top (int, optional): The number of functions to return. Defaults to 5.
 
         Returns:
-            List[Function]: A list of the most relevant functions.
+            List[dict]: The schemas of the most relevant functions, which the caller may modify.
         """
-        sorted_pairs = self.sort(prompt)
-        matches = [pair[0] for pair in sorted_pairs[:top]]
-        return [
-            {
-                "name": match.name,
-                "description": match.description,
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        param.name: {
-                            "type": param.type,
-                            "description": param.description,
-                        }
-                        for param in match.params
-                    },
-                    "required": [
-                        param.name
-                        for param in match.params
-                        if param.is_required
-                    ],
-                },
-            }
-            for match in matches
-        ]
+        return self._query([prompt], [top], self._top)[0]
+
+    def top_many(self, prompts: List[str], top: int = 5) -> List[List[dict]]:
+        """
+        Search the functions and modules for the most relevant functions for
+        each prompt of a batch. The prompts are embedded and scored together.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            top (int, optional): The number of functions to return per prompt. Defaults to 5.
+
+        Returns:
+            List[List[dict]]: For each prompt, the schemas of the most relevant functions, which the caller may modify.
+        """
+        if not prompts:
+            return []
+        return self._query(prompts, [top] * len(prompts), self._top)
+
+    def top_json(self, prompt: str, top: int = 5) -> bytes:
+        """
+        Search the functions and modules for the most relevant functions, and
+        return their schemas as a JSON array joined from pre-encoded bytes.
+
+        Args:
+            prompt (str): The user's prompt.
+            top (int, optional): The number of functions to return. Defaults to 5.
+
+        Returns:
+            bytes: A JSON array of the schemas of the most relevant functions.
+        """
+        return self._query([prompt], [top], self._top_json)[0]
+
+    def top_json_many(self, prompts: List[str], top: int = 5) -> List[bytes]:
+        """
+        Search the functions and modules for the most relevant functions for
+        each prompt of a batch, and return their schemas as JSON arrays.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            top (int, optional): The number of functions to return per prompt. Defaults to 5.
+
+        Returns:
+            List[bytes]: For each prompt, a JSON array of the schemas of the most relevant functions.
+        """
+        if not prompts:
+            return []
+        return self._query(prompts, [top] * len(prompts), self._top_json)
+
+    async def asort(self, prompt: str) -> List[Tuple[Function, float]]:
+        """
+        Sort the functions by their similarity to the prompt without blocking the
+        event loop. Prompts awaited concurrently are embedded and scored together
+        on the executor.
+
+        Args:
+            prompt (str): The user's prompt.
+
+        Returns:
+            List[Tuple[Function, float]]: A list of functions and their similarity scores.
+        """
+        return await self._sort_batcher.submit(prompt)
+
+    async def atop(self, prompt: str, top: int = 5) -> List[dict]:
+        """
+        Search the functions and modules for the most relevant functions without
+        blocking the event loop. Prompts awaited concurrently are embedded and
+        scored together on the executor.
+
+        Args:
+            prompt (str): The user's prompt.
+            top (int, optional): The number of functions to return. Defaults to 5.
+
+        Returns:
+            List[dict]: The schemas of the most relevant functions, which the caller may modify.
+        """
+        return await self._top_batcher.submit((prompt, top))
 
     @property
     def functions(self) -> List[Function]:
@@ -115,7 +815,11 @@ class FunctionsAI:
         Returns:
             List[Function]: A list of functions.
         """
-        return self._functions
+        return [
+            function
+            for function in self._snapshot.index.functions
+            if function is not None
+        ]
 
     @property
     def modules(self) -> List[Module]:
@@ -123,7 +827,71 @@ class FunctionsAI:
         Returns:
             List[Module]: A list of modules.
         """
-        return self._modules
+        return self._snapshot.modules
+
+    @property
+    def index(self) -> FunctionIndex:
+        """
+        Returns:
+            FunctionIndex: The index of the embedded functions.
+        """
+        return self._snapshot.index
+
+    @property
+    def snapshot(self) -> Snapshot:
+        """
+        Returns:
+            Snapshot: The view of the catalog that queries currently run against.
+        """
+        return self._snapshot
+
+    @property
+    def router(self) -> Router:
+        """
+        Returns:
+            Router: The fitted router that sends prompts to their best modules, if any.
+        """
+        return self._snapshot.router
+
+    @property
+    def embedder(self) -> Embedder:
+        """
+        Returns:
+            Embedder: The embedder used for descriptions and prompts.
+        """
+        return self._embedder
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        """
+        Returns:
+            EmbeddingCache: The on-disk cache of catalog vectors, if any.
+        """
+        return self._cache
+
+    @property
+    def query_cache(self) -> QueryCache:
+        """
+        Returns:
+            QueryCache: The in-memory cache of prompt vectors, if any.
+        """
+        return self._query_cache
+
+    @property
+    def build_stats(self) -> BuildStats:
+        """
+        Returns:
+            BuildStats: The number of texts embedded for the catalog and how long it took.
+        """
+        return self._build_stats
+
+    @property
+    def metrics(self) -> Metrics:
+        """
+        Returns:
+            Metrics: The receiver of stage durations, if any.
+        """
+        return self._metrics
 
     @property
     def scoring(self) -> Scoring:
@@ -131,15 +899,35 @@ class FunctionsAI:
         Returns:
             Scoring: The scoring object.
         """
-        return self._scoring
+        return self._snapshot.scoring
 
     @scoring.setter
     def scoring(self, scoring: Scoring) -> None:
         """
         Args:
-            scoring (Scoring): The scoring object.
+            scoring (Scoring): The scoring object. A copy is published, so later changes to it are not seen by queries.
         """
-        self._scoring = scoring
+        with self._lock:
+            self._publish(scoring=copy.copy(scoring))
 
 
-__all__ = ["FunctionsAI", "Function", "Module", "Scoring"]
+__all__ = [
+    "FunctionsAI",
+    "Function",
+    "Module",
+    "Scoring",
+    "Embedder",
+    "SpacyEmbedder",
+    "HashingEmbedder",
+    "EmbeddingCache",
+    "QueryCache",
+    "IVFIndex",
+    "Router",
+    "ShardPool",
+    "Storage",
+    "StorageReport",
+    "MicroBatcher",
+    "Snapshot",
+    "Metrics",
+    "LatencyHistogram",
+]
@@ -0,0 +1,120 @@
+"""
+"""
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Set, Tuple
+
+
+class MicroBatcher:
+    """
+    The MicroBatcher class lets coroutines await a blocking batch function
+    one item at a time. Items submitted while the executor is busy are queued,
+    and each worker takes up to `max_batch_size` of them in a single call,
+    so concurrent requests share one batched run instead of one thread each.
+    """
+
+    _function: Callable[[List[Any]], List[Any]]
+    _executor: Executor
+    _max_batch_size: int
+    _max_concurrency: int
+    _pending: List[Tuple[Any, asyncio.Future]]
+    _workers: Set[asyncio.Task]
+
+    def __init__(
+        self,
+        function: Callable[[List[Any]], List[Any]],
+        executor: Executor = None,
+        max_batch_size: int = 64,
+        max_concurrency: int = 1,
+    ) -> None:
+        """
+        Args:
+            function (Callable[[List[Any]], List[Any]]): The blocking function, returning one result per item.
+            executor (Executor, optional): The executor the function runs on. Defaults to the event loop's default executor.
+            max_batch_size (int, optional): The largest number of items passed to one call. Defaults to 64.
+            max_concurrency (int, optional): The largest number of calls running at once. Defaults to 1.
+        """
+        self._function = function
+        self._executor = executor
+        self._max_batch_size = max_batch_size
+        self._max_concurrency = max_concurrency
+        self._pending = []
+        self._workers = set()
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue an item for the next batch and wait for its result.
+
+        Args:
+            item (Any): The item to be processed.
+
+        Returns:
+            Any: The result of the function for this item.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._workers) < self._max_concurrency:
+            self._workers.add(loop.create_task(self._work(loop)))
+        return await future
+
+    async def _work(self, loop: asyncio.AbstractEventLoop) -> None:
+        try:
+            # Yield once so that requests submitted in the same tick join
+            await asyncio.sleep(0)
+            await self._drain(loop)
+        finally:
+            # Leave the pool in the same step that finds nothing pending, so
+            # that a later submit never counts a worker that is about to exit
+            self._workers.discard(asyncio.current_task())
+
+    async def _drain(self, loop: asyncio.AbstractEventLoop) -> None:
+        while self._pending:
+            batch = self._pending[: self._max_batch_size]
+            del self._pending[: len(batch)]
+            batch = [
+                (item, future) for item, future in batch if not future.done()
+            ]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(
+                    self._executor,
+                    self._function,
+                    [item for item, _ in batch],
+                )
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+
+    @property
+    def executor(self) -> Executor:
+        """
+        Returns:
+            Executor: The executor the function runs on.
+        """
+        return self._executor
+
+    @property
+    def max_batch_size(self) -> int:
+        """
+        Returns:
+            int: The largest number of items passed to one call.
+        """
+        return self._max_batch_size
+
+    @property
+    def max_concurrency(self) -> int:
+        """
+        Returns:
+            int: The largest number of calls running at once.
+        """
+        return self._max_concurrency
+
+
+__all__ = ["MicroBatcher"]
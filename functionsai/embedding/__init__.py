@@ -0,0 +1,534 @@
+"""
+"""
+import os
+import re
+import glob
+import zlib
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple
+
+# The length of the EmbeddingCache keys, in bytes
+_KEY_SIZE = 16
+
+# The number of EmbeddingCache segments of one embedder from which they are
+# merged into one when loaded
+_MAX_SEGMENTS = 16
+
+
+class BuildStats(NamedTuple):
+    """
+    The BuildStats class records how long it took to embed a catalog. `texts`
+    counts every description and prompt, `embedded` the distinct texts that
+    went through the embedder and `cached` those read from an EmbeddingCache.
+    """
+
+    texts: int
+    embedded: int
+    seconds: float
+    cached: int = 0
+
+    @property
+    def texts_per_second(self) -> float:
+        """
+        Returns:
+            float: The number of catalog texts embedded per second.
+        """
+        return self.texts / self.seconds if self.seconds > 0 else 0.0
+
+
+class Embedder(ABC):
+    """
+    The Embedder class maps text to vectors. Subclasses implement `embed_many`.
+    """
+
+    _name: str
+    _version: str
+
+    def embed(self, text: str) -> np.ndarray:
+        """
+        Embed a single text.
+
+        Args:
+            text (str): The text to be embedded.
+
+        Returns:
+            np.ndarray: The vector representation of the text.
+        """
+        return self.embed_many([text])[0]
+
+    @abstractmethod
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts (List[str]): The texts to be embedded.
+
+        Returns:
+            np.ndarray: A matrix with one row per text.
+        """
+
+    @property
+    def name(self) -> str:
+        """
+        Returns:
+            str: The name of the underlying model.
+        """
+        return self._name
+
+    @property
+    def version(self) -> str:
+        """
+        Returns:
+            str: The version of the underlying model.
+        """
+        return self._version
+
+
+class SpacyEmbedder(Embedder):
+    """
+    The SpacyEmbedder class embeds text with a spaCy pipeline. The pipeline is
+    loaded on first use and shared by every SpacyEmbedder using the same model.
+    Texts are streamed through `nlp.pipe` with every component that does not
+    contribute to `Doc.vector` disabled.
+    """
+
+    _models: Dict[str, object] = {}
+    _lock: threading.Lock = threading.Lock()
+    _vector_components = ("tok2vec", "transformer")
+
+    def __init__(
+        self,
+        model: str = "en_core_web_sm",
+        batch_size: int = 256,
+        n_process: int = 1,
+    ) -> None:
+        """
+        Args:
+            model (str, optional): The spaCy model to load. Defaults to "en_core_web_sm".
+            batch_size (int, optional): The number of texts per `nlp.pipe` batch. Defaults to 256.
+            n_process (int, optional): The number of processes used by `nlp.pipe`. Defaults to 1.
+        """
+        self._name = model
+        self._version = None
+        self._nlp = None
+        self._disable = None
+        self._batch_size = batch_size
+        self._n_process = n_process
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts (List[str]): The texts to be embedded.
+
+        Returns:
+            np.ndarray: A matrix with one row per text.
+        """
+        docs = self.nlp.pipe(
+            texts,
+            batch_size=self._batch_size,
+            n_process=self._n_process,
+            disable=self.disable,
+        )
+        return np.array([doc.vector for doc in docs])
+
+    @property
+    def nlp(self):
+        """
+        Returns:
+            spacy.language.Language: The loaded spaCy pipeline.
+        """
+        if self._nlp is None:
+            with SpacyEmbedder._lock:
+                if self._name not in SpacyEmbedder._models:
+                    import spacy
+
+                    SpacyEmbedder._models[self._name] = spacy.load(self._name)
+            self._nlp = SpacyEmbedder._models[self._name]
+        return self._nlp
+
+    @property
+    def disable(self) -> List[str]:
+        """
+        Returns:
+            List[str]: The pipeline components skipped when embedding. Models with
+            static vectors need no components; the others keep their tok2vec
+            layer, whose output is averaged into `Doc.vector`.
+        """
+        if self._disable is None:
+            keep = (
+                () if self.nlp.vocab.vectors.size else self._vector_components
+            )
+            self._disable = [
+                name for name in self.nlp.pipe_names if name not in keep
+            ]
+        return self._disable
+
+    @property
+    def batch_size(self) -> int:
+        """
+        Returns:
+            int: The number of texts per `nlp.pipe` batch.
+        """
+        return self._batch_size
+
+    @property
+    def n_process(self) -> int:
+        """
+        Returns:
+            int: The number of processes used by `nlp.pipe`.
+        """
+        return self._n_process
+
+    @property
+    def version(self) -> str:
+        """
+        Returns:
+            str: The version of the underlying model.
+        """
+        if self._version is None:
+            self._version = self.nlp.meta.get("version", "")
+        return self._version
+
+
+class HashingEmbedder(Embedder):
+    """
+    The HashingEmbedder class embeds text by hashing its words into a fixed
+    number of buckets. It needs no model and is meant for tests and benchmarks.
+    """
+
+    _pattern = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 96) -> None:
+        """
+        Args:
+            dim (int, optional): The number of dimensions. Defaults to 96.
+        """
+        self._name = "hashing"
+        self._version = str(dim)
+        self._dim = dim
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts (List[str]): The texts to be embedded.
+
+        Returns:
+            np.ndarray: A matrix with one row per text.
+        """
+        vectors = np.zeros((len(texts), self._dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = self._pattern.findall(text.lower())
+            for word in words:
+                bucket = zlib.crc32(word.encode())
+                sign = 1.0 if bucket & 1 else -1.0
+                vectors[row, (bucket >> 1) % self._dim] += sign
+            if words:
+                vectors[row] /= len(words)
+        return vectors
+
+    @property
+    def dim(self) -> int:
+        """
+        Returns:
+            int: The number of dimensions.
+        """
+        return self._dim
+
+
+class EmbeddingCache:
+    """
+    The EmbeddingCache class stores text vectors in a directory so that they
+    survive restarts. Entries are keyed by a hash of the text and of the
+    embedder's model name and version. Each batch of new vectors of one
+    embedder is appended as its own `.npz` segment holding a float32 matrix
+    and a uint8 matrix of 16-byte keys, and the segments are merged when the
+    cache is loaded. Keys are stored as raw bytes rather than as a NumPy bytes
+    array, which would strip the trailing zero bytes of some keys.
+
+    The cache is safe to share between threads. Texts are embedded without
+    holding its lock, so two threads may both embed a text neither has cached.
+    """
+
+    _directory: str
+    _stores: Dict[str, Dict[bytes, np.ndarray]]
+    _hits: int
+    _misses: int
+
+    def __init__(self, directory: str) -> None:
+        """
+        Args:
+            directory (str): The directory holding the cache files. It is created if needed.
+        """
+        self._directory = directory
+        self._stores = {}
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def embed_many(self, embedder: Embedder, texts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of texts, only running the embedder on texts that are not cached.
+
+        Args:
+            embedder (Embedder): The embedder used for texts missing from the cache.
+            texts (List[str]): The texts to be embedded.
+
+        Returns:
+            np.ndarray: A matrix with one row per text.
+        """
+        namespace = self._namespace(embedder)
+        keys = [self._key(namespace, text) for text in texts]
+
+        with self._lock:
+            store = self._load(namespace)
+            missing = list(
+                dict.fromkeys(
+                    (key, text)
+                    for key, text in zip(keys, texts)
+                    if key not in store
+                )
+            )
+            self._hits += len(texts) - len(missing)
+            self._misses += len(missing)
+
+        if missing:
+            vectors = np.asarray(
+                embedder.embed_many([text for _, text in missing]),
+                dtype=np.float32,
+            )
+            self._save(namespace, [key for key, _ in missing], vectors)
+            with self._lock:
+                for (key, _), vector in zip(missing, vectors):
+                    store[key] = vector
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([store[key] for key in keys])
+
+    def _namespace(self, embedder: Embedder) -> str:
+        return hashlib.blake2b(
+            f"{embedder.name}\0{embedder.version}".encode(), digest_size=8
+        ).hexdigest()
+
+    def _key(self, namespace: str, text: str) -> bytes:
+        return hashlib.blake2b(
+            text.encode(), digest_size=_KEY_SIZE, key=namespace.encode()
+        ).digest()
+
+    def _segments(self, namespace: str) -> List[str]:
+        return sorted(
+            glob.glob(os.path.join(self._directory, f"{namespace}*.npz"))
+        )
+
+    def _load(self, namespace: str) -> Dict[bytes, np.ndarray]:
+        if namespace not in self._stores:
+            store = {}
+            segments = self._segments(namespace)
+            for path in segments:
+                try:
+                    with np.load(path) as arrays:
+                        keys = [key.tobytes() for key in arrays["keys"]]
+                        store.update(zip(keys, arrays["vectors"]))
+                except (OSError, KeyError, ValueError):
+                    pass
+            if len(segments) > _MAX_SEGMENTS and store:
+                self._save(
+                    namespace,
+                    list(store),
+                    np.stack(list(store.values())).astype(np.float32),
+                )
+                for path in segments:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self._stores[namespace] = store
+        return self._stores[namespace]
+
+    def _save(
+        self, namespace: str, keys: List[bytes], vectors: np.ndarray
+    ) -> None:
+        """
+        Write a new segment. It is written under a temporary name and renamed,
+        so that a process loading the cache never reads it half written.
+        """
+        handle, path = tempfile.mkstemp(
+            dir=self._directory, prefix=f"{namespace}.", suffix=".tmp"
+        )
+        with os.fdopen(handle, "wb") as file:
+            np.savez(
+                file,
+                keys=np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(
+                    -1, _KEY_SIZE
+                ),
+                vectors=vectors,
+            )
+        os.replace(path, f"{path[:-len('.tmp')]}.npz")
+
+    @property
+    def directory(self) -> str:
+        """
+        Returns:
+            str: The directory holding the cache files.
+        """
+        return self._directory
+
+    @property
+    def hits(self) -> int:
+        """
+        Returns:
+            int: The number of texts read from the cache.
+        """
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Returns:
+            int: The number of texts that had to be embedded.
+        """
+        return self._misses
+
+
+class QueryCache:
+    """
+    The QueryCache class keeps the vectors of recently seen prompts in memory.
+    Prompts are keyed on their text with whitespace collapsed, and the least
+    recently used entry is evicted once the cache is full. It is safe to share
+    between threads.
+    """
+
+    _capacity: int
+    _vectors: "OrderedDict[str, np.ndarray]"
+    _hits: int
+    _misses: int
+    _evictions: int
+
+    def __init__(self, capacity: int = 1024) -> None:
+        """
+        Args:
+            capacity (int, optional): The maximum number of cached prompts. Defaults to 1024.
+        """
+        self._capacity = capacity
+        self._vectors = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(prompt: str) -> str:
+        """
+        Args:
+            prompt (str): The user's prompt.
+
+        Returns:
+            str: The prompt with surrounding whitespace removed and inner whitespace collapsed.
+        """
+        return " ".join(prompt.split())
+
+    def embed_many(self, embedder: Embedder, prompts: List[str]) -> np.ndarray:
+        """
+        Embed a batch of prompts, only running the embedder on prompts that are not cached.
+
+        Args:
+            embedder (Embedder): The embedder used for prompts missing from the cache.
+            prompts (List[str]): The prompts to be embedded.
+
+        Returns:
+            np.ndarray: A matrix with one row per prompt.
+        """
+        keys = [self.normalize(prompt) for prompt in prompts]
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._vectors:
+                    self._vectors.move_to_end(key)
+                    vectors[key] = self._vectors[key]
+            self._hits += sum(key in vectors for key in keys)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            vectors.update(zip(missing, embedder.embed_many(missing)))
+            with self._lock:
+                self._misses += len(missing)
+                for key in missing:
+                    self._vectors[key] = vectors[key]
+                    self._vectors.move_to_end(key)
+                while len(self._vectors) > self._capacity:
+                    self._vectors.popitem(last=False)
+                    self._evictions += 1
+
+        return np.stack([vectors[key] for key in keys])
+
+    def clear(self) -> None:
+        """
+        Remove every cached prompt. The counters are kept.
+        """
+        with self._lock:
+            self._vectors.clear()
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    @property
+    def capacity(self) -> int:
+        """
+        Returns:
+            int: The maximum number of cached prompts.
+        """
+        return self._capacity
+
+    @property
+    def hits(self) -> int:
+        """
+        Returns:
+            int: The number of prompts served from the cache.
+        """
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """
+        Returns:
+            int: The number of prompts that had to be embedded.
+        """
+        return self._misses
+
+    @property
+    def evictions(self) -> int:
+        """
+        Returns:
+            int: The number of prompts evicted to stay within capacity.
+        """
+        return self._evictions
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Returns:
+            float: The share of prompts served from the cache.
+        """
+        total = self._hits + self._misses
+        return self._hits / total if total else 0.0
+
+
+__all__ = [
+    "BuildStats",
+    "Embedder",
+    "SpacyEmbedder",
+    "HashingEmbedder",
+    "EmbeddingCache",
+    "QueryCache",
+]
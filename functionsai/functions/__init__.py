@@ -1,15 +1,38 @@
 """
 """
+import json
 import numpy as np
 import inspect
 from typing import Callable, List
 
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    tuple: "array",
+    dict: "object",
+}
+
+
+def _json_type(type: type) -> str:
+    """
+    Name a parameter type in a JSON schema. Types without a JSON equivalent
+    are named after the Python type.
+    """
+    if type in _JSON_TYPES:
+        return _JSON_TYPES[type]
+    return getattr(type, "__name__", str(type))
+
 
 class Parameter:
     """
     The Parameter class maps a parameter to a name, description, type, and whether it is required.
     """
 
+    __slots__ = ("_name", "_description", "_type", "_is_required")
+
     def __init__(
         self, name: str, description: str, type: type, is_required: bool
     ) -> None:
@@ -38,17 +61,38 @@ class Parameter:
 class Function:
     """
     The Function class maps a function to a name, description, and related prompt.
+
+    Its parameters are only parsed from the signature and docstring the first
+    time they are needed. FunctionsAI keeps the vectors of registered
+    functions in its index, so the vector attributes are only set by callers
+    building a FunctionIndex themselves.
     """
 
+    __slots__ = (
+        "_name",
+        "_description",
+        "_function",
+        "_prompts",
+        "_params",
+        "_name_vector",
+        "_description_vector",
+        "_prompts_vector",
+        "_schema",
+        "_schema_json",
+    )
+
     _name: str
     _description: str
     _function: Callable
-    _prompts: List[str] = []
-    _params: List[Parameter] = []
+    _prompts: List[str]
+    _params: List[Parameter]
+
+    _name_vector: np.ndarray
+    _description_vector: np.ndarray
+    _prompts_vector: np.ndarray
 
-    _name_vector: np.ndarray = None
-    _description_vector: np.ndarray = None
-    _prompts_vector: np.ndarray = None
+    _schema: dict
+    _schema_json: bytes
 
     def __init__(self, function: Callable, prompts: List[str] = None) -> None:
         """
@@ -60,16 +104,30 @@ class Function:
         self._description = function.__doc__
         self._function = function
         self._prompts = prompts
+        self._params = None
+        self._name_vector = None
+        self._description_vector = None
+        self._prompts_vector = None
+        self._schema = None
+        self._schema_json = None
+
+    def _parse_params(self) -> List[Parameter]:
+        """
+        Parse the parameters of the function from its signature, and their
+        descriptions from its docstring.
 
+        Returns:
+            List[Parameter]: A list of parameters for the function.
+        """
         param_descriptions = {}
-        if function.__doc__ is not None:
-            for line in function.__doc__.split("\n"):
+        if self._function.__doc__ is not None:
+            for line in self._function.__doc__.split("\n"):
                 if ":" in line:
                     param = line.split()[0].strip()
                     description = line.split(":")[1].strip()
                     param_descriptions[param] = description
 
-        self._params = [
+        return [
             Parameter(
                 name=param.name,
                 description=param_descriptions.get(param.name, None),
@@ -78,7 +136,7 @@ class Function:
                 else None,
                 is_required=param.default == inspect.Parameter.empty,
             )
-            for param in inspect.signature(function).parameters.values()
+            for param in inspect.signature(self._function).parameters.values()
             if param.name != "self"
         ]
 
@@ -152,10 +210,50 @@ class Function:
     def params(self) -> List[Parameter]:
         """
         Returns:
-            List[Parameter]: A list of parameters for the function.
+            List[Parameter]: A list of parameters for the function, parsed on first access.
         """
+        if self._params is None:
+            self._params = self._parse_params()
         return self._params
 
+    @property
+    def schema(self) -> dict:
+        """
+        Returns:
+            dict: The OpenAI-style tool schema of the function, built once and shared, so it should not be modified.
+        """
+        if self._schema is None:
+            self._schema = {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        param.name: {
+                            "type": param.type,
+                            "description": param.description,
+                        }
+                        for param in self.params
+                    },
+                    "required": [
+                        param.name for param in self.params if param.is_required
+                    ],
+                },
+            }
+        return self._schema
+
+    @property
+    def schema_json(self) -> bytes:
+        """
+        Returns:
+            bytes: The schema encoded as compact JSON, ready to be spliced into a request body. Parameter types are named as JSON types where one exists.
+        """
+        if self._schema_json is None:
+            self._schema_json = json.dumps(
+                self.schema, default=_json_type, separators=(",", ":")
+            ).encode()
+        return self._schema_json
+
     @description.setter
     def description(self, description: str) -> None:
         """
@@ -163,6 +261,8 @@ class Function:
             description (str): A description of the function.
         """
         self._description = description
+        self._schema = None
+        self._schema_json = None
 
     @prompts.setter
     def prompts(self, prompts: List[str]) -> None:
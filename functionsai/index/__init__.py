@@ -0,0 +1,943 @@
+"""
+"""
+import copy
+import json
+import hashlib
+import struct
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+from ..functions import Function
+from .ivf import IVFIndex, recall_at_k
+from .names import NameIndex
+from .lexical import BM25Index
+from .storage import Storage, StorageReport, normalize, _reserved
+
+_MAGIC = b"FAIINDEX"
+_ALIGNMENT = 64
+_ARRAYS = (
+    "name_mask",
+    "description_matrix",
+    "description_scales",
+    "description_mask",
+    "prompt_matrix",
+    "prompt_scales",
+    "prompt_owners",
+    "prompt_mask",
+)
+
+
+def _document(function: Function) -> str:
+    """
+    Get the text a function is matched on by the lexical index.
+
+    Returns:
+        str: The description and prompts of the function, or None for removed functions.
+    """
+    if function is None:
+        return None
+    return " ".join([function.description or "", *(function.prompts or [])])
+
+
+def _fingerprint(function: Function) -> str:
+    """
+    Hash the texts the vectors of a function are embedded from.
+
+    Returns:
+        str: The digest of the description and prompts of the function.
+    """
+    texts = json.dumps([function.description, list(function.prompts or [])])
+    return hashlib.blake2b(texts.encode(), digest_size=8).hexdigest()
+
+
+def _aligned(size: int) -> int:
+    return -(-size // _ALIGNMENT) * _ALIGNMENT
+
+
+class FunctionIndex:
+    """
+    The FunctionIndex class holds the vectors of a catalog of functions as
+    contiguous, L2-normalized float32 matrices whose rows are aligned with the
+    positions of the functions, so that cosine similarity against the whole
+    catalog is a single matrix-vector product. The example prompts of every
+    function are flattened into one matrix, and `prompt_owners` gives the
+    position each prompt row belongs to.
+
+    Functions can be added and removed in place. Buffers grow by doubling,
+    removed functions and replaced prompts are tombstoned, and the index is
+    compacted once tombstones make up more than `compaction` of it. The first
+    `prompt_sorted` prompt rows are grouped by position; rows appended after
+    the last compaction may be in any order.
+
+    Vectors are stored as set by `storage`, which may keep them as float16 or
+    int8 and project them on fewer dimensions. The matrices then hold the
+    stored rows, and `storage.similarity` scores queries against them.
+    """
+
+    _functions: List[Function]
+    _positions: Dict[Callable, List[int]]
+    _dim: int
+    _removed: int
+    _compaction: float
+    _storage: Storage
+    _alive: np.ndarray
+    _name_index: NameIndex = None
+    _lexical_index: BM25Index = None
+    _name_mask: np.ndarray
+    _description_matrix: np.ndarray
+    _description_scales: np.ndarray
+    _description_mask: np.ndarray
+    _prompt_matrix: np.ndarray
+    _prompt_scales: np.ndarray
+    _prompt_owners: np.ndarray
+    _prompt_alive: np.ndarray
+    _prompt_mask: np.ndarray
+    _prompt_count: int
+    _prompt_sorted: int
+    _prompt_dead: int
+    _prompt_segments: Tuple[np.ndarray, np.ndarray] = None
+    _ann: IVFIndex = None
+    _description_ann: IVFIndex = None
+    _prompt_ann: IVFIndex = None
+
+    def __init__(
+        self,
+        functions: List[Function] = (),
+        compaction: float = 0.25,
+        description_vectors: List[np.ndarray] = None,
+        prompts_vectors: List[List[np.ndarray]] = None,
+        storage: Storage = None,
+    ) -> None:
+        """
+        Args:
+            functions (List[Function], optional): The functions to be indexed. Defaults to none.
+            compaction (float, optional): The share of tombstoned functions or prompts that triggers a compaction. Defaults to 0.25.
+            description_vectors (List[np.ndarray], optional): The description vector of each function, or None for functions without one. Defaults to the functions' own `description_vector`.
+            prompts_vectors (List[List[np.ndarray]], optional): The prompt vectors of each function, or None for functions without prompts. Defaults to the functions' own `prompts_vector`.
+            storage (Storage, optional): How vectors are stored. A projection is fitted once the index holds at least as many vectors as it has components, and vectors keep every dimension until then. Defaults to float32 with every dimension.
+        """
+        self._functions = []
+        self._positions = {}
+        self._dim = 0
+        self._removed = 0
+        self._compaction = compaction
+        self._storage = storage if storage is not None else Storage()
+        self._alive = np.zeros(0, dtype=bool)
+        self._name_mask = np.zeros(0, dtype=bool)
+        self._description_matrix = np.zeros((0, 0), dtype=np.float32)
+        self._description_scales = np.zeros(0, dtype=np.float32)
+        self._description_mask = np.zeros(0, dtype=bool)
+        self._prompt_matrix = np.zeros((0, 0), dtype=np.float32)
+        self._prompt_scales = np.zeros(0, dtype=np.float32)
+        self._prompt_owners = np.zeros(0, dtype=np.int64)
+        self._prompt_alive = np.zeros(0, dtype=bool)
+        self._prompt_mask = np.zeros(0, dtype=bool)
+        self._prompt_count = 0
+        self._prompt_sorted = 0
+        self._prompt_dead = 0
+        self.add(functions, description_vectors, prompts_vectors)
+
+    def add(
+        self,
+        functions: List[Function],
+        description_vectors: List[np.ndarray] = None,
+        prompts_vectors: List[List[np.ndarray]] = None,
+    ) -> np.ndarray:
+        """
+        Append functions to the index. The vectors are copied into the index's
+        matrices, so they do not need to be kept on the functions.
+
+        Args:
+            functions (List[Function]): The functions to be added.
+            description_vectors (List[np.ndarray], optional): The description vector of each function, or None for functions without one. Defaults to the functions' own `description_vector`.
+            prompts_vectors (List[List[np.ndarray]], optional): The prompt vectors of each function, or None for functions without prompts. Defaults to the functions' own `prompts_vector`.
+
+        Returns:
+            np.ndarray: The positions of the added functions.
+        """
+        functions = list(functions)
+        if description_vectors is None:
+            description_vectors = [f.description_vector for f in functions]
+        if prompts_vectors is None:
+            prompts_vectors = [f.prompts_vector for f in functions]
+        start = len(self._functions)
+        end = start + len(functions)
+        positions = np.arange(start, end)
+        if not functions:
+            return positions
+
+        description_mask = np.array(
+            [vector is not None for vector in description_vectors], dtype=bool
+        )
+        description_vectors = [
+            vector for vector in description_vectors if vector is not None
+        ]
+        prompts_vectors = [
+            vectors if vectors is not None else []
+            for vectors in prompts_vectors
+        ]
+        prompt_counts = np.array(
+            [len(vectors) for vectors in prompts_vectors], dtype=np.int64
+        )
+        prompt_vectors = [
+            vector for vectors in prompts_vectors for vector in vectors
+        ]
+        vectors = description_vectors or prompt_vectors
+        if vectors:
+            self._set_dim(len(vectors[0]))
+            self._fit_storage(description_vectors + prompt_vectors)
+
+        self._reserve(end)
+        self._functions.extend(functions)
+        for position, function in zip(range(start, end), functions):
+            self._positions[function.function] = [
+                *self._positions.get(function.function, ()),
+                position,
+            ]
+        self._alive[start:end] = True
+        self._name_mask[start:end] = [
+            function.name is not None for function in functions
+        ]
+        self._description_mask[start:end] = description_mask
+        self._description_matrix[start:end] = 0
+        self._description_scales[start:end] = 0
+        if description_vectors:
+            rows, scales = self._storage.encode(description_vectors)
+            self._description_matrix[positions[description_mask]] = rows
+            self._description_scales[positions[description_mask]] = scales
+            self._ann_add(
+                "_description_ann",
+                self._storage.decode(rows, scales),
+                positions[description_mask],
+            )
+        self._prompt_mask[start:end] = prompt_counts > 0
+        if prompt_vectors:
+            self._append_prompts(
+                np.repeat(positions, prompt_counts), prompt_vectors
+            )
+        if self._name_index is not None:
+            self._name_index.add([function.name for function in functions])
+        if self._lexical_index is not None:
+            self._lexical_index.add(
+                [_document(function) for function in functions]
+            )
+        return positions
+
+    def remove(self, positions: List[int]) -> None:
+        """
+        Tombstone functions. Their positions hold None and score zero until the
+        next compaction reclaims them.
+
+        Args:
+            positions (List[int]): The positions of the functions to be removed.
+        """
+        positions = [
+            position
+            for position in dict.fromkeys(positions)
+            if self._alive[position]
+        ]
+        if not positions:
+            return
+
+        self._reserve(len(self._functions))
+        for position in positions:
+            function = self._functions[position]
+            remaining = [
+                other
+                for other in self._positions[function.function]
+                if other != position
+            ]
+            if remaining:
+                self._positions[function.function] = remaining
+            else:
+                del self._positions[function.function]
+            self._functions[position] = None
+            self._kill_prompts(position)
+        self._alive[positions] = False
+        self._name_mask[positions] = False
+        self._description_mask[positions] = False
+        self._prompt_mask[positions] = False
+        self._removed += len(positions)
+        if self._name_index is not None:
+            self._name_index.remove(positions)
+        if self._lexical_index is not None:
+            self._lexical_index.remove(positions)
+        self._maybe_compact()
+
+    def update_prompts(self, positions: List[int], vectors: np.ndarray) -> None:
+        """
+        Replace the prompt vectors of functions. The old rows are tombstoned
+        and the new ones appended, and the lexical index re-reads the functions
+        at these positions, which should already hold their new prompts.
+
+        Args:
+            positions (List[int]): The positions of the functions.
+            vectors (np.ndarray): The new prompt vectors, one per row, or None to remove every prompt.
+        """
+        vectors = [] if vectors is None else list(vectors)
+        self._reserve(len(self._functions))
+        for position in positions:
+            self._kill_prompts(position)
+        if vectors:
+            self._set_dim(len(vectors[0]))
+            self._fit_storage(vectors)
+            for position in sorted(positions):
+                self._append_prompts(np.full(len(vectors), position), vectors)
+        self._prompt_mask[positions] = len(vectors) > 0
+        if self._lexical_index is not None:
+            self._lexical_index.update(
+                positions,
+                [
+                    _document(self._functions[position])
+                    for position in positions
+                ],
+            )
+        self._maybe_compact()
+
+    def compact(self) -> np.ndarray:
+        """
+        Drop tombstoned functions and prompts, and group every prompt row by
+        position. The remaining functions keep their relative order.
+
+        Returns:
+            np.ndarray: The new position of each old position, or -1 for removed functions.
+        """
+        size = len(self._functions)
+        keep = np.flatnonzero(self._alive[:size])
+        mapping = np.full(size, -1, dtype=np.int64)
+        mapping[keep] = np.arange(len(keep))
+
+        self._functions = [self._functions[position] for position in keep]
+        self._positions = {}
+        for position, function in enumerate(self._functions):
+            self._positions.setdefault(function.function, []).append(position)
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._name_mask = self._name_mask[keep]
+        self._description_matrix = self._description_matrix[keep]
+        self._description_scales = self._description_scales[keep]
+        self._description_mask = self._description_mask[keep]
+        self._prompt_mask = self._prompt_mask[keep]
+        self._removed = 0
+        if self._name_index is not None:
+            self._name_index = self._name_index.reindex(mapping)
+        if self._lexical_index is not None:
+            self._lexical_index = self._lexical_index.reindex(mapping)
+        if self._description_ann is not None:
+            self._description_ann = self._description_ann.reindex(mapping)
+
+        count = self._prompt_count
+        live = np.flatnonzero(self._prompt_alive[:count])
+        owners = mapping[self._prompt_owners[live]]
+        order = np.argsort(owners, kind="stable")
+        rows = live[order]
+        self._prompt_matrix = self._prompt_matrix[rows]
+        self._prompt_scales = self._prompt_scales[rows]
+        self._prompt_owners = owners[order]
+        self._prompt_alive = np.ones(len(rows), dtype=bool)
+        self._prompt_count = self._prompt_sorted = len(rows)
+        self._prompt_dead = 0
+        self._prompt_segments = None
+        if self._prompt_ann is not None:
+            row_mapping = np.full(count, -1, dtype=np.int64)
+            row_mapping[rows] = np.arange(len(rows))
+            self._prompt_ann = self._prompt_ann.reindex(row_mapping)
+        return mapping
+
+    def copy(self) -> "FunctionIndex":
+        """
+        Copy the index so that it can be modified while readers keep using this
+        one. Rows are only ever written past the end of the indexes sharing a
+        vector buffer, so the vector buffers are shared. The masks are copied,
+        the function list and the registry are copied shallowly, since their
+        entries are replaced rather than modified, and the name and lexical
+        indexes copy their posting lists only once they modify them.
+
+        Returns:
+            FunctionIndex: The copy.
+        """
+        index = copy.copy(self)
+        index._functions = list(self._functions)
+        index._positions = dict(self._positions)
+        for name in (
+            "_alive",
+            "_name_mask",
+            "_description_mask",
+            "_prompt_mask",
+            "_prompt_alive",
+        ):
+            setattr(index, name, np.array(getattr(self, name)))
+        if self._name_index is not None:
+            index._name_index = self._name_index.copy()
+        if self._lexical_index is not None:
+            index._lexical_index = self._lexical_index.copy()
+        return index
+
+    def subset(self, positions: np.ndarray) -> "FunctionIndex":
+        """
+        Build a small index over some of the functions, so that a candidate set
+        can be scored without scanning the whole catalog. Position i of the
+        subset is `positions[i]` of this index. Only the prompt owners are
+        scanned, and ANN indexes are not carried over.
+
+        Args:
+            positions (np.ndarray): The positions of the functions to keep.
+
+        Returns:
+            FunctionIndex: The index of the selected functions.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        mapping = np.full(len(self), -1, dtype=np.int64)
+        mapping[positions] = np.arange(len(positions))
+        owners = mapping[self.prompt_owners]
+        rows = np.flatnonzero((owners >= 0) & self.prompt_alive)
+        rows = rows[np.argsort(owners[rows], kind="stable")]
+
+        index = FunctionIndex()
+        index._functions = [self._functions[position] for position in positions]
+        index._dim = self._dim
+        index._alive = self.alive[positions]
+        index._name_mask = self.name_mask[positions]
+        index._storage = self._storage
+        index._description_matrix = self.description_matrix[positions]
+        index._description_scales = self.description_scales[positions]
+        index._description_mask = self.description_mask[positions]
+        index._prompt_matrix = self.prompt_matrix[rows]
+        index._prompt_scales = self.prompt_scales[rows]
+        index._prompt_owners = owners[rows]
+        index._prompt_alive = np.ones(len(rows), dtype=bool)
+        index._prompt_mask = self.prompt_mask[positions]
+        index._prompt_count = index._prompt_sorted = len(rows)
+        return index
+
+    def quantize(self, storage: Storage) -> "FunctionIndex":
+        """
+        Store the vectors of a compacted copy of the index as set by another
+        Storage, fitting its projection on them. The index must keep every
+        dimension of its vectors.
+
+        Args:
+            storage (Storage): How the copy stores its vectors.
+
+        Returns:
+            FunctionIndex: The copy.
+        """
+        if self._storage.projection is not None:
+            raise ValueError("Cannot quantize a projected index")
+        index = self.copy()
+        index.compact()
+        descriptions = self._storage.decode(
+            index.description_matrix, index.description_scales
+        )
+        prompts = self._storage.decode(index.prompt_matrix, index.prompt_scales)
+        index._storage = storage.fit(
+            np.concatenate((descriptions[index.description_mask], prompts))
+        )
+        (
+            index._description_matrix,
+            index._description_scales,
+        ) = index._storage.encode(descriptions)
+        index._description_scales[~index.description_mask] = 0
+        index._prompt_matrix, index._prompt_scales = index._storage.encode(
+            prompts
+        )
+        if index._ann is not None:
+            index.build_ann(index._ann)
+        return index
+
+    def positions(self, function: Callable) -> List[int]:
+        """
+        Args:
+            function (Callable): A registered function.
+
+        Returns:
+            List[int]: The positions the function is registered at.
+        """
+        return list(self._positions.get(function, ()))
+
+    def build_ann(self, ann: IVFIndex) -> None:
+        """
+        Fit approximate nearest-neighbour indexes over the description and prompt
+        vectors. Once built, the description and prompt scorers only score the
+        vectors the ANN index retrieves, and every other function scores zero.
+        Functions and prompts added later are inserted into the fitted clusters.
+
+        Args:
+            ann (IVFIndex): The unfitted ANN index whose settings are used, or None to go back to exact scoring.
+        """
+        self._ann = ann
+        self._description_ann = None
+        self._prompt_ann = None
+        if ann is None:
+            return
+        if self.description_mask.any():
+            positions = np.flatnonzero(self.description_mask)
+            self._description_ann = ann.fit(
+                self._storage.decode(
+                    self.description_matrix[positions],
+                    self.description_scales[positions],
+                ),
+                positions,
+            )
+        alive = np.flatnonzero(self.prompt_alive)
+        if len(alive):
+            self._prompt_ann = ann.fit(
+                self._storage.decode(
+                    self.prompt_matrix[alive], self.prompt_scales[alive]
+                ),
+                alive,
+            )
+
+    def save(self, path: str) -> None:
+        """
+        Write a compacted copy of the index to a single file that can be
+        memory-mapped by `load`. The file starts with a JSON header describing
+        each array, followed by the raw arrays aligned to 64 bytes.
+
+        Args:
+            path (str): The file to write.
+        """
+        index = self.copy()
+        index.compact()
+        names = list(_ARRAYS)
+        arrays = [np.ascontiguousarray(getattr(index, name)) for name in names]
+        if index.storage.projection is not None:
+            names.append("projection")
+            arrays.append(index.storage.projection)
+        layout = {}
+        offset = 0
+        for name, array in zip(names, arrays):
+            layout[name] = {
+                "dtype": array.dtype.str,
+                "shape": array.shape,
+                "offset": offset,
+            }
+            offset += _aligned(array.nbytes)
+        header = json.dumps(
+            {
+                "names": [function.name for function in index.functions],
+                "texts": [
+                    _fingerprint(function) for function in index.functions
+                ],
+                "storage": {
+                    "dtype": index.storage.dtype.name,
+                    "dimensions": index.storage.dimensions,
+                },
+                "arrays": layout,
+            }
+        ).encode()
+
+        with open(path, "wb") as file:
+            file.write(_MAGIC)
+            file.write(struct.pack("<Q", len(header)))
+            file.write(header)
+            start = _aligned(file.tell())
+            for name, array in zip(names, arrays):
+                file.seek(start + layout[name]["offset"])
+                file.write(array.tobytes())
+            file.truncate(start + offset)
+
+    @classmethod
+    def load(cls, path: str, functions: List[Function]) -> "FunctionIndex":
+        """
+        Open an index written by `save` without copying it into memory. Every
+        array is a read-only `np.memmap`, so processes that load the same file
+        share its physical pages. The arrays are copied the first time the
+        index is modified.
+
+        Args:
+            path (str): The file to open.
+            functions (List[Function]): The functions the index was built from, in the same order. Their names, descriptions and prompts must match the ones saved.
+
+        Returns:
+            FunctionIndex: The memory-mapped index.
+        """
+        with open(path, "rb") as file:
+            if file.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a FunctionsAI index")
+            (length,) = struct.unpack("<Q", file.read(8))
+            header = json.loads(file.read(length))
+            start = _aligned(file.tell())
+
+        if header["names"] != [function.name for function in functions]:
+            raise ValueError(
+                f"{path} was built from a different catalog of functions"
+            )
+        # Files written before texts were hashed are only checked by name
+        if "texts" in header and header["texts"] != [
+            _fingerprint(function) for function in functions
+        ]:
+            raise ValueError(
+                f"{path} was built from functions with other texts"
+            )
+
+        index = cls()
+        arrays = {}
+        for name in header["arrays"]:
+            layout = header["arrays"][name]
+            shape = tuple(layout["shape"])
+            if np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=layout["dtype"])
+            else:
+                arrays[name] = np.memmap(
+                    path,
+                    dtype=layout["dtype"],
+                    mode="r",
+                    offset=start + layout["offset"],
+                    shape=shape,
+                )
+
+        # Files written before vectors could be quantized hold float32 rows
+        for name, matrix in (
+            ("description_scales", "description_matrix"),
+            ("prompt_scales", "prompt_matrix"),
+        ):
+            if name not in arrays:
+                arrays[name] = np.ones(len(arrays[matrix]), dtype=np.float32)
+        for name in _ARRAYS:
+            setattr(index, f"_{name}", arrays[name])
+        index._storage = Storage(
+            **header.get("storage", {}), projection=arrays.get("projection")
+        )
+
+        index._functions = list(functions)
+        for position, function in enumerate(index._functions):
+            index._positions.setdefault(function.function, []).append(position)
+        index._dim = arrays["description_matrix"].shape[1]
+        if index._storage.projection is not None:
+            index._dim = index._storage.projection.shape[0]
+        index._alive = np.ones(len(functions), dtype=bool)
+        index._prompt_alive = np.ones(len(arrays["prompt_owners"]), dtype=bool)
+        index._prompt_count = index._prompt_sorted = len(index._prompt_alive)
+        return index
+
+    def _set_dim(self, dim: int) -> None:
+        if self._dim == dim:
+            return
+        if self._dim != 0:
+            raise ValueError(
+                f"Expected vectors with {self._dim} dimensions, got {dim}"
+            )
+        self._dim = dim
+        width = self._storage.width(dim)
+        self._description_matrix = np.zeros(
+            (len(self._description_matrix), width), dtype=self._storage.dtype
+        )
+        self._prompt_matrix = np.zeros(
+            (len(self._prompt_matrix), width), dtype=self._storage.dtype
+        )
+
+    def _fit_storage(self, vectors: List[np.ndarray]) -> None:
+        """
+        Fit the projection of the storage once the index and the vectors being
+        added hold enough vectors, and re-encode the rows stored until then
+        with every dimension. A projection fitted on fewer vectors than it has
+        components would leave most of them empty.
+        """
+        if self._storage.fitted:
+            return
+        size, count = len(self._functions), self._prompt_count
+        stored = int(self.description_mask.sum()) + int(self.prompt_alive.sum())
+        if stored + len(vectors) < min(self._storage.dimensions, self._dim):
+            return
+        descriptions = self._storage.decode(
+            self._description_matrix[:size], self._description_scales[:size]
+        )
+        prompts = self._storage.decode(
+            self._prompt_matrix[:count], self._prompt_scales[:count]
+        )
+        self._storage = self._storage.fit(
+            np.concatenate(
+                (
+                    descriptions[self.description_mask],
+                    prompts[self.prompt_alive],
+                    normalize(vectors),
+                )
+            )
+        )
+        (
+            self._description_matrix,
+            self._description_scales,
+        ) = self._storage.encode(descriptions)
+        self._description_scales[~self.description_mask] = 0
+        self._prompt_matrix, self._prompt_scales = self._storage.encode(prompts)
+        if self._ann is not None:
+            self.build_ann(self._ann)
+
+    def _reserve(self, capacity: int) -> None:
+        size = len(self._functions)
+        for name in (
+            "_alive",
+            "_name_mask",
+            "_description_matrix",
+            "_description_scales",
+            "_description_mask",
+            "_prompt_mask",
+        ):
+            setattr(self, name, _reserved(getattr(self, name), size, capacity))
+
+    def _append_prompts(
+        self, owners: np.ndarray, vectors: List[np.ndarray]
+    ) -> None:
+        rows, scales = self._storage.encode(vectors)
+        count = self._prompt_count
+        end = count + len(rows)
+        for name in (
+            "_prompt_matrix",
+            "_prompt_scales",
+            "_prompt_owners",
+            "_prompt_alive",
+        ):
+            setattr(self, name, _reserved(getattr(self, name), count, end))
+        self._prompt_matrix[count:end] = rows
+        self._prompt_scales[count:end] = scales
+        self._prompt_owners[count:end] = owners
+        self._prompt_alive[count:end] = True
+
+        # Rows appended in position order after a grouped region stay grouped
+        grouped = self._prompt_sorted == count and np.all(np.diff(owners) >= 0)
+        if grouped and count > 0:
+            grouped = owners[0] >= self._prompt_owners[count - 1]
+        if grouped:
+            self._prompt_sorted = end
+        self._prompt_count = end
+        self._prompt_segments = None
+        self._ann_add(
+            "_prompt_ann",
+            self._storage.decode(rows, scales),
+            np.arange(count, end),
+        )
+
+    def _kill_prompts(self, position: int) -> None:
+        grouped = self._prompt_owners[: self._prompt_sorted]
+        low, high = np.searchsorted(grouped, [position, position + 1])
+        tail = self._prompt_owners[self._prompt_sorted : self._prompt_count]
+        rows = np.concatenate(
+            (
+                np.arange(low, high),
+                self._prompt_sorted + np.flatnonzero(tail == position),
+            )
+        )
+        rows = rows[self._prompt_alive[rows]]
+        if len(rows):
+            self._prompt_alive = _reserved(
+                self._prompt_alive, self._prompt_count, self._prompt_count
+            )
+            self._prompt_alive[rows] = False
+            self._prompt_dead += len(rows)
+
+    def _ann_add(self, name: str, rows: np.ndarray, ids: np.ndarray) -> None:
+        if self._ann is None:
+            return
+        ann = getattr(self, name)
+        if ann is None:
+            setattr(self, name, self._ann.fit(rows, ids))
+        else:
+            setattr(self, name, ann.add(rows, ids))
+
+    def _maybe_compact(self) -> None:
+        size = len(self._functions)
+        unsorted = self._prompt_count - self._prompt_sorted
+        if (
+            self._removed > self._compaction * size
+            or self._prompt_dead + unsorted
+            > self._compaction * self._prompt_count
+        ):
+            self.compact()
+
+    def __len__(self) -> int:
+        return len(self._functions)
+
+    @property
+    def functions(self) -> List[Function]:
+        """
+        Returns:
+            List[Function]: The indexed functions, by position. Removed functions are None.
+        """
+        return self._functions
+
+    @property
+    def alive(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Whether each position holds a function that has not been removed.
+        """
+        return self._alive[: len(self._functions)]
+
+    @property
+    def storage(self) -> Storage:
+        """
+        Returns:
+            Storage: How the vectors are stored.
+        """
+        return self._storage
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns:
+            int: The number of bytes taken by the stored description and prompt vectors and their scales.
+        """
+        return sum(
+            array.nbytes
+            for array in (
+                self.description_matrix,
+                self.description_scales,
+                self.prompt_matrix,
+                self.prompt_scales,
+            )
+        )
+
+    @property
+    def dim(self) -> int:
+        """
+        Returns:
+            int: The number of dimensions of the indexed vectors.
+        """
+        return self._dim
+
+    @property
+    def name_index(self) -> NameIndex:
+        """
+        Returns:
+            NameIndex: The n-gram index of the function names, built on first use.
+        """
+        if self._name_index is None:
+            self._name_index = NameIndex(
+                [
+                    function.name if function is not None else None
+                    for function in self._functions
+                ]
+            )
+        return self._name_index
+
+    @property
+    def lexical_index(self) -> BM25Index:
+        """
+        Returns:
+            BM25Index: The BM25 index of the function descriptions and prompts, built on first use.
+        """
+        if self._lexical_index is None:
+            self._lexical_index = BM25Index(
+                [_document(function) for function in self._functions]
+            )
+        return self._lexical_index
+
+    @property
+    def name_mask(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Whether each function has a name.
+        """
+        return self._name_mask[: len(self._functions)]
+
+    @property
+    def description_matrix(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The normalized description vectors, one row per function.
+            Rows of functions without a description are zero.
+        """
+        return self._description_matrix[: len(self._functions)]
+
+    @property
+    def description_scales(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The scale of each description row, which is one unless the storage is int8.
+        """
+        return self._description_scales[: len(self._functions)]
+
+    @property
+    def description_mask(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Whether each function has a description vector.
+        """
+        return self._description_mask[: len(self._functions)]
+
+    @property
+    def prompt_matrix(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The normalized prompt vectors of every function.
+        """
+        return self._prompt_matrix[: self._prompt_count]
+
+    @property
+    def prompt_scales(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The scale of each prompt row, which is one unless the storage is int8.
+        """
+        return self._prompt_scales[: self._prompt_count]
+
+    @property
+    def prompt_owners(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The position of the function each prompt row belongs to.
+        """
+        return self._prompt_owners[: self._prompt_count]
+
+    @property
+    def prompt_alive(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Whether each prompt row is current rather than tombstoned.
+        """
+        return self._prompt_alive[: self._prompt_count]
+
+    @property
+    def prompt_sorted(self) -> int:
+        """
+        Returns:
+            int: The number of leading prompt rows that are grouped by position.
+        """
+        return self._prompt_sorted
+
+    @property
+    def prompt_segments(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The first row of each group of the grouped prompt rows, and the position it belongs to.
+        """
+        if self._prompt_segments is None:
+            owners = self._prompt_owners[: self._prompt_sorted]
+            starts = np.flatnonzero(np.diff(owners, prepend=-1) != 0)
+            self._prompt_segments = (starts, owners[starts])
+        return self._prompt_segments
+
+    @property
+    def prompt_mask(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: Whether each function has at least one prompt vector.
+        """
+        return self._prompt_mask[: len(self._functions)]
+
+    @property
+    def description_ann(self) -> IVFIndex:
+        """
+        Returns:
+            IVFIndex: The ANN index over the description vectors, if built.
+        """
+        return self._description_ann
+
+    @property
+    def prompt_ann(self) -> IVFIndex:
+        """
+        Returns:
+            IVFIndex: The ANN index over the prompt vectors, if built.
+        """
+        return self._prompt_ann
+
+
+__all__ = [
+    "BM25Index",
+    "FunctionIndex",
+    "IVFIndex",
+    "NameIndex",
+    "normalize",
+    "recall_at_k",
+    "Storage",
+    "StorageReport",
+]
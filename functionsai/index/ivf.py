@@ -0,0 +1,234 @@
+import copy
+import numpy as np
+from typing import List, Tuple
+from .storage import _reserved
+
+
+def recall_at_k(exact: np.ndarray, approximate: np.ndarray, k: int) -> float:
+    """
+    Measure how many of the exact top-k results an approximate search found.
+
+    Args:
+        exact (np.ndarray): The exact scores, one row per query.
+        approximate (np.ndarray): The approximate scores, one row per query.
+        k (int): The number of results compared per query.
+
+    Returns:
+        float: The mean share of the exact top-k found in the approximate top-k.
+    """
+    from ..scoring import top_k
+
+    found = [
+        len(np.intersect1d(top_k(e, k), top_k(a, k))) / min(k, len(e))
+        for e, a in zip(exact, approximate)
+    ]
+    return float(np.mean(found)) if found else 1.0
+
+
+class IVFIndex:
+    """
+    The IVFIndex class is an inverted-file approximate nearest-neighbour index
+    over normalized vectors. Vectors are partitioned into `n_lists` clusters
+    by spherical k-means, and a query only scans the vectors of its `n_probe`
+    closest clusters. Raising `n_probe` trades speed for recall.
+
+    An IVFIndex is created unfitted, holding only its settings, and `fit`
+    returns a fitted copy for a given set of vectors.
+
+    Each cluster keeps its vectors and ids in its own buffers, which grow by
+    doubling so that `add` is amortized. Copies returned by `add` share these
+    buffers and only write past the end of the index they were made from.
+    """
+
+    _n_lists: int
+    _n_probe: int
+    _n_iter: int
+    _seed: int
+    _centroids: np.ndarray = None
+    _vectors: List[np.ndarray] = None
+    _ids: List[np.ndarray] = None
+    _sizes: np.ndarray = None
+
+    def __init__(
+        self,
+        n_lists: int = None,
+        n_probe: int = 8,
+        n_iter: int = 10,
+        seed: int = 0,
+    ) -> None:
+        """
+        Args:
+            n_lists (int, optional): The number of clusters. Defaults to the square root of the number of vectors.
+            n_probe (int, optional): The number of clusters scanned per query. Defaults to 8.
+            n_iter (int, optional): The number of k-means iterations. Defaults to 10.
+            seed (int, optional): The seed of the k-means initialization. Defaults to 0.
+        """
+        self._n_lists = n_lists
+        self._n_probe = n_probe
+        self._n_iter = n_iter
+        self._seed = seed
+
+    def fit(self, vectors: np.ndarray, ids: np.ndarray = None) -> "IVFIndex":
+        """
+        Cluster a set of vectors.
+
+        Args:
+            vectors (np.ndarray): The normalized vectors to be indexed, one per row.
+            ids (np.ndarray, optional): The id returned for each vector. Defaults to the row numbers.
+
+        Returns:
+            IVFIndex: A fitted copy of this index.
+        """
+        fitted = copy.copy(self)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.arange(len(vectors)) if ids is None else np.asarray(ids)
+        n_lists = self._n_lists or int(np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        rng = np.random.default_rng(self._seed)
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+        sample = vectors
+        if len(vectors) > 256 * n_lists:
+            sample = vectors[rng.choice(len(vectors), 256 * n_lists, False)]
+
+        for _ in range(self._n_iter):
+            assignments = _assign(sample, centroids)
+            counts = np.bincount(assignments, minlength=n_lists)
+            order = np.argsort(assignments, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            filled = counts > 0
+            sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+            centroids = centroids.copy()
+            centroids[filled] = sums
+            empty = np.flatnonzero(~filled)
+            centroids[empty] = sample[rng.choice(len(sample), len(empty))]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            np.divide(centroids, norms, out=centroids, where=norms > 0)
+
+        assignments = _assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        fitted._centroids = centroids
+        fitted._sizes = np.bincount(assignments, minlength=n_lists)
+        splits = np.cumsum(fitted._sizes)[:-1]
+        fitted._vectors = np.split(vectors[order], splits)
+        fitted._ids = np.split(ids[order], splits)
+        return fitted
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> "IVFIndex":
+        """
+        Insert vectors into their closest clusters without re-clustering.
+
+        Args:
+            vectors (np.ndarray): The normalized vectors to be inserted, one per row.
+            ids (np.ndarray): The id returned for each vector.
+
+        Returns:
+            IVFIndex: A copy of this index holding the new vectors.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids)
+        assignments = _assign(vectors, self._centroids)
+        updated = copy.copy(self)
+        updated._vectors = list(self._vectors)
+        updated._ids = list(self._ids)
+        updated._sizes = self._sizes.copy()
+        order = np.argsort(assignments, kind="stable")
+        clusters, starts = np.unique(assignments[order], return_index=True)
+        for cluster, rows in zip(clusters, np.split(order, starts[1:])):
+            start = self._sizes[cluster]
+            end = start + len(rows)
+            updated._vectors[cluster] = _reserved(
+                self._vectors[cluster], start, end
+            )
+            updated._ids[cluster] = _reserved(self._ids[cluster], start, end)
+            updated._vectors[cluster][start:end] = vectors[rows]
+            updated._ids[cluster][start:end] = ids[rows]
+            updated._sizes[cluster] = end
+        return updated
+
+    def reindex(self, mapping: np.ndarray) -> "IVFIndex":
+        """
+        Renumber the ids of the index, dropping those mapped to -1.
+
+        Args:
+            mapping (np.ndarray): The new id of each old id, or -1 to drop it.
+
+        Returns:
+            IVFIndex: A copy of this index with the new ids.
+        """
+        updated = copy.copy(self)
+        updated._vectors = []
+        updated._ids = []
+        for vectors, ids, size in zip(self._vectors, self._ids, self._sizes):
+            ids = mapping[ids[:size]]
+            keep = ids >= 0
+            updated._vectors.append(vectors[:size][keep])
+            updated._ids.append(ids[keep])
+        updated._sizes = np.array([len(ids) for ids in updated._ids])
+        return updated
+
+    def search(
+        self, queries: np.ndarray
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score a batch of queries against the vectors of their closest clusters.
+
+        Args:
+            queries (np.ndarray): The normalized query vectors, one per row.
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: For each query, the ids of the scanned vectors and their cosine similarities.
+        """
+        n_probe = min(self._n_probe, len(self._centroids))
+        centroid_scores = queries @ self._centroids.T
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)
+        results = []
+        for query, lists in zip(queries, probes[:, :n_probe]):
+            sizes = self._sizes[lists]
+            ids = np.concatenate(
+                [self._ids[c][:size] for c, size in zip(lists, sizes)]
+            )
+            vectors = np.concatenate(
+                [self._vectors[c][:size] for c, size in zip(lists, sizes)]
+            )
+            results.append((ids, vectors @ query))
+        return results
+
+    @property
+    def n_lists(self) -> int:
+        """
+        Returns:
+            int: The number of clusters, once fitted.
+        """
+        if self._centroids is not None:
+            return len(self._centroids)
+        return self._n_lists
+
+    @property
+    def n_probe(self) -> int:
+        """
+        Returns:
+            int: The number of clusters scanned per query.
+        """
+        return self._n_probe
+
+    @n_probe.setter
+    def n_probe(self, n_probe: int) -> None:
+        """
+        Args:
+            n_probe (int): The number of clusters scanned per query.
+        """
+        self._n_probe = n_probe
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), 8192):
+        chunk = vectors[start : start + 8192]
+        assignments[start : start + 8192] = np.argmax(
+            chunk @ centroids.T, axis=1
+        )
+    return assignments
+
+
+__all__ = ["IVFIndex", "recall_at_k"]
@@ -0,0 +1,317 @@
+import re
+import math
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+from .postings import _SUBTOKEN, _append
+from .storage import _reserved
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase terms. Identifiers such as `get_weather` or
+    `getWeather` are kept whole and also split into their sub-tokens.
+
+    Args:
+        text (str): The text to be split.
+
+    Returns:
+        List[str]: The terms of the text, with repetitions.
+    """
+    terms = []
+    for token in _TOKEN.findall(text):
+        subtokens = _SUBTOKEN.findall(token)
+        terms.append(token.lower())
+        if len(subtokens) > 1:
+            terms.extend(subtoken.lower() for subtoken in subtokens)
+    return terms
+
+
+class BM25Index:
+    """
+    The BM25Index class is a sparse inverted index over one document per
+    function position. A query is scored with Okapi BM25 by walking only the
+    posting lists of its terms, so its cost depends on how common its terms
+    are rather than on the size of the catalog.
+
+    Documents are only ever appended: removing a position tombstones its
+    document, and updating it tombstones the old document and appends the new
+    one. Posting lists keep tombstoned documents, which are masked out when a
+    query is scored, and document frequencies and the average length are
+    computed at query time over the live documents only.
+
+    Copies share their posting lists until they append to them, and
+    `_owned` holds the terms whose lists are not shared.
+    """
+
+    _k1: float
+    _b: float
+    _postings: Dict[str, Tuple[List[int], List[int]]]
+    _owned: Set[str]
+    _arrays: Dict[str, Tuple[np.ndarray, np.ndarray]]
+    _documents: np.ndarray
+    _owners: np.ndarray
+    _lengths: np.ndarray
+    _size: int
+    _count: int
+    _live: int
+    _total_length: int
+
+    def __init__(
+        self, documents: List[str], k1: float = 1.2, b: float = 0.75
+    ) -> None:
+        """
+        Args:
+            documents (List[str]): The text of each position. Positions without text hold None.
+            k1 (float, optional): How quickly repeated terms saturate. Defaults to 1.2.
+            b (float, optional): How much scores are normalized by document length. Defaults to 0.75.
+        """
+        self._k1 = k1
+        self._b = b
+        self._postings = {}
+        self._owned = set()
+        self._arrays = {}
+        self._documents = np.zeros(0, dtype=np.int64)
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._size = 0
+        self._count = 0
+        self._live = 0
+        self._total_length = 0
+        self.add(documents)
+
+    def add(self, documents: List[str]) -> None:
+        """
+        Append documents at the next positions.
+
+        Args:
+            documents (List[str]): The text of each new position. Positions without text hold None.
+        """
+        start = self._size
+        self._size += len(documents)
+        self._documents = _reserved(self._documents, start, self._size)
+        self._documents[start : self._size] = -1
+        self._append(range(start, self._size), documents)
+
+    def remove(self, positions: List[int]) -> None:
+        """
+        Stop matching the documents at the given positions.
+
+        Args:
+            positions (List[int]): The positions of the documents to be removed.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        documents = np.unique(self._documents[positions])
+        documents = documents[documents >= 0]
+        self._documents[positions] = -1
+        self._live -= len(documents)
+        self._total_length -= int(self._lengths[documents].sum())
+
+    def update(self, positions: List[int], documents: List[str]) -> None:
+        """
+        Replace the text of some positions.
+
+        Args:
+            positions (List[int]): The positions to be updated.
+            documents (List[str]): The new text of each position, or None to stop matching it.
+        """
+        self.remove(positions)
+        self._append(positions, documents)
+
+    def score(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score the documents sharing at least one term with a query.
+
+        Args:
+            query (str): The user's prompt.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The matching positions and their BM25 scores.
+        """
+        postings = [
+            postings[:2]
+            for postings in map(
+                self._contributions, dict.fromkeys(tokenize(query))
+            )
+            if postings is not None
+        ]
+        if not postings:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        positions, inverse = np.unique(
+            np.concatenate([positions for positions, _ in postings]),
+            return_inverse=True,
+        )
+        scores = np.bincount(
+            inverse,
+            weights=np.concatenate([scores for _, scores in postings]),
+            minlength=len(positions),
+        )
+        return positions, scores.astype(np.float32)
+
+    def score_many(self, queries: List[str]) -> np.ndarray:
+        """
+        Score every position against a batch of queries, normalized by the
+        highest score each query could reach so that scores lie in [0, 1].
+
+        Args:
+            queries (List[str]): The user's prompts.
+
+        Returns:
+            np.ndarray: The normalized scores, one row per query and one column per position.
+        """
+        scores = np.zeros((len(queries), len(self)), dtype=np.float32)
+        for row, query in enumerate(queries):
+            ceiling = 0.0
+            for term in dict.fromkeys(tokenize(query)):
+                postings = self._contributions(term)
+                if postings is None:
+                    continue
+                positions, contributions, idf = postings
+                scores[row, positions] += contributions
+                ceiling += idf * (self._k1 + 1)
+            if ceiling > 0:
+                scores[row] /= ceiling
+        return scores
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Retrieve the best matching positions for a query on its own, as a
+        first-stage retriever.
+
+        Args:
+            query (str): The user's prompt.
+            k (int): The number of positions to return.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Up to k positions, best first, and their BM25 scores.
+        """
+        positions, scores = self.score(query)
+        best = np.lexsort((positions, -scores))[:k]
+        return positions[best], scores[best]
+
+    def copy(self) -> "BM25Index":
+        """
+        Copy the index. Posting lists are shared until either index appends
+        to them.
+
+        Returns:
+            BM25Index: A copy of the index that can be modified independently.
+        """
+        index = BM25Index([], self._k1, self._b)
+        index._postings = dict(self._postings)
+        self._owned = set()
+        index._arrays = dict(self._arrays)
+        index._documents = np.array(self._documents)
+        index._owners = np.array(self._owners)
+        index._lengths = np.array(self._lengths)
+        index._size = self._size
+        index._count = self._count
+        index._live = self._live
+        index._total_length = self._total_length
+        return index
+
+    def reindex(self, mapping: np.ndarray) -> "BM25Index":
+        """
+        Renumber the positions of the index, dropping those mapped to -1, and
+        drop tombstoned documents.
+
+        Args:
+            mapping (np.ndarray): The new position of each old position, or -1 to drop it.
+
+        Returns:
+            BM25Index: A copy of this index with the new positions.
+        """
+        owners = self._owners[: self._count]
+        documents = np.arange(self._count)
+        live = self._documents[owners] == documents
+        live[live] = mapping[owners[live]] >= 0
+        renumbered = np.full(self._count, -1, dtype=np.int64)
+        renumbered[live] = np.arange(int(live.sum()))
+
+        index = BM25Index([], self._k1, self._b)
+        for term, (documents, counts) in self._postings.items():
+            documents = renumbered[np.array(documents, dtype=np.int64)]
+            kept = documents >= 0
+            if kept.any():
+                index._postings[term] = (
+                    documents[kept].tolist(),
+                    np.array(counts)[kept].tolist(),
+                )
+        index._owned = set(index._postings)
+        index._owners = mapping[owners[live]]
+        index._lengths = self._lengths[: self._count][live]
+        index._size = int((mapping >= 0).sum())
+        index._documents = np.full(index._size, -1, dtype=np.int64)
+        index._documents[index._owners] = np.arange(len(index._owners))
+        index._count = index._live = len(index._owners)
+        index._total_length = int(index._lengths.sum())
+        return index
+
+    def _append(self, positions: List[int], documents: List[str]) -> None:
+        """
+        Append the documents of some positions, whose previous documents are
+        already tombstoned. Positions without text get no document.
+        """
+        for position, document in zip(positions, documents):
+            if document is None:
+                continue
+            terms = tokenize(document)
+            index = self._count
+            for term, count in Counter(terms).items():
+                _append(self._postings, self._owned, term, index, count)
+                self._arrays.pop(term, None)
+            self._owners = _reserved(self._owners, index, index + 1)
+            self._lengths = _reserved(self._lengths, index, index + 1)
+            self._owners[index] = position
+            self._lengths[index] = len(terms)
+            self._documents[position] = index
+            self._count += 1
+            self._live += 1
+            self._total_length += len(terms)
+
+    def _idf(self, frequency: int) -> float:
+        return math.log(1 + (self._live - frequency + 0.5) / (frequency + 0.5))
+
+    def _contributions(self, term: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Get the positions whose live documents hold a term, their BM25
+        contributions and the IDF of the term. Posting lists are converted to
+        arrays once per term until the term is added to again; tombstoned
+        documents are masked here.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, float]: The positions, their contributions and the IDF, or None for terms without a live document.
+        """
+        if term not in self._postings:
+            return None
+        if term not in self._arrays:
+            documents, counts = self._postings[term]
+            self._arrays[term] = (
+                np.array(documents, dtype=np.int64),
+                np.array(counts, dtype=np.float32),
+            )
+        documents, counts = self._arrays[term]
+        positions = self._owners[documents]
+        live = self._documents[positions] == documents
+        if not live.any():
+            return None
+        documents, counts, positions = (
+            documents[live],
+            counts[live],
+            positions[live],
+        )
+        idf = self._idf(len(documents))
+        average = self._total_length / max(self._live, 1)
+        norms = self._k1 * (
+            1 - self._b + self._b * self._lengths[documents] / average
+        )
+        contributions = idf * counts * (self._k1 + 1) / (counts + norms)
+        return positions, contributions.astype(np.float32), idf
+
+    def __len__(self) -> int:
+        return self._size
+
+
+__all__ = ["BM25Index", "tokenize"]
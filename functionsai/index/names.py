@@ -0,0 +1,189 @@
+import numpy as np
+from itertools import chain
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple
+from fuzzywuzzy import fuzz
+from .postings import _SUBTOKEN, _append
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    """
+    Get the character n-grams of a text padded with a space on each side.
+
+    Args:
+        text (str): The text to be split.
+        n (int, optional): The length of the n-grams. Defaults to 3.
+
+    Returns:
+        Set[str]: The n-grams of the text.
+    """
+    padded = f" {text} "
+    return {padded[i : i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+def signature(name: str, n: int = 3) -> Set[str]:
+    """
+    Get the n-grams of a function name and of its snake_case and camelCase sub-tokens.
+
+    Args:
+        name (str): The name of the function.
+        n (int, optional): The length of the n-grams. Defaults to 3.
+
+    Returns:
+        Set[str]: The n-grams of the name.
+    """
+    grams = ngrams(name.lower(), n)
+    for subtoken in _SUBTOKEN.findall(name):
+        grams |= ngrams(subtoken.lower(), n)
+    return grams
+
+
+class NameIndex:
+    """
+    The NameIndex class shortlists the function names that share character
+    n-grams with a word through an inverted index, and only runs `fuzz.ratio`
+    on that shortlist. A name is shortlisted when it shares at least all but
+    `n` of the word's n-grams, or one n-gram for words shorter than that, so
+    that every name whose whole or sub-token is within one edit of the word
+    is kept. Shortlisted names get exactly the `fuzz.ratio` score; names
+    below the bound score zero.
+
+    Copies share their posting lists until they append to them, and
+    `_owned` holds the n-grams whose lists are not shared.
+    """
+
+    _names: List[str]
+    _postings: Dict[str, Tuple[List[int]]]
+    _owned: Set[str]
+    _n: int
+
+    def __init__(
+        self, names: List[str], n: int = 3, cache_size: int = 4096
+    ) -> None:
+        """
+        Args:
+            names (List[str]): The function names, by position. Positions without a name hold None.
+            n (int, optional): The length of the n-grams. Defaults to 3.
+            cache_size (int, optional): The number of words whose matches are memoized. Defaults to 4096.
+        """
+        self._names = []
+        self._n = n
+        self._postings = {}
+        self._owned = set()
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+        self.add(names)
+
+    def add(self, names: List[str]) -> None:
+        """
+        Append names at the next positions.
+
+        Args:
+            names (List[str]): The function names to be added. Positions without a name hold None.
+        """
+        for position, name in enumerate(names, start=len(self._names)):
+            if name is not None:
+                for gram in signature(name, self._n):
+                    _append(self._postings, self._owned, gram, position)
+        self._names.extend(names)
+        self.match.cache_clear()
+
+    def remove(self, positions: List[int]) -> None:
+        """
+        Stop matching the names at the given positions. Their postings are
+        skipped at match time rather than rewritten.
+
+        Args:
+            positions (List[int]): The positions of the names to be removed.
+        """
+        for position in positions:
+            self._names[position] = None
+        self.match.cache_clear()
+
+    def copy(self) -> "NameIndex":
+        """
+        Copy the index. Posting lists are shared until either index appends
+        to them.
+
+        Returns:
+            NameIndex: A copy of the index that can be modified independently, with an empty match cache.
+        """
+        index = NameIndex([], self._n, self.match.cache_info().maxsize)
+        index._names = list(self._names)
+        index._postings = dict(self._postings)
+        self._owned = set()
+        return index
+
+    def reindex(self, mapping: np.ndarray) -> "NameIndex":
+        """
+        Renumber the positions of the index, dropping those mapped to -1.
+
+        Args:
+            mapping (np.ndarray): The new position of each old position, or -1 to drop it.
+
+        Returns:
+            NameIndex: A copy of this index with the new positions, with an empty match cache.
+        """
+        index = NameIndex([], self._n, self.match.cache_info().maxsize)
+        index._names = [
+            name
+            for name, position in zip(self._names, mapping)
+            if position >= 0
+        ]
+        for gram, (postings,) in self._postings.items():
+            positions = mapping[np.array(postings, dtype=np.int64)]
+            positions = positions[positions >= 0]
+            if len(positions):
+                index._postings[gram] = (positions.tolist(),)
+        index._owned = set(index._postings)
+        return index
+
+    def shortlist(self, word: str) -> np.ndarray:
+        """
+        Args:
+            word (str): A word of the user's prompt.
+
+        Returns:
+            np.ndarray: The positions of the names sharing enough n-grams with the word, in order.
+        """
+        grams = ngrams(word, self._n)
+        postings = [
+            self._postings[gram][0] for gram in grams if gram in self._postings
+        ]
+        if not postings:
+            return np.zeros(0, dtype=np.int64)
+        counts = np.bincount(np.fromiter(chain(*postings), dtype=np.int64))
+        return np.flatnonzero(counts >= max(1, len(grams) - self._n))
+
+    def _match(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score a word against the shortlisted names.
+
+        Args:
+            word (str): A word of the user's prompt.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The shortlisted positions and their `fuzz.ratio` scores.
+        """
+        positions = self.shortlist(word)
+        positions = positions[
+            [self._names[position] is not None for position in positions]
+        ]
+        scores = np.array(
+            [fuzz.ratio(word, self._names[position]) for position in positions],
+            dtype=np.float32,
+        )
+        return positions, scores
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def names(self) -> List[str]:
+        """
+        Returns:
+            List[str]: The function names, by position.
+        """
+        return self._names
+
+
+__all__ = ["NameIndex", "ngrams", "signature"]
@@ -0,0 +1,30 @@
+import re
+from typing import Dict, List, Set, Tuple
+
+# The snake_case and camelCase sub-tokens of an identifier
+_SUBTOKEN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def _append(
+    postings: Dict[str, Tuple[List[int], ...]],
+    owned: Set[str],
+    key: str,
+    *values: int,
+) -> None:
+    """
+    Append one value to each of the parallel posting lists of a key.
+
+    Copies of an inverted index share their posting lists, so an index
+    replaces a shared list with its own the first time it appends to it.
+    `owned` holds the keys whose lists are not shared, and copying an index
+    empties it on both sides.
+    """
+    if key in owned:
+        for column, value in zip(postings[key], values):
+            column.append(value)
+    else:
+        shared = postings.get(key, ((),) * len(values))
+        postings[key] = tuple(
+            [*column, value] for column, value in zip(shared, values)
+        )
+        owned.add(key)
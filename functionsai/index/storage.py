@@ -0,0 +1,244 @@
+import copy
+import numpy as np
+from typing import NamedTuple, Tuple
+
+_DTYPES = ("float32", "float16", "int8")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize the rows of a matrix. Rows with a zero norm are left at zero.
+
+    Args:
+        vectors (np.ndarray): The matrix to be normalized.
+
+    Returns:
+        np.ndarray: A contiguous float32 copy of the matrix with unit-length rows.
+    """
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2, order="C")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def _reserved(array: np.ndarray, size: int, capacity: int) -> np.ndarray:
+    """
+    Make sure a buffer is writable and holds at least `capacity` rows, keeping
+    its first `size` rows. Buffers grow by doubling so appends are amortized.
+    """
+    if len(array) >= capacity and array.flags.writeable:
+        return array
+    grown = np.zeros(
+        (max(capacity, 2 * len(array), 16),) + array.shape[1:],
+        dtype=array.dtype,
+    )
+    grown[:size] = array[:size]
+    return grown
+
+
+class StorageReport(NamedTuple):
+    """
+    The memory and ranking agreement of an index stored with a Storage,
+    compared to a reference index.
+    """
+
+    reference_bytes: int
+    bytes: int
+    agreement: float
+
+    @property
+    def saved_bytes(self) -> int:
+        """
+        Returns:
+            int: How many fewer bytes the vectors take than in the reference index.
+        """
+        return self.reference_bytes - self.bytes
+
+
+class Storage:
+    """
+    The Storage class sets how the description and prompt vectors of a
+    FunctionIndex are stored: as float32, as float16, or as int8 with one
+    float32 scale per vector, optionally after projecting them on their
+    `dimensions` principal components.
+
+    Queries are projected the same way and scored directly against the
+    stored rows, converting `block_size` rows at a time to float32, so a scan
+    reads the compact representation rather than a full-precision copy.
+
+    A Storage is created unfitted, holding only its settings, and `fit`
+    returns a fitted copy whose projection is learned from a set of vectors.
+    A projection is only learned from at least as many vectors as it has
+    components; until then the storage stays unfitted and keeps every
+    dimension.
+    """
+
+    _dtype: np.dtype
+    _dimensions: int
+    _block_size: int
+    _projection: np.ndarray = None
+
+    def __init__(
+        self,
+        dtype: str = "float32",
+        dimensions: int = None,
+        block_size: int = 4096,
+        projection: np.ndarray = None,
+    ) -> None:
+        """
+        Args:
+            dtype (str, optional): "float32", "float16" or "int8". Defaults to "float32".
+            dimensions (int, optional): The number of principal components vectors are projected on. Defaults to None, to keep every dimension.
+            block_size (int, optional): The number of rows converted to float32 at a time while scoring. Defaults to 4096.
+            projection (np.ndarray, optional): A projection fitted earlier, such as one read from a saved index. Defaults to None.
+        """
+        if dtype not in _DTYPES:
+            raise ValueError(f"Expected one of {_DTYPES}, got {dtype}")
+        self._dtype = np.dtype(dtype)
+        self._dimensions = dimensions
+        self._block_size = block_size
+        self._projection = projection
+
+    def fit(self, vectors: np.ndarray) -> "Storage":
+        """
+        Learn the projection on the principal components of a set of vectors.
+        The components are not centered, so that projected dot products stay
+        as close as possible to the original ones.
+
+        Args:
+            vectors (np.ndarray): The normalized vectors, one per row.
+
+        Returns:
+            Storage: A fitted copy of this storage, or an unfitted copy when there are fewer vectors than components.
+        """
+        fitted = copy.copy(self)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self._dimensions is None or vectors.ndim != 2:
+            return fitted
+        width = min(self._dimensions, vectors.shape[1])
+        if len(vectors) < width:
+            return fitted
+        _, _, components = np.linalg.svd(vectors, full_matrices=False)
+        fitted._projection = np.ascontiguousarray(
+            components[:width].T, dtype=np.float32
+        )
+        return fitted
+
+    def width(self, dim: int) -> int:
+        """
+        Args:
+            dim (int): The number of dimensions of the original vectors.
+
+        Returns:
+            int: The number of dimensions of the stored vectors, which keep every dimension until a projection is fitted.
+        """
+        return dim if self._projection is None else self._projection.shape[1]
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Project vectors, such as queries, and normalize them.
+
+        Args:
+            vectors (np.ndarray): The vectors, one per row.
+
+        Returns:
+            np.ndarray: The normalized float32 projected vectors.
+        """
+        vectors = normalize(vectors)
+        if self._projection is None:
+            return vectors
+        return normalize(vectors @ self._projection)
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Project, normalize and convert vectors to the stored representation.
+
+        Args:
+            vectors (np.ndarray): The vectors, one per row.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The stored rows and the scale of each row, which is one unless stored as int8.
+        """
+        rows = self.project(vectors)
+        scales = np.ones(len(rows), dtype=np.float32)
+        if self._dtype == np.int8:
+            scales = np.abs(rows).max(axis=1, initial=0) / 127
+            np.divide(
+                rows, scales[:, None], out=rows, where=scales[:, None] > 0
+            )
+            rows = np.rint(rows)
+        return rows.astype(self._dtype), scales.astype(np.float32)
+
+    def decode(self, rows: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            rows (np.ndarray): Stored rows.
+            scales (np.ndarray): The scale of each row.
+
+        Returns:
+            np.ndarray: The rows as float32 in the projected space.
+        """
+        decoded = np.asarray(rows, dtype=np.float32)
+        if self._dtype == np.int8:
+            decoded = decoded * scales[:, None]
+        return decoded
+
+    def similarity(
+        self, queries: np.ndarray, rows: np.ndarray, scales: np.ndarray
+    ) -> np.ndarray:
+        """
+        Compute the cosine similarity of projected queries to stored rows.
+
+        Args:
+            queries (np.ndarray): Queries returned by `project`, one per row.
+            rows (np.ndarray): Stored rows.
+            scales (np.ndarray): The scale of each row.
+
+        Returns:
+            np.ndarray: The similarities, one row per query and one column per stored row.
+        """
+        if self._dtype == np.float32:
+            return queries @ rows.T
+        similarities = np.empty((len(queries), len(rows)), dtype=np.float32)
+        for start in range(0, len(rows), self._block_size):
+            end = start + self._block_size
+            block = rows[start:end].astype(np.float32)
+            np.matmul(queries, block.T, out=similarities[:, start:end])
+        if self._dtype == np.int8:
+            similarities *= scales
+        return similarities
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        Returns:
+            np.dtype: The type of the stored rows.
+        """
+        return self._dtype
+
+    @property
+    def dimensions(self) -> int:
+        """
+        Returns:
+            int: The number of principal components vectors are projected on, or None.
+        """
+        return self._dimensions
+
+    @property
+    def projection(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: The projection matrix, one column per component, once fitted.
+        """
+        return self._projection
+
+    @property
+    def fitted(self) -> bool:
+        """
+        Returns:
+            bool: Whether the projection, if any, has been learned. Unfitted storages encode vectors with every dimension.
+        """
+        return self._dimensions is None or self._projection is not None
+
+
+__all__ = ["Storage", "StorageReport", "normalize"]
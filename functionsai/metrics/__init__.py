@@ -0,0 +1,151 @@
+"""
+"""
+import math
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Dict, List
+
+
+class Metrics(ABC):
+    """
+    The Metrics class receives how long each stage of a query or of an index
+    build took. Subclasses implement `record`. FunctionsAI only reads the clock
+    when it has been given a Metrics object.
+
+    Query stages are "embed", "route", "shards", "name", "lexical",
+    "description", "prompt", "combine", "select" and "query" for the whole
+    call. Build stages are "build.embed", "build.index", "build.ann" and
+    "build.route".
+    """
+
+    @abstractmethod
+    def record(self, stage: str, seconds: float, count: int) -> None:
+        """
+        Record one run of a stage.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): How long the stage took.
+            count (int): The number of items the stage processed: prompts or texts embedded, prompt and function pairs scored, or results selected.
+        """
+
+
+class LatencyHistogram(Metrics):
+    """
+    The LatencyHistogram class aggregates the durations of each stage into
+    log-spaced buckets, so that percentiles can be read at any time in
+    constant memory. Percentiles are accurate to the width of a bucket.
+    """
+
+    _bounds: List[float]
+    _counts: Dict[str, List[int]]
+    _calls: Dict[str, int]
+    _items: Dict[str, int]
+    _seconds: Dict[str, float]
+    _max: Dict[str, float]
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        smallest: float = 1e-6,
+        largest: float = 100.0,
+        buckets_per_octave: int = 4,
+    ) -> None:
+        """
+        Args:
+            smallest (float, optional): The upper bound of the first bucket, in seconds. Defaults to 1e-6.
+            largest (float, optional): The upper bound of the last bucket, in seconds. Longer durations are counted in an overflow bucket. Defaults to 100.0.
+            buckets_per_octave (int, optional): The number of buckets each time the duration doubles. Defaults to 4.
+        """
+        count = math.ceil(math.log2(largest / smallest) * buckets_per_octave)
+        self._bounds = [
+            smallest * 2 ** (i / buckets_per_octave) for i in range(count + 1)
+        ]
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, stage: str, seconds: float, count: int) -> None:
+        """
+        Record one run of a stage.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): How long the stage took.
+            count (int): The number of items the stage processed.
+        """
+        bucket = bisect_left(self._bounds, seconds)
+        with self._lock:
+            if stage not in self._counts:
+                self._counts[stage] = [0] * (len(self._bounds) + 1)
+                self._calls[stage] = self._items[stage] = 0
+                self._seconds[stage] = self._max[stage] = 0.0
+            self._counts[stage][bucket] += 1
+            self._calls[stage] += 1
+            self._items[stage] += count
+            self._seconds[stage] += seconds
+            self._max[stage] = max(self._max[stage], seconds)
+
+    def percentile(self, stage: str, q: float) -> float:
+        """
+        Args:
+            stage (str): The name of the stage.
+            q (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The upper bound, in seconds, of the bucket holding the percentile.
+        """
+        with self._lock:
+            return self._percentile(stage, q)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            Dict[str, Dict[str, float]]: For each stage, the number of calls and items, and the mean, p50, p90, p99 and maximum durations in milliseconds.
+        """
+        with self._lock:
+            return {
+                stage: {
+                    "calls": self._calls[stage],
+                    "items": self._items[stage],
+                    "mean_ms": 1000 * self._seconds[stage] / self._calls[stage],
+                    "p50_ms": 1000 * self._percentile(stage, 50),
+                    "p90_ms": 1000 * self._percentile(stage, 90),
+                    "p99_ms": 1000 * self._percentile(stage, 99),
+                    "max_ms": 1000 * self._max[stage],
+                }
+                for stage in self._counts
+            }
+
+    def _percentile(self, stage: str, q: float) -> float:
+        counts = self._counts[stage]
+        rank = max(1, math.ceil(q / 100 * self._calls[stage]))
+        seen = 0
+        for bucket, count in enumerate(counts[:-1]):
+            seen += count
+            if seen >= rank:
+                return min(self._bounds[bucket], self._max[stage])
+        return self._max[stage]
+
+    def reset(self) -> None:
+        """
+        Forget every recorded duration.
+        """
+        with self._lock:
+            self._counts = {}
+            self._calls = {}
+            self._items = {}
+            self._seconds = {}
+            self._max = {}
+
+    @property
+    def stages(self) -> List[str]:
+        """
+        Returns:
+            List[str]: The stages recorded so far.
+        """
+        with self._lock:
+            return list(self._counts)
+
+
+__all__ = ["Metrics", "LatencyHistogram"]
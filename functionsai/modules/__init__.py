@@ -1,11 +1,85 @@
 """
 """
-from typing import List
+from fnmatch import fnmatchcase
+from typing import Callable, Iterator, List
 from types import ModuleType
 import inspect
 from ..functions import Function
 
 
+def _belongs(name: str, package: str) -> bool:
+    return isinstance(name, str) and (
+        name == package or name.startswith(package + ".")
+    )
+
+
+def _matches(name: str, patterns: List[str]) -> bool:
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def discover(
+    module: ModuleType,
+    depth: int = None,
+    include: List[str] = None,
+    exclude: List[str] = None,
+    recursive: bool = False,
+) -> Iterator[Callable]:
+    """
+    Find the public functions of a module and of the classes defined in its
+    package, yielding each function as soon as it is found. Every object is
+    visited once, so cyclic references terminate and a function reachable
+    along several paths is only yielded once.
+
+    Args:
+        module (ModuleType): The module to be searched.
+        depth (int, optional): How many levels of classes and submodules below the module are searched. Defaults to no limit.
+        include (List[str], optional): Glob patterns of qualified function names to keep, such as "package.sub.*". Defaults to every function.
+        exclude (List[str], optional): Glob patterns of qualified function or class names to skip. Defaults to none.
+        recursive (bool, optional): Whether to also search the submodules of the module's package. Defaults to False.
+
+    Yields:
+        Callable: The functions of the module.
+    """
+    package = module.__name__
+    exclude = exclude or []
+    visited = {id(module)}
+
+    def walk(obj, level):
+        try:
+            members = inspect.getmembers(obj)
+        except Exception:
+            return
+        for name, member in members:
+            if id(member) in visited:
+                continue
+            if inspect.isfunction(member):
+                if name.startswith("_"):
+                    continue
+                visited.add(id(member))
+                qualified = f"{member.__module__}.{member.__qualname__}"
+                if include is not None and not _matches(qualified, include):
+                    continue
+                if not _matches(qualified, exclude):
+                    yield member
+            elif depth is None or level < depth:
+                if inspect.isclass(member):
+                    owner = getattr(member, "__module__", None)
+                    if not _belongs(owner, package):
+                        continue
+                    qualified = f"{member.__module__}.{member.__qualname__}"
+                elif recursive and inspect.ismodule(member):
+                    if not _belongs(member.__name__, package):
+                        continue
+                    qualified = member.__name__
+                else:
+                    continue
+                visited.add(id(member))
+                if not _matches(qualified, exclude):
+                    yield from walk(member, level + 1)
+
+    yield from walk(module, 0)
+
+
 class Module:
     """
     The Module class maps a module to a name, description, and its functions.
@@ -17,17 +91,30 @@ class Module:
     _functions: List[Function]
     _prompts: List[str] = None
 
-    def __init__(self, module: ModuleType, prompts: List[str] = None) -> None:
+    def __init__(
+        self,
+        module: ModuleType,
+        prompts: List[str] = None,
+        depth: int = None,
+        include: List[str] = None,
+        exclude: List[str] = None,
+        recursive: bool = False,
+    ) -> None:
         """
         Args:
             module (ModuleType): The module to be analyzed.
             prompts (List[str], optional): A list of prompts related to the module. Defaults to None.
+            depth (int, optional): How many levels of classes and submodules below the module are searched. Defaults to no limit.
+            include (List[str], optional): Glob patterns of qualified function names to keep. Defaults to every function.
+            exclude (List[str], optional): Glob patterns of qualified function or class names to skip. Defaults to none.
+            recursive (bool, optional): Whether to also search the submodules of the module's package. Defaults to False.
         """
         self._name = module.__name__
         self._description = module.__doc__
         self._module = module
-        self._functions = []
-        self._functions = self._get_functions(module)
+        self._functions = list(
+            discover(module, depth, include, exclude, recursive)
+        )
         self._prompts = prompts
 
     def __eq__(self, other):
@@ -46,32 +133,6 @@ class Module:
             and self.prompts == other.prompts
         )
 
-    def _get_functions(self, module):
-        """
-        Gets all functions in a module.
-
-        Args:
-            module (ModuleType): The module to be analyzed.
-
-        Returns:
-            List[Function]: A list of functions in the module.
-        """
-        functions = []
-
-        def get_all_functions(module):
-            for name, obj in inspect.getmembers(module):
-                if inspect.isfunction(obj) and not name.startswith("_"):
-                    functions.append(obj)
-                else:
-                    try:
-                        if obj.__module__.startswith(module.__name__):
-                            get_all_functions(obj)
-                    except AttributeError:
-                        continue
-
-        get_all_functions(module)
-        return functions
-
     @property
     def name(self) -> str:
         """
@@ -129,4 +190,4 @@ class Module:
         self._prompts = prompts
 
 
-__all__ = ["Module"]
+__all__ = ["Module", "discover"]
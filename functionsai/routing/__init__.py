@@ -0,0 +1,200 @@
+"""
+"""
+import copy
+import numpy as np
+from typing import Callable, List
+from ..index import normalize
+from ..modules import Module
+from ..scoring import top_k
+
+
+class Router:
+    """
+    The Router class sends a prompt to the modules most likely to hold the
+    function it needs, so that only their functions are scored. Each module
+    is represented by the vectors of its description, of its prompts and of
+    the mean of its functions' vectors, and scores the highest cosine
+    similarity of any of them.
+
+    A prompt is routed to its `modules` best modules, together with every
+    function registered outside a module. When the best module scores below
+    `confidence`, or the modules hold no function, the prompt is scored
+    against every function instead.
+
+    A Router is created unfitted, holding only its settings, and `fit`
+    returns a fitted copy for a set of modules.
+    """
+
+    _modules: int
+    _confidence: float
+    _routed: List[Module]
+    _matrix: np.ndarray
+    _owners: np.ndarray
+    _standalone: List[Callable]
+
+    def __init__(self, modules: int = 3, confidence: float = 0.3) -> None:
+        """
+        Args:
+            modules (int, optional): The number of modules each prompt is routed to. Defaults to 3.
+            confidence (float, optional): The lowest best-module score for which a prompt is routed rather than scored against every function. Defaults to 0.3.
+        """
+        self._modules = modules
+        self._confidence = confidence
+        self._routed = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._standalone = []
+
+    def fit(
+        self,
+        modules: List[Module],
+        vectors: List[List[np.ndarray]],
+        standalone: List[Callable] = (),
+    ) -> "Router":
+        """
+        Represent a set of modules.
+
+        Args:
+            modules (List[Module]): The modules prompts are routed to.
+            vectors (List[List[np.ndarray]]): The vectors representing each module.
+            standalone (List[Callable], optional): The functions registered outside a module, which every routed prompt is also scored against. Defaults to none.
+
+        Returns:
+            Router: A fitted copy of this router.
+        """
+        fitted = copy.copy(self)
+        fitted._routed = []
+        fitted._matrix = np.zeros((0, 0), dtype=np.float32)
+        fitted._owners = np.zeros(0, dtype=np.int64)
+        fitted._standalone = []
+        return fitted.add(modules, vectors, standalone)
+
+    def add(
+        self,
+        modules: List[Module],
+        vectors: List[List[np.ndarray]],
+        standalone: List[Callable] = (),
+    ) -> "Router":
+        """
+        Represent more modules and standalone functions.
+
+        Args:
+            modules (List[Module]): The modules to be added.
+            vectors (List[List[np.ndarray]]): The vectors representing each module.
+            standalone (List[Callable], optional): The functions registered outside a module. Defaults to none.
+
+        Returns:
+            Router: A copy of this router holding the new modules.
+        """
+        updated = copy.copy(self)
+        updated._routed = self._routed + list(modules)
+        updated._standalone = self._standalone + list(standalone)
+        rows = [vector for module in vectors for vector in module]
+        if rows:
+            owners = np.repeat(
+                np.arange(len(self._routed), len(updated._routed)),
+                [len(module) for module in vectors],
+            )
+            matrix = normalize(rows)
+            if len(self._matrix):
+                matrix = np.concatenate((self._matrix, matrix))
+            updated._matrix = matrix
+            updated._owners = np.concatenate((self._owners, owners))
+        return updated
+
+    def remove(self, modules: List[Module]) -> "Router":
+        """
+        Stop routing prompts to some modules.
+
+        Args:
+            modules (List[Module]): The modules to be removed.
+
+        Returns:
+            Router: A copy of this router without the modules.
+        """
+        keep = np.array(
+            [module not in modules for module in self._routed], dtype=bool
+        )
+        mapping = np.full(len(keep), -1, dtype=np.int64)
+        mapping[keep] = np.arange(int(keep.sum()))
+        rows = keep[self._owners] if len(keep) else keep
+        updated = copy.copy(self)
+        updated._routed = [
+            module for module, kept in zip(self._routed, keep) if kept
+        ]
+        updated._matrix = self._matrix[rows]
+        updated._owners = mapping[self._owners[rows]]
+        return updated
+
+    def scores(self, prompt_vecs: np.ndarray) -> np.ndarray:
+        """
+        Score every module against a batch of prompts.
+
+        Args:
+            prompt_vecs (np.ndarray): The vector representations of the prompts, one row per prompt.
+
+        Returns:
+            np.ndarray: The scores, one row per prompt and one column per module. Modules without any vector score -inf.
+        """
+        scores = np.full(
+            (len(prompt_vecs), len(self._routed)), -np.inf, dtype=np.float32
+        )
+        if len(self._matrix):
+            similarities = normalize(prompt_vecs) @ self._matrix.T
+            for row in range(len(scores)):
+                np.maximum.at(scores[row], self._owners, similarities[row])
+        return scores
+
+    def route(self, prompt_vecs: np.ndarray) -> List[List[Module]]:
+        """
+        Pick the modules each prompt of a batch is routed to.
+
+        Args:
+            prompt_vecs (np.ndarray): The vector representations of the prompts, one row per prompt.
+
+        Returns:
+            List[List[Module]]: The best modules of each prompt, or None for prompts to be scored against every function.
+        """
+        routes = []
+        for scores in self.scores(prompt_vecs):
+            best = top_k(scores, self._modules)
+            if len(best) == 0 or scores[best[0]] < self._confidence:
+                routes.append(None)
+            else:
+                routes.append([self._routed[row] for row in best])
+        return routes
+
+    @property
+    def modules(self) -> int:
+        """
+        Returns:
+            int: The number of modules each prompt is routed to.
+        """
+        return self._modules
+
+    @property
+    def confidence(self) -> float:
+        """
+        Returns:
+            float: The lowest best-module score for which a prompt is routed.
+        """
+        return self._confidence
+
+    @property
+    def routed(self) -> List[Module]:
+        """
+        Returns:
+            List[Module]: The modules prompts are routed to, once fitted.
+        """
+        return self._routed
+
+    @property
+    def standalone(self) -> List[Callable]:
+        """
+        Returns:
+            List[Callable]: The functions registered outside a module.
+        """
+        return self._standalone
+
+
+__all__ = ["Router"]
@@ -1,37 +1,117 @@
 """
 """
+import time
 import numpy as np
-from typing import Callable, List
-from ..functions import Function
+from typing import Callable, List, Tuple
+from ..index import FunctionIndex
+from ..metrics import Metrics
 from . import description
+from . import lexical
 from . import name
 from . import prompt
 
 
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Select the positions of the k highest scores without sorting every score.
+    Ties are broken by position, so the result matches the first k entries of a
+    stable descending sort.
+
+    Args:
+        scores (np.ndarray): The scores to be ranked.
+        k (int): The number of positions to return.
+
+    Returns:
+        np.ndarray: The positions of the k highest scores, best first.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if k < len(scores):
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:k]]
+
+
+def _record(
+    metrics: Metrics,
+    stage: str,
+    start: float,
+    prompts: List[str],
+    mask: np.ndarray,
+) -> float:
+    """
+    Record a scoring stage that started at `start`, counting every prompt and
+    function pair it scored.
+
+    Returns:
+        float: The time the stage ended, when the next one starts.
+    """
+    end = time.perf_counter()
+    metrics.record(stage, end - start, len(prompts) * int(mask.sum()))
+    return end
+
+
 class Scoring:
     """
     The Scoring class is used to score the similarity of a function to a prompt.
+
+    Each function scores the highest of its name, description and prompt
+    similarities. Name similarities range from 0 to 100 and embedding
+    similarities from -1 to 1, so a function whose name matches a word of the
+    prompt ranks above every function matched by embeddings alone. The optional
+    `lexical_scoring`, such as `lexical.similarity`, scores descriptions and
+    prompts from 0 to 1 with BM25 and, like names, needs no embedding.
+
+    In cascade mode, set by `exact_match` or `candidates`, names and lexical
+    matches are scored first and prompts are only embedded when needed:
+
+    - A prompt for which some function's name score reaches `exact_match` is
+      ranked by name and lexical scores alone and is never embedded.
+    - Otherwise, only the `candidates` functions with the highest nonzero name
+      or lexical scores are scored on descriptions and prompts, and every other
+      function keeps those scores. A prompt that matches nothing is scored in
+      full.
     """
 
     _name_scoring: Callable
     _description_scoring: Callable
     _prompt_scoring: Callable
-    _name_score: float
-    _description_score: float
-    _prompt_score: float
+    _lexical_scoring: Callable
+    _exact_match: float
+    _candidates: int
 
     def __init__(
         self,
         name_scoring: Callable = name.similarity,
         description_scoring: Callable = description.similarity,
         prompt_scoring: Callable = prompt.similarity,
+        lexical_scoring: Callable = None,
+        exact_match: float = None,
+        candidates: int = None,
     ) -> None:
+        """
+        Args:
+            name_scoring (Callable, optional): The name scoring function. Defaults to `name.similarity`.
+            description_scoring (Callable, optional): The description scoring function. Defaults to `description.similarity`.
+            prompt_scoring (Callable, optional): The prompt scoring function. Defaults to `prompt.similarity`.
+            lexical_scoring (Callable, optional): The lexical scoring function, such as `lexical.similarity`. Defaults to None.
+            exact_match (float, optional): The name score from which a prompt is ranked by names alone. Defaults to None.
+            candidates (int, optional): The number of functions, picked by name or lexical score, that are scored on descriptions and prompts. Defaults to None.
+        """
         self._name_scoring = name_scoring
         self._description_scoring = description_scoring
         self._prompt_scoring = prompt_scoring
+        self._lexical_scoring = lexical_scoring
+        self._exact_match = exact_match
+        self._candidates = candidates
 
     def score(
-        self, prompt: str, prompt_vec: np.ndarray, functions: List[Function]
+        self, prompt: str, prompt_vec: np.ndarray, index: FunctionIndex
     ) -> np.ndarray:
         """
         Score the similarity of a batch of functions to a prompt.
@@ -39,70 +119,284 @@ class Scoring:
         Args:
             prompt (str): The user's prompt.
             prompt_vector (np.ndarray): The vector representation of the prompt.
-            functions (List[Function]): The list of functions to be scored.
+            index (FunctionIndex): The index of the functions to be scored.
 
         Returns:
             np.ndarray: The list of similarity scores for each function.
         """
+        return self.score_many(
+            [prompt], np.asarray(prompt_vec).reshape(1, -1), index
+        )[0]
+
+    def score_many(
+        self,
+        prompts: List[str],
+        prompt_vecs: np.ndarray,
+        index: FunctionIndex,
+        metrics: Metrics = None,
+        positions: np.ndarray = None,
+        score_vectors: Callable = None,
+    ) -> np.ndarray:
+        """
+        Score the similarity of a batch of functions to a batch of prompts.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            prompt_vecs (np.ndarray): The vector representations of the prompts, one row per prompt.
+            index (FunctionIndex): The index of the functions to be scored.
+            metrics (Metrics, optional): Receives the duration of each scorer and of combining their scores. Defaults to None.
+            positions (np.ndarray, optional): The positions of the only functions scored on descriptions and prompts. Names and lexical matches are still scored on the whole index, whose name and lexical indexes are cached. Defaults to every position.
+            score_vectors (Callable, optional): Scores descriptions and prompts elsewhere, such as on shards, and combines them with the name and lexical scores. Called with the prompts, their vectors, the positions to be scored or None for every position, and their name and lexical scores. Defaults to `score_embeddings` on the index.
+
+        Returns:
+            np.ndarray: The similarity scores, one row per prompt and one column per function, or per position when `positions` is set.
+        """
+        start = time.perf_counter() if metrics is not None else 0.0
+        text_scores, index, start = self._score_text(
+            prompts, index, metrics, start, positions
+        )
+        if score_vectors is not None:
+            return score_vectors(prompts, prompt_vecs, None, text_scores)
+        return self._score_embeddings(
+            prompts, prompt_vecs, index, text_scores, metrics, start
+        )
+
+    def score_cascade(
+        self,
+        prompts: List[str],
+        embed: Callable[[List[str]], np.ndarray],
+        index: FunctionIndex,
+        metrics: Metrics = None,
+        positions: np.ndarray = None,
+        score_vectors: Callable = None,
+    ) -> np.ndarray:
+        """
+        Score the similarity of a batch of functions to a batch of prompts in
+        cascade mode, only embedding the prompts that names do not settle.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            embed (Callable[[List[str]], np.ndarray]): Embeds a list of prompts, one row per prompt.
+            index (FunctionIndex): The index of the functions to be scored.
+            metrics (Metrics, optional): Receives the duration of each scorer and of combining their scores. Defaults to None.
+            positions (np.ndarray, optional): The positions of the only functions that may be scored on descriptions and prompts, as in `score_many`. Defaults to every position.
+            score_vectors (Callable, optional): Scores descriptions and prompts elsewhere, as in `score_many`. Shortlists are still picked here from the name and lexical scores of the whole index. Defaults to `score_embeddings` on the index.
+
+        Returns:
+            np.ndarray: The similarity scores, one row per prompt and one column per function, or per position when `positions` is set.
+        """
+        start = time.perf_counter() if metrics is not None else 0.0
+        scores, index, _ = self._score_text(
+            prompts, index, metrics, start, positions
+        )
+
+        remaining = np.arange(len(prompts))
+        if self._exact_match is not None and scores.size:
+            remaining = np.flatnonzero(scores.max(axis=1) < self._exact_match)
+        if len(remaining) == 0:
+            return scores
+
+        if score_vectors is None:
+
+            def score_vectors(prompts, prompt_vecs, columns, text_scores):
+                return self.score_embeddings(
+                    prompts,
+                    prompt_vecs,
+                    index if columns is None else index.subset(columns),
+                    text_scores,
+                    metrics,
+                )
 
-        # Initialize scores with zeros
-        name_scores = [0] * len(functions)
-        description_scores = [0] * len(functions)
-        prompt_scores = [0] * len(functions)
+        remaining_prompts = [prompts[row] for row in remaining]
+        prompt_vecs = np.asarray(embed(remaining_prompts))
+        if self._candidates is None or self._candidates >= len(index):
+            scores[remaining] = score_vectors(
+                remaining_prompts, prompt_vecs, None, scores[remaining]
+            )
+            return scores
 
-        # Functions with names
-        functions_with_names = [
-            func for func in functions if func.name is not None
-        ]
-        if functions_with_names:
-            name_scores_for_named_functions = self._name_scoring(
-                prompt, functions_with_names
+        # Rows without any name or lexical match are scored in full
+        shortlists = {}
+        for row, text_scores in zip(remaining, scores[remaining]):
+            matched = np.flatnonzero(text_scores > 0)
+            if len(matched) > 0:
+                shortlists[row] = matched[
+                    top_k(text_scores[matched], self._candidates)
+                ]
+        full = [i for i, row in enumerate(remaining) if row not in shortlists]
+        if full:
+            rows = remaining[full]
+            scores[rows] = score_vectors(
+                [prompts[row] for row in rows],
+                prompt_vecs[full],
+                None,
+                scores[rows],
             )
-            for func, score in zip(
-                functions_with_names, name_scores_for_named_functions
-            ):
-                name_scores[functions.index(func)] = score
+        if shortlists:
+            rows = np.array(list(shortlists))
+            positions = np.unique(np.concatenate(list(shortlists.values())))
+            combined = score_vectors(
+                [prompts[row] for row in rows],
+                prompt_vecs[np.searchsorted(remaining, rows)],
+                positions,
+                scores[np.ix_(rows, positions)],
+            )
+            for row, combined_scores in zip(rows, combined):
+                columns = np.searchsorted(positions, shortlists[row])
+                scores[row, shortlists[row]] = combined_scores[columns]
+        return scores
+
+    def score_embeddings(
+        self,
+        prompts: List[str],
+        prompt_vecs: np.ndarray,
+        index: FunctionIndex,
+        text_scores: np.ndarray,
+        metrics: Metrics = None,
+    ) -> np.ndarray:
+        """
+        Score the descriptions and prompts of every function, and combine them
+        with name and lexical scores computed beforehand.
+
+        Args:
+            prompts (List[str]): The user's prompts.
+            prompt_vecs (np.ndarray): The vector representations of the prompts, one row per prompt.
+            index (FunctionIndex): The index of the functions to be scored.
+            text_scores (np.ndarray): The highest of the name and lexical scores, one row per prompt and one column per function.
+            metrics (Metrics, optional): Receives the duration of each scorer and of combining their scores. Defaults to None.
+
+        Returns:
+            np.ndarray: The similarity scores, one row per prompt and one column per function.
+        """
+        start = time.perf_counter() if metrics is not None else 0.0
+        return self._score_embeddings(
+            prompts, prompt_vecs, index, text_scores, metrics, start
+        )
+
+    def _score_names(
+        self, prompts: List[str], index: FunctionIndex
+    ) -> np.ndarray:
+        if not index.name_mask.any():
+            return np.zeros((len(prompts), len(index)), dtype=np.float32)
+        return np.where(
+            index.name_mask, self._name_scoring(prompts, index), 0
+        ).astype(np.float32)
+
+    def _score_text(
+        self,
+        prompts: List[str],
+        index: FunctionIndex,
+        metrics: Metrics,
+        start: float,
+        positions: np.ndarray = None,
+    ) -> Tuple[np.ndarray, FunctionIndex, float]:
+        """
+        Score the names of every function and, if enabled, their lexical
+        matches, neither of which needs the prompts' vectors. When `positions`
+        is set, only their columns are kept, along with an index of their
+        functions for the embedding scorers.
+
+        Returns:
+            Tuple[np.ndarray, FunctionIndex, float]: The highest of the name and lexical scores, one row per prompt and one column per function, the index the embedding scorers run on, and the time the last stage ended.
+        """
+        scores = self._score_names(prompts, index)
+        if metrics is not None:
+            start = _record(metrics, "name", start, prompts, index.name_mask)
+        if self._lexical_scoring is not None and index.alive.any():
+            lexical_scores = np.where(
+                index.alive, self._lexical_scoring(prompts, index), 0
+            )
+            np.maximum(scores, lexical_scores, out=scores)
+            if metrics is not None:
+                start = _record(metrics, "lexical", start, prompts, index.alive)
+        if positions is not None:
+            scores, index = scores[:, positions], index.subset(positions)
+        return scores, index, start
+
+    def _score_embeddings(
+        self,
+        prompts: List[str],
+        prompt_vecs: np.ndarray,
+        index: FunctionIndex,
+        text_scores: np.ndarray,
+        metrics: Metrics,
+        start: float,
+    ) -> np.ndarray:
+        """
+        Score the descriptions and prompts of every function, and combine them
+        with the name and lexical scores in place, with no buffer stacking the
+        scores of every scorer.
+
+        Returns:
+            np.ndarray: The combined scores, one row per prompt and one column per function, held in `text_scores` when it is a float32 array.
+        """
+        # Keep the best score of each function in the text scores' buffer
+        scores = np.asarray(text_scores, dtype=np.float32)
 
         # Functions with descriptions
-        functions_with_descriptions = [
-            func for func in functions if func.description is not None
-        ]
-        if functions_with_descriptions:
-            description_scores_for_described_functions = (
-                self._description_scoring(
-                    prompt_vec, functions_with_descriptions
-                )
+        if index.description_mask.any():
+            description_scores = self._description_scoring(prompt_vecs, index)
+            np.maximum(
+                scores,
+                description_scores,
+                out=scores,
+                where=index.description_mask,
             )
-            for func, score in zip(
-                functions_with_descriptions,
-                description_scores_for_described_functions,
-            ):
-                description_scores[functions.index(func)] = score
+            if metrics is not None:
+                start = _record(
+                    metrics,
+                    "description",
+                    start,
+                    prompts,
+                    index.description_mask,
+                )
 
         # Functions with prompts
-        functions_with_prompts = [
-            func
-            for func in functions
-            if func.prompts is not None and len(func.prompts) > 0
-        ]
-        if functions_with_prompts:
-            prompt_scores_for_prompted_functions = self._prompt_scoring(
-                prompt_vec, functions_with_prompts
+        if index.prompt_mask.any():
+            prompt_scores = self._prompt_scoring(prompt_vecs, index)
+            np.maximum(
+                scores, prompt_scores, out=scores, where=index.prompt_mask
             )
-            for func, score in zip(
-                functions_with_prompts, prompt_scores_for_prompted_functions
-            ):
-                prompt_scores[functions.index(func)] = score
-
-        # Combine scores
-        combined_scores = [
-            max(name, desc, prompt)
-            for name, desc, prompt in zip(
-                name_scores, description_scores, prompt_scores
-            )
-        ]
+            if metrics is not None:
+                start = _record(
+                    metrics, "prompt", start, prompts, index.prompt_mask
+                )
 
-        return combined_scores
+        if metrics is not None:
+            _record(metrics, "combine", start, prompts, index.alive)
+        return scores
+
+    @property
+    def cascades(self) -> bool:
+        """
+        Returns:
+            bool: Whether names are scored first and prompts only embedded when needed.
+        """
+        return self._exact_match is not None or self._candidates is not None
+
+    @property
+    def exact_match(self) -> float:
+        """
+        Returns:
+            float: The name score from which a prompt is ranked by names alone.
+        """
+        return self._exact_match
+
+    @property
+    def candidates(self) -> int:
+        """
+        Returns:
+            int: The number of functions, picked by name or lexical score, that are scored on descriptions and prompts.
+        """
+        return self._candidates
+
+    @property
+    def lexical_scoring(self) -> Callable:
+        """
+        Returns:
+            Callable: The lexical scoring function, or None when lexical matches are not scored.
+        """
+        return self._lexical_scoring
 
     @property
     def name_scoring(self) -> Callable:
@@ -152,5 +446,29 @@ class Scoring:
         """
         self._prompt_scoring = prompt_scoring
 
+    @lexical_scoring.setter
+    def lexical_scoring(self, lexical_scoring: Callable) -> None:
+        """
+        Args:
+            lexical_scoring (Callable): The lexical scoring function, or None to stop scoring lexical matches.
+        """
+        self._lexical_scoring = lexical_scoring
+
+    @exact_match.setter
+    def exact_match(self, exact_match: float) -> None:
+        """
+        Args:
+            exact_match (float): The name score from which a prompt is ranked by names alone.
+        """
+        self._exact_match = exact_match
+
+    @candidates.setter
+    def candidates(self, candidates: int) -> None:
+        """
+        Args:
+            candidates (int): The number of functions, picked by name or lexical score, that are scored on descriptions and prompts.
+        """
+        self._candidates = candidates
+
 
-__all__ = ["Scoring"]
+__all__ = ["Scoring", "top_k"]
@@ -1,25 +1,36 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from typing import List
-from ..functions import Function
+from ..index import FunctionIndex
 
 
 def similarity(
-    user_prompt_vec: np.ndarray,
-    functions: List[Function],
+    user_prompt_vecs: np.ndarray,
+    index: FunctionIndex,
 ) -> np.ndarray:
     """
-    Compare the user prompt to a batch of function descriptions.
+    Compare a batch of user prompts to the descriptions of every indexed function.
 
     Args:
-        user_prompt (str): The user's prompt.
-        functions (List[Function]): The list of functions to be scored.
+        user_prompt_vecs (np.ndarray): The vector representations of the user's prompts, one row per prompt.
+        index (FunctionIndex): The index of the functions to be scored.
 
     Returns:
-        np.ndarray: The similarities between the user prompt and each function description.
+        np.ndarray: The similarities between each user prompt and each function description.
+        Functions without a description, or not retrieved by the index's ANN index, score zero.
     """
 
-    vectors = [function.description_vector for function in functions]
-    similarities = cosine_similarity(user_prompt_vec.reshape(1, -1), vectors)[0]
+    if index.dim == 0:
+        return np.zeros((len(user_prompt_vecs), len(index)), dtype=np.float32)
 
-    return similarities
+    queries = index.storage.project(user_prompt_vecs)
+    if index.description_ann is not None:
+        similarities = np.zeros(
+            (len(user_prompt_vecs), len(index)), dtype=np.float32
+        )
+        results = index.description_ann.search(queries)
+        for row, (positions, scores) in enumerate(results):
+            similarities[row, positions] = scores
+        return similarities
+
+    return index.storage.similarity(
+        queries, index.description_matrix, index.description_scales
+    )
@@ -0,0 +1,20 @@
+import numpy as np
+from typing import List
+from ..index import FunctionIndex
+
+
+def similarity(user_prompts: List[str], index: FunctionIndex) -> np.ndarray:
+    """
+    Score each prompt of a batch against the descriptions and example prompts of every indexed
+    function with BM25. Only the posting lists of the prompt's terms are read, and each score is
+    divided by the highest score the prompt could reach.
+
+    Args:
+        user_prompts (List[str]): The user's prompts.
+        index (FunctionIndex): The index of the functions to be scored.
+
+    Returns:
+        np.ndarray: The similarities between each user prompt and each function's text, from 0 to 1.
+    """
+
+    return index.lexical_index.score_many(user_prompts)
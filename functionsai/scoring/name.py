@@ -1,34 +1,38 @@
+import numpy as np
 from typing import List
-from fuzzywuzzy import fuzz
 import string
-from ..functions import Function
+from ..index import FunctionIndex
 
 
-def similarity(user_prompt: str, functions: List[Function]) -> List[float]:
+def similarity(user_prompts: List[str], index: FunctionIndex) -> np.ndarray:
     """
-    Check to see if the function name is mentioned in the prompt for a batch of functions.
+    Check to see if the function name is mentioned in each prompt of a batch for every indexed function.
+    Each word is only compared to the names shortlisted by the index's NameIndex, and each distinct word
+    is scored once.
 
     Args:
-        user_prompt (str): The user's prompt.
-        functions (List[Function]): The list of functions to be scored.
+        user_prompts (List[str]): The user's prompts.
+        index (FunctionIndex): The index of the functions to be scored.
 
     Returns:
-        List[float]: The similarities between the user prompt and each function's name.
+        np.ndarray: The similarities between each user prompt and each function's name.
     """
 
-    # Preprocess the user prompt
-    words = (
+    # Preprocess the user prompts
+    prompts_words = [
         user_prompt.translate(str.maketrans("", "", string.punctuation))
         .lower()
         .split()
-    )
+        for user_prompt in user_prompts
+    ]
 
-    # Compute similarities for each function
-    similarities = []
-    for function in functions:
-        max_similarity = max(
-            [fuzz.ratio(word, function.name) for word in words]
-        )
-        similarities.append(max_similarity)
+    # Keep the best match of any word for each function
+    similarities = np.zeros((len(user_prompts), len(index)), dtype=np.float32)
+    for row, prompt_words in enumerate(prompts_words):
+        for word in dict.fromkeys(prompt_words):
+            positions, scores = index.name_index.match(word)
+            similarities[row, positions] = np.maximum(
+                similarities[row, positions], scores
+            )
 
     return similarities
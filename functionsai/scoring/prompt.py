@@ -1,27 +1,56 @@
 import numpy as np
-from typing import List
-from sklearn.metrics.pairwise import cosine_similarity
-from ..functions import Function
+from ..index import FunctionIndex
 
 
 def similarity(
-    user_prompt_vector: np.ndarray, functions: List[Function]
+    user_prompt_vectors: np.ndarray, index: FunctionIndex
 ) -> np.ndarray:
     """
-    Compare the user prompt to the descriptions of a batch of functions using TF-IDF vectors.
+    Compare a batch of user prompts to the example prompts of every indexed function.
+    Each function scores the cosine similarity of its closest example prompt.
 
     Args:
-        user_prompt (str): The user's prompt.
-        functions (List[Function]): The list of functions to be scored.
+        user_prompt_vectors (np.ndarray): The vector representations of the user's prompts, one row per prompt.
+        index (FunctionIndex): The index of the functions to be scored.
 
     Returns:
-        np.ndarray: The similarities between the user prompt and each function's description.
+        np.ndarray: The similarities between each user prompt and each function's prompts.
+        Functions without prompts, or whose prompts the index's ANN index does not retrieve, score zero.
     """
 
-    vectors = [function.prompts_vectors for function in functions]
-    similarities = []
-    for vectors_list in vectors:
-        similarities.append(
-            np.max(cosine_similarity(user_prompt_vector, vectors_list))
+    similarities = np.full(
+        (len(user_prompt_vectors), len(index)), -np.inf, dtype=np.float32
+    )
+    if len(index.prompt_matrix) == 0:
+        return np.zeros_like(similarities)
+
+    queries = index.storage.project(user_prompt_vectors)
+    owners = index.prompt_owners
+    if index.prompt_ann is not None:
+        for row, (rows, scores) in enumerate(index.prompt_ann.search(queries)):
+            alive = index.prompt_alive[rows]
+            np.maximum.at(similarities[row], owners[rows[alive]], scores[alive])
+    else:
+        prompt_similarities = index.storage.similarity(
+            queries, index.prompt_matrix, index.prompt_scales
         )
+        if not index.prompt_alive.all():
+            prompt_similarities[:, ~index.prompt_alive] = -np.inf
+
+        # Rows grouped by function reduce in one pass, later rows one by one
+        grouped = index.prompt_sorted
+        if grouped:
+            starts, positions = index.prompt_segments
+            similarities[:, positions] = np.maximum.reduceat(
+                prompt_similarities[:, :grouped], starts, axis=1
+            )
+        if grouped < len(owners):
+            for row in range(len(similarities)):
+                np.maximum.at(
+                    similarities[row],
+                    owners[grouped:],
+                    prompt_similarities[row, grouped:],
+                )
+
+    similarities[np.isneginf(similarities)] = 0
     return similarities
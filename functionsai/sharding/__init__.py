@@ -0,0 +1,408 @@
+"""
+"""
+import os
+import math
+import pickle
+import shutil
+import weakref
+import tempfile
+import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Tuple
+from ..index import FunctionIndex
+from ..metrics import Metrics
+from ..scoring import Scoring, top_k
+
+
+class _ShardFile:
+    """
+    A shard file, deleted once no partition refers to it.
+    """
+
+    path: str
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        weakref.finalize(self, _remove, path)
+
+
+class Shards(NamedTuple):
+    """
+    One partition of an index into shard files. Shard i holds the alive
+    functions from position `bounds[i]` to `bounds[i + 1]` of the partitioned
+    index, which are the compacted positions `starts[i]` to `starts[i + 1]`,
+    and `positions` maps every compacted position back to its position in the
+    partitioned index. Partitions of successive versions of an index share
+    the files of the shards that did not change.
+    """
+
+    files: Tuple[_ShardFile, ...]
+    bounds: np.ndarray
+    starts: np.ndarray
+    positions: np.ndarray
+    shard_size: int
+
+
+class _Entry(NamedTuple):
+    """
+    What a worker knows of a function: the texts its scorers read. Callables
+    never leave the main process.
+    """
+
+    name: str
+    description: str
+    prompts: List[str]
+    function: Callable = None
+
+
+# The path and index of the shard each worker has loaded, by shard number
+_loaded: Dict[int, Tuple[str, FunctionIndex]] = {}
+
+
+def _load(shard: int, path: str) -> FunctionIndex:
+    if shard not in _loaded or _loaded[shard][0] != path:
+        with open(f"{path}.entries", "rb") as file:
+            entries = [_Entry(*entry) for entry in pickle.load(file)]
+        _loaded[shard] = path, FunctionIndex.load(path, entries)
+    return _loaded[shard][1]
+
+
+def _remove(path: str) -> None:
+    for name in (path, f"{path}.entries"):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+
+def _score_shard(
+    shard: int,
+    path: str,
+    prompts: List[str],
+    prompt_vecs: np.ndarray,
+    text_scores: Tuple[np.ndarray, np.ndarray, np.ndarray, int],
+    columns: np.ndarray,
+    scoring: Scoring,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score the descriptions and prompts of one shard against a batch of
+    prompts, in a worker process, and combine them with the name and lexical
+    scores the main process computed on the whole index.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The shard positions of the k best functions of each prompt and their scores, or None and every score when k is None.
+    """
+    index = _load(shard, path)
+    if columns is not None:
+        index = index.subset(columns)
+    rows, cols, values, width = text_scores
+    dense = np.zeros((len(prompts), width), dtype=np.float32)
+    dense[rows, cols] = values
+    scores = scoring.score_embeddings(prompts, prompt_vecs, index, dense)
+    if k is None or k >= len(index):
+        return None, scores
+    positions = np.array([top_k(row, k) for row in scores], dtype=np.int64)
+    return positions, np.take_along_axis(scores, positions, axis=1)
+
+
+def _sparse(
+    scores: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Pack name and lexical scores, which are mostly zero, to be sent to a
+    worker.
+    """
+    rows, cols = np.nonzero(scores)
+    return rows, cols, scores[rows, cols], scores.shape[1]
+
+
+def _close(executors: List[ProcessPoolExecutor], directory: str) -> None:
+    for executor in executors:
+        executor.shutdown(cancel_futures=True)
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+class ShardPool:
+    """
+    The ShardPool class scores huge catalogs on several cores. `partition`
+    writes an index as shard files of `shard_size` functions, which worker
+    processes memory-map so that they share the page cache with each other
+    and with any process loading the same files. Shard i is always scored by
+    worker i modulo `workers`, so each shard is loaded by a single process.
+    `score` scatters a batch of prompts to every shard, each shard returns
+    its local top-k, and the results are merged.
+
+    Names and lexical matches are scored in the main process on the whole
+    index, so that results do not depend on how the catalog is sharded.
+    Prompts are embedded in the main process and only their vectors and
+    nonzero name and lexical scores are sent to the workers, along with the
+    Scoring, which must be picklable. Workers run exact scoring; ANN indexes
+    are not carried over. For throughput that grows with the number of
+    workers, limit each worker's BLAS threads, for example with
+    OMP_NUM_THREADS=1.
+    """
+
+    _workers: int
+    _shard_size: int
+    _executors: List[ProcessPoolExecutor] = None
+    _directory: str = None
+    _generation: int = 0
+    _finalizer: weakref.finalize = None
+
+    def __init__(self, workers: int = None, shard_size: int = None) -> None:
+        """
+        Args:
+            workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+            shard_size (int, optional): The number of functions per shard. Defaults to one shard per worker.
+        """
+        self._workers = workers or os.cpu_count() or 1
+        self._shard_size = shard_size
+
+    def partition(
+        self,
+        index: FunctionIndex,
+        previous: Shards = None,
+        changed: List[int] = None,
+    ) -> Shards:
+        """
+        Write an index as shard files. Given the partition of an earlier
+        version of the index and the positions added, removed or updated
+        since, only the shards holding these positions are written again,
+        and added positions fill the last shard before starting new ones. A
+        compaction, which moves positions, partitions the whole index again.
+        Shard files are deleted once no partition refers to them, so queries
+        still running against an older snapshot can finish.
+
+        Args:
+            index (FunctionIndex): The index to be partitioned.
+            previous (Shards, optional): The partition of the index before the change. Defaults to None, which partitions the whole index.
+            changed (List[int], optional): The positions added, removed or updated since `previous`. Defaults to None, which partitions the whole index.
+
+        Returns:
+            Shards: The partition.
+        """
+        self._start()
+        size = len(index)
+        positions = np.flatnonzero(index.alive)
+        if previous is None or changed is None or size < previous.bounds[-1]:
+            shard_size = self._shard_size or max(
+                1, math.ceil(len(positions) / self._workers)
+            )
+            bounds = np.concatenate(
+                ([0], positions[shard_size::shard_size], [size])
+            )
+            files = []
+            rewrite = range(len(bounds) - 1)
+        else:
+            shard_size = previous.shard_size
+            bounds = previous.bounds.copy()
+            files = list(previous.files)
+            end = bounds[-1]
+            last = previous.starts[-1] - previous.starts[-2]
+            if size > end and last < shard_size:
+                bounds[-1] = end = min(size, end + shard_size - last)
+            bounds = np.append(bounds, np.arange(end, size, shard_size)[1:])
+            if bounds[-1] != size:
+                bounds = np.append(bounds, size)
+            shards = np.searchsorted(bounds, changed, side="right") - 1
+            rewrite = np.unique(
+                np.concatenate((shards, np.arange(len(files), len(bounds) - 1)))
+            )
+        files += [None] * (len(bounds) - 1 - len(files))
+        starts = np.searchsorted(positions, bounds)
+
+        self._generation += 1
+        for shard in rewrite:
+            file = _ShardFile(
+                os.path.join(
+                    self._directory, f"{shard}.{self._generation}.index"
+                )
+            )
+            subset = index.subset(positions[starts[shard] : starts[shard + 1]])
+            subset.save(file.path)
+            with open(f"{file.path}.entries", "wb") as entries:
+                pickle.dump(
+                    [
+                        (f.name, f.description, f.prompts)
+                        for f in subset.functions
+                    ],
+                    entries,
+                )
+            files[shard] = file
+        return Shards(tuple(files), bounds, starts, positions, shard_size)
+
+    def score(
+        self,
+        shards: Shards,
+        prompts: List[str],
+        embed: Callable[[List[str]], np.ndarray],
+        index: FunctionIndex,
+        scoring: Scoring,
+        k: int,
+        metrics: Metrics = None,
+    ) -> np.ndarray:
+        """
+        Score a batch of prompts against every shard of a partition in
+        parallel, and merge the top k functions of each shard.
+
+        Names and lexical matches are scored here on the whole index, so that
+        BM25 statistics and cascade shortlists are those of the whole catalog,
+        and only descriptions and prompts are scored on the shards.
+
+        Args:
+            shards (Shards): The partition.
+            prompts (List[str]): The user's prompts.
+            embed (Callable[[List[str]], np.ndarray]): Embeds a list of prompts, one row per prompt.
+            index (FunctionIndex): The partitioned index.
+            scoring (Scoring): The scoring used.
+            k (int): The number of functions each shard returns per prompt, or None for all of them.
+            metrics (Metrics, optional): Receives the duration of the name and lexical scorers. Defaults to None.
+
+        Returns:
+            np.ndarray: The similarity scores, one row per prompt and one column per position. Functions outside every shard's top k score -inf, unless the cascade settles a prompt on names and lexical matches alone.
+        """
+        self._start()
+
+        def score_vectors(prompts, prompt_vecs, positions, text_scores):
+            prompt_vecs = np.asarray(prompt_vecs, dtype=np.float32)
+            if positions is None:
+                return self._scatter(
+                    shards, prompts, prompt_vecs, text_scores, k, scoring
+                )
+            return self._scatter_positions(
+                shards, prompts, prompt_vecs, positions, text_scores, scoring
+            )
+
+        if scoring.cascades:
+            return scoring.score_cascade(
+                prompts, embed, index, metrics, score_vectors=score_vectors
+            )
+        return scoring.score_many(
+            prompts, embed(prompts), index, metrics, score_vectors=score_vectors
+        )
+
+    def _scatter(
+        self,
+        shards: Shards,
+        prompts: List[str],
+        prompt_vecs: np.ndarray,
+        text_scores: np.ndarray,
+        k: int,
+        scoring: Scoring,
+    ) -> np.ndarray:
+        """
+        Score every shard and merge their top k functions, one column per
+        position of the partitioned index.
+        """
+        futures = [
+            self._executors[shard % self._workers].submit(
+                _score_shard,
+                shard,
+                shards.files[shard].path,
+                prompts,
+                prompt_vecs,
+                _sparse(text_scores[:, shards.positions[start:end]]),
+                None,
+                scoring,
+                k,
+            )
+            for shard, (start, end) in enumerate(
+                zip(shards.starts[:-1], shards.starts[1:])
+            )
+        ]
+        scores = np.full(text_scores.shape, -np.inf, dtype=np.float32)
+        for start, future in zip(shards.starts, futures):
+            local_positions, local_scores = future.result()
+            if local_positions is None:
+                end = start + local_scores.shape[1]
+                scores[:, shards.positions[start:end]] = local_scores
+                continue
+            columns = shards.positions[start + local_positions]
+            np.put_along_axis(scores, columns, local_scores, axis=1)
+        return scores
+
+    def _scatter_positions(
+        self,
+        shards: Shards,
+        prompts: List[str],
+        prompt_vecs: np.ndarray,
+        positions: np.ndarray,
+        text_scores: np.ndarray,
+        scoring: Scoring,
+    ) -> np.ndarray:
+        """
+        Score a shortlist of positions on the shards holding them, one column
+        per position of the shortlist. Removed positions keep their name and
+        lexical scores.
+        """
+        compacted = np.searchsorted(shards.positions, positions)
+        alive = compacted < len(shards.positions)
+        alive[alive] = shards.positions[compacted[alive]] == positions[alive]
+        scores = np.array(text_scores, dtype=np.float32)
+        shard_of = np.searchsorted(shards.starts, compacted, side="right") - 1
+        futures = []
+        for shard in np.unique(shard_of[alive]):
+            columns = np.flatnonzero(alive & (shard_of == shard))
+            futures.append(
+                (
+                    columns,
+                    self._executors[shard % self._workers].submit(
+                        _score_shard,
+                        shard,
+                        shards.files[shard].path,
+                        prompts,
+                        prompt_vecs,
+                        _sparse(text_scores[:, columns]),
+                        compacted[columns] - shards.starts[shard],
+                        scoring,
+                        None,
+                    ),
+                )
+            )
+        for columns, future in futures:
+            scores[:, columns] = future.result()[1]
+        return scores
+
+    def close(self) -> None:
+        """
+        Stop the worker processes and delete the shard files.
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+        self._executors = None
+        self._directory = None
+        self._finalizer = None
+
+    def _start(self) -> None:
+        if self._executors is not None:
+            return
+        context = multiprocessing.get_context("spawn")
+        self._executors = [
+            ProcessPoolExecutor(1, mp_context=context)
+            for _ in range(self._workers)
+        ]
+        self._directory = tempfile.mkdtemp(prefix="functionsai-")
+        self._finalizer = weakref.finalize(
+            self, _close, self._executors, self._directory
+        )
+
+    @property
+    def workers(self) -> int:
+        """
+        Returns:
+            int: The number of worker processes.
+        """
+        return self._workers
+
+    @property
+    def shard_size(self) -> int:
+        """
+        Returns:
+            int: The number of functions per shard, or None for one shard per worker.
+        """
+        return self._shard_size
+
+
+__all__ = ["ShardPool", "Shards"]
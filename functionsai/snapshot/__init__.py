@@ -0,0 +1,24 @@
+"""
+"""
+from typing import List, NamedTuple
+from ..index import FunctionIndex
+from ..modules import Module
+from ..routing import Router
+from ..scoring import Scoring
+from ..sharding import Shards
+
+
+class Snapshot(NamedTuple):
+    """
+    An immutable view of a catalog that queries run against. Writers build a
+    new snapshot and swap it in, so readers never see a partial update.
+    """
+
+    index: FunctionIndex
+    scoring: Scoring
+    modules: List[Module]
+    router: Router = None
+    shards: Shards = None
+
+
+__all__ = ["Snapshot"]
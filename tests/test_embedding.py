@@ -0,0 +1,140 @@
+import pytest
+import numpy as np
+import functionsai as fai
+from functionsai import (
+    FunctionsAI,
+    Embedder,
+    SpacyEmbedder,
+    HashingEmbedder,
+    EmbeddingCache,
+    QueryCache,
+)
+
+
+class TestEmbedding:
+    def test_spacy_embedder_is_lazy(self):
+        embedder = SpacyEmbedder("not_a_model")
+        assert embedder.name == "not_a_model"
+        assert "not_a_model" not in SpacyEmbedder._models
+
+    def test_embedder_is_abstract(self):
+        with pytest.raises(TypeError):
+            Embedder()
+
+    def test_hashing_embedder(self):
+        embedder = HashingEmbedder(dim=32)
+        vectors = embedder.embed_many(
+            ["plot a timeseries", "Plot a timeseries"]
+        )
+        assert vectors.shape == (2, 32)
+        assert np.array_equal(vectors[0], vectors[1])
+        assert np.array_equal(embedder.embed("plot a timeseries"), vectors[0])
+
+    def test_functionsai_embedder(self, function):
+        embedder = HashingEmbedder()
+        functionsai = FunctionsAI(fai, function, embedder=embedder)
+        assert functionsai.embedder is embedder
+        assert len(functionsai.sort("plot a timeseries")) == len(
+            functionsai.functions
+        )
+
+    def test_spacy_embedder_pipe(self, tmp_path):
+        import spacy
+
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        nlp.to_disk(tmp_path)
+        embedder = SpacyEmbedder(str(tmp_path), batch_size=2)
+        vectors = embedder.embed_many(["one", "two", "three"])
+        assert embedder.disable == ["sentencizer"]
+        assert len(vectors) == 3
+
+    def test_build_stats(self, function):
+        functionsai = FunctionsAI(function, embedder=HashingEmbedder())
+        assert functionsai.build_stats.texts == 1
+        assert functionsai.build_stats.embedded == 1
+        assert functionsai.build_stats.texts_per_second >= 0
+
+    def test_embedding_cache(self, tmp_path):
+        embedder = HashingEmbedder()
+        cache = EmbeddingCache(str(tmp_path))
+        texts = ["plot a timeseries", "summarize the file"]
+        vectors = cache.embed_many(embedder, texts)
+        assert (cache.hits, cache.misses) == (0, 2)
+
+        cache = EmbeddingCache(str(tmp_path))
+        again = cache.embed_many(embedder, texts + ["read a csv"])
+        assert (cache.hits, cache.misses) == (2, 1)
+        assert np.array_equal(again[:2], vectors)
+
+        other = cache.embed_many(HashingEmbedder(dim=8), texts)
+        assert other.shape == (2, 8)
+        assert cache.misses == 3
+
+    def test_embedding_cache_segments(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path))
+
+        class Embedder(HashingEmbedder):
+            def embed_many(self, texts):
+                assert not cache._lock.locked()
+                return super().embed_many(texts)
+
+        embedder = Embedder()
+        cache.embed_many(embedder, ["plot a timeseries"])
+        (first,) = tmp_path.iterdir()
+        written = first.read_bytes()
+        cache.embed_many(embedder, ["plot a timeseries", "read a csv"])
+        assert len(list(tmp_path.iterdir())) == 2
+        assert first.read_bytes() == written
+
+        for i in range(16):
+            cache.embed_many(embedder, [f"text {i}"])
+        cache = EmbeddingCache(str(tmp_path))
+        cache.embed_many(embedder, ["read a csv", "text 15"])
+        assert (cache.hits, cache.misses) == (2, 0)
+        assert len(list(tmp_path.iterdir())) == 1
+
+    def test_embedding_cache_null_keys(self, tmp_path):
+        embedder = HashingEmbedder()
+        cache = EmbeddingCache(str(tmp_path))
+        namespace = cache._namespace(embedder)
+        text = next(
+            text
+            for text in map(str, range(100000))
+            if cache._key(namespace, text).endswith(b"\0")
+        )
+        cache.embed_many(embedder, [text])
+
+        cache = EmbeddingCache(str(tmp_path))
+        cache.embed_many(embedder, [text])
+        assert (cache.hits, cache.misses) == (1, 0)
+
+    def test_functionsai_cache(self, function, tmp_path):
+        first = FunctionsAI(
+            fai, function, embedder=HashingEmbedder(), cache_dir=str(tmp_path)
+        )
+        second = FunctionsAI(
+            fai, function, embedder=HashingEmbedder(), cache_dir=str(tmp_path)
+        )
+        assert first.build_stats.cached == 0
+        assert second.build_stats.embedded == 0
+        assert second.build_stats.cached == first.build_stats.embedded
+        assert np.array_equal(
+            first.index.description_matrix, second.index.description_matrix
+        )
+
+    def test_query_cache(self):
+        embedder = HashingEmbedder()
+        cache = QueryCache(capacity=2)
+        first = cache.embed_many(embedder, ["plot this", " plot   this "])
+        assert np.array_equal(first[0], first[1])
+        assert (cache.hits, cache.misses) == (0, 1)
+
+        cache.embed_many(embedder, ["summarize the file"])
+        cache.embed_many(embedder, ["plot this"])
+        cache.embed_many(embedder, ["read a csv"])
+        assert (cache.hits, cache.misses, cache.evictions) == (1, 3, 1)
+        assert len(cache) == 2
+        cache.embed_many(embedder, ["plot this"])
+        assert cache.hits == 2
+        assert cache.hit_rate == 0.4
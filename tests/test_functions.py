@@ -1,3 +1,6 @@
+from functionsai import Function
+
+
 class TestFunction:
     def test_function_name(self, function, function_without_prompt):
         assert function_without_prompt.name == function.__name__
@@ -20,3 +23,26 @@ class TestFunction:
         assert function_without_prompt != function_with_prompt
         assert function_without_prompt == function_without_prompt
         assert function_with_prompt == function_with_prompt
+
+    def test_function_schema(self, function_without_prompt):
+        import json
+
+        schema = function_without_prompt.schema
+        assert schema is function_without_prompt.schema
+        assert schema["parameters"]["required"] == ["x"]
+        encoded = json.loads(function_without_prompt.schema_json)
+        assert encoded["parameters"]["properties"]["x"]["type"] == "Series"
+
+        function_without_prompt.description = "Plot a timeseries."
+        assert (
+            function_without_prompt.schema["description"]
+            == "Plot a timeseries."
+        )
+        assert b"Plot a timeseries." in function_without_prompt.schema_json
+
+    def test_function_lazy_params(self, function):
+        wrapped = Function(function)
+        assert not hasattr(wrapped, "__dict__")
+        assert wrapped._params is None
+        assert [param.name for param in wrapped.params] == ["x"]
+        assert wrapped.params is wrapped.params
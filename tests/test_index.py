@@ -0,0 +1,486 @@
+import pytest
+import numpy as np
+import functionsai as fai
+from functionsai import FunctionsAI, Function, HashingEmbedder, Scoring
+from functionsai.index import (
+    BM25Index,
+    FunctionIndex,
+    IVFIndex,
+    NameIndex,
+    Storage,
+    normalize,
+    recall_at_k,
+)
+from functionsai.index.lexical import tokenize
+from functionsai.index.names import signature
+from functionsai.scoring import description, name, prompt
+
+
+class TestIndex:
+    def test_description_matrix(self, function):
+        with_description = Function(function)
+        with_description.description_vector = np.array([3.0, 4.0])
+        without_description = Function(function)
+        without_description.description = None
+        index = FunctionIndex([with_description, without_description])
+
+        assert index.description_matrix.dtype == np.float32
+        assert index.description_matrix.flags.c_contiguous
+        assert np.allclose(index.description_matrix[0], [0.6, 0.8])
+        assert np.array_equal(index.description_mask, [True, False])
+
+    def test_description_similarity(self, function):
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        rng = np.random.default_rng(0)
+        functions = [Function(function) for _ in range(4)]
+        for f in functions:
+            f.description_vector = rng.normal(size=8)
+        prompt_vec = rng.normal(size=8)
+        index = FunctionIndex(functions)
+
+        expected = cosine_similarity(
+            prompt_vec.reshape(1, -1),
+            [f.description_vector for f in functions],
+        )[0]
+        assert np.allclose(
+            description.similarity(prompt_vec.reshape(1, -1), index)[0],
+            expected,
+            atol=1e-6,
+        )
+
+    def test_prompt_similarity(self, function):
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        rng = np.random.default_rng(0)
+        functions = [
+            Function(function, ["a"] * count) for count in (3, 0, 1, 5)
+        ]
+        for f in functions:
+            f.prompts_vector = list(rng.normal(size=(len(f.prompts), 8)))
+        prompt_vec = rng.normal(size=8)
+        index = FunctionIndex(functions)
+
+        expected = [
+            cosine_similarity(prompt_vec.reshape(1, -1), f.prompts_vector).max()
+            if f.prompts
+            else 0
+            for f in functions
+        ]
+        assert np.array_equal(index.prompt_owners, [0, 0, 0, 2, 3, 3, 3, 3, 3])
+        assert np.array_equal(index.prompt_mask, [True, False, True, True])
+        assert np.allclose(
+            prompt.similarity(prompt_vec.reshape(1, -1), index)[0],
+            expected,
+            atol=1e-6,
+        )
+
+    def test_save_load(self, function, tmp_path):
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        path = str(tmp_path / "functions.index")
+        functionsai.save_index(path)
+
+        mapped = FunctionsAI(
+            fai, function, embedder=HashingEmbedder(), index_path=path
+        )
+        assert isinstance(mapped.index.description_matrix, np.memmap)
+        assert not mapped.index.description_matrix.flags.writeable
+        assert np.array_equal(
+            mapped.index.description_matrix,
+            functionsai.index.description_matrix,
+        )
+        assert np.array_equal(
+            mapped.index.prompt_owners, functionsai.index.prompt_owners
+        )
+        prompt_text = "sort the functions by a prompt"
+        assert mapped.top(prompt_text) == functionsai.top(prompt_text)
+
+    def test_storage(self, function, tmp_path):
+        with pytest.raises(ValueError):
+            Storage("int4")
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(200, 16))
+        queries = normalize(rng.normal(size=(5, 16)))
+        exact = queries @ normalize(vectors).T
+        functions = [Function(function) for _ in vectors]
+
+        full = FunctionIndex(functions, description_vectors=list(vectors))
+        for storage, tolerance in (
+            (Storage("float16"), 1e-3),
+            (Storage("int8"), 0.02),
+        ):
+            index = FunctionIndex(
+                functions, description_vectors=list(vectors), storage=storage
+            )
+            assert index.description_matrix.dtype == storage.dtype
+            assert index.nbytes < full.nbytes
+            similarities = description.similarity(queries, index)
+            assert np.allclose(similarities, exact, atol=tolerance)
+            assert recall_at_k(exact, similarities, 5) >= 0.8
+
+        projected = FunctionIndex(
+            functions,
+            description_vectors=list(vectors),
+            storage=Storage(dimensions=8, block_size=64),
+        )
+        assert projected.dim == 16
+        assert projected.description_matrix.shape == (200, 8)
+        assert description.similarity(queries, projected).shape == (5, 200)
+
+        # An index grown from a small first batch only projects its vectors
+        # once it holds as many as the projection has components
+        grown = FunctionIndex(
+            functions[:2],
+            description_vectors=list(vectors[:2]),
+            storage=Storage(dimensions=8, block_size=64),
+        )
+        assert grown.storage.projection is None
+        assert grown.description_matrix.shape == (2, 16)
+        grown.add(functions[2:], list(vectors[2:]))
+        assert grown.storage.projection.shape == (16, 8)
+        assert np.allclose(
+            grown.storage.projection, projected.storage.projection, atol=1e-5
+        )
+        grown_similarities = description.similarity(queries, grown)
+        assert np.allclose(
+            grown_similarities,
+            description.similarity(queries, projected),
+            atol=1e-5,
+        )
+        assert np.array_equal(
+            np.argsort(-grown_similarities, axis=1)[:, :5],
+            np.argsort(-description.similarity(queries, projected), axis=1)[
+                :, :5
+            ],
+        )
+
+        prompted = FunctionIndex(
+            functions[:1], storage=Storage(dimensions=8, block_size=64)
+        )
+        prompted.update_prompts([0], vectors[:3])
+        assert prompted.storage.projection is None
+        prompted.add(functions[1:], list(vectors[1:]))
+        assert prompted.storage.projection is not None
+        built = FunctionIndex(
+            functions,
+            description_vectors=[None, *vectors[1:]],
+            prompts_vectors=[list(vectors[:3])] + [None] * 199,
+            storage=Storage(dimensions=8, block_size=64),
+        )
+        for scorer in (description.similarity, prompt.similarity):
+            assert np.allclose(
+                scorer(queries, prompted), scorer(queries, built), atol=1e-5
+            )
+
+        quantized = full.quantize(Storage("int8", dimensions=8))
+        assert quantized.description_matrix.dtype == np.int8
+        assert full.description_matrix.dtype == np.float32
+        path = str(tmp_path / "quantized.index")
+        quantized.save(path)
+        loaded = FunctionIndex.load(path, functions)
+        assert loaded.storage.dtype == np.int8
+        assert np.array_equal(
+            loaded.storage.projection, quantized.storage.projection
+        )
+        assert np.allclose(
+            description.similarity(queries, loaded),
+            description.similarity(queries, quantized),
+        )
+
+    def test_compare_storage(self, function):
+        functionsai = FunctionsAI(
+            fai, function, embedder=HashingEmbedder(), query_cache_size=0
+        )
+        functionsai.remove(function)
+        prompts = ["sort the functions by a prompt", "save the index"]
+        report = functionsai.compare_storage(Storage("int8"), prompts, k=3)
+        assert report.bytes < report.reference_bytes
+        assert report.saved_bytes == report.reference_bytes - report.bytes
+        assert 0 <= report.agreement <= 1
+        assert functionsai.index.storage.dtype == np.float32
+
+    def test_load_other_catalog(self, function, tmp_path):
+        path = str(tmp_path / "functions.index")
+        FunctionsAI(function, embedder=HashingEmbedder()).save_index(path)
+        with pytest.raises(ValueError):
+            FunctionsAI(fai, embedder=HashingEmbedder(), index_path=path)
+
+        functions = [Function(function, ["plot a chart"])]
+        FunctionIndex(functions).save(path)
+        assert len(FunctionIndex.load(path, functions)) == 1
+        with pytest.raises(ValueError):
+            FunctionIndex.load(path, [Function(function, ["draw a map"])])
+
+    def test_name_index(self):
+        from fuzzywuzzy import fuzz
+
+        names = ["get_weather", "getWeather", "plot", None, "summarize_file"]
+        index = NameIndex(names)
+        assert "wea" in signature("getWeather")
+        assert " we" in signature("getWeather")
+
+        positions, scores = index.match("weather")
+        assert list(positions) == [0, 1]
+        assert list(scores) == [
+            fuzz.ratio("weather", names[0]),
+            fuzz.ratio("weather", names[1]),
+        ]
+        assert len(index.match("xyz")[0]) == 0
+
+        # Names within one edit of the word are shortlisted, and names
+        # sharing fewer n-grams score zero
+        bounded = NameIndex(["weathr", "other", "feather", "the_weather"])
+        assert list(bounded.shortlist("weather")) == [0, 2, 3]
+        assert list(bounded.match("weather")[0]) == [0, 2, 3]
+
+        copied = index.copy()
+        copied.add(["weather_report"])
+        index.add(["plot_weather"])
+        copied.add(["weathervane"])
+        assert list(copied.match("weather")[0]) == [0, 1, 5, 6]
+        assert list(index.match("weather")[0]) == [0, 1, 5]
+        assert index.names[5] == "plot_weather"
+
+    def test_bm25_index(self):
+        import math
+
+        assert tokenize("Get getWeather, now") == [
+            "get",
+            "getweather",
+            "get",
+            "weather",
+            "now",
+        ]
+        documents = [
+            "plot a timeseries",
+            "plot the weather and plot the map",
+            None,
+            "resize an image",
+        ]
+        index = BM25Index(documents, k1=1.2, b=0.75)
+        positions, scores = index.score("plot weather")
+
+        average = (3 + 7 + 3) / 3
+
+        def bm25(count, length, frequency):
+            idf = math.log(1 + (3 - frequency + 0.5) / (frequency + 0.5))
+            norm = 1.2 * (1 - 0.75 + 0.75 * length / average)
+            return idf * count * 2.2 / (count + norm)
+
+        assert list(positions) == [0, 1]
+        assert np.allclose(
+            scores,
+            [bm25(1, 3, 2), bm25(2, 7, 2) + bm25(1, 7, 1)],
+        )
+        assert list(index.search("plot weather", 1)[0]) == [1]
+        assert len(index.score("xyz")[0]) == 0
+
+        copied = index.copy()
+        copied.remove([1])
+        copied.add(["weather report"])
+        assert list(copied.search("weather", 5)[0]) == [4]
+        assert list(index.search("weather", 5)[0]) == [1]
+        assert index.score_many(["image", "xyz"]).shape == (2, 4)
+        assert not index.score_many(["xyz"]).any()
+
+        index.score_many(["plot"])
+        index.add(["plot a map"])
+        assert np.allclose(
+            index.score_many(["plot"]),
+            BM25Index([*documents, "plot a map"]).score_many(["plot"]),
+        )
+
+        queries = ["plot weather", "weather report", "resize image"]
+        copied.update([0], ["plot the weather"])
+        rebuilt = BM25Index(
+            [None, None, None, *documents[3:], "weather report"]
+        )
+        rebuilt.add(["plot the weather"])
+        expected = np.zeros((3, 5), dtype=np.float32)
+        expected[:, [0, 3, 4]] = rebuilt.score_many(queries)[:, [5, 3, 4]]
+        assert np.allclose(copied.score_many(queries), expected)
+        assert 0 < index.score_many(["image"])[0, 3] <= 1
+
+    def test_lexical_index(self, function):
+        functions = [Function(function), Function(function, ["rotate a jpeg"])]
+        index = FunctionIndex(functions[:1], compaction=1.0)
+        assert len(index.lexical_index) == 1
+        index.lexical_index.score_many(["jpeg image"])
+        index.add(functions[1:])
+        rebuilt = FunctionIndex(functions).lexical_index
+        assert np.allclose(
+            index.lexical_index.score_many(["jpeg image"]),
+            rebuilt.score_many(["jpeg image"]),
+        )
+        assert list(index.lexical_index.search("jpeg", 5)[0]) == [1]
+
+        functions[0].prompts = ["rotate a png"]
+        index.update_prompts([0], None)
+        rebuilt = FunctionIndex(functions).lexical_index
+        assert np.allclose(
+            index.lexical_index.score_many(["png", "jpeg"]),
+            rebuilt.score_many(["png", "jpeg"]),
+        )
+
+        index.remove([1])
+        assert len(index.lexical_index.search("jpeg", 5)[0]) == 0
+
+        # Compacting remaps the name and lexical indexes instead of dropping
+        # them
+        index.add(functions[1:])
+        names, lexical = index.name_index, index.lexical_index
+        assert list(index.compact()) == [0, -1, 1]
+        assert index.name_index is not names
+        assert index.lexical_index is not lexical
+        rebuilt = FunctionIndex([functions[0], functions[1]])
+        assert index.name_index.names == rebuilt.name_index.names
+        assert list(index.name_index.match(functions[0].name)[0]) == [0, 1]
+        assert np.allclose(
+            index.lexical_index.score_many(["png", "jpeg", "rotate"]),
+            rebuilt.lexical_index.score_many(["png", "jpeg", "rotate"]),
+        )
+
+    def test_name_similarity(self, function):
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        similarities = name.similarity(
+            ["please sort these", ""], functionsai.index
+        )
+        position = [f.name for f in functionsai.functions].index("sort")
+        assert similarities[0, position] == 100
+        assert not similarities[1].any()
+
+    def test_ivf_index(self):
+        rng = np.random.default_rng(0)
+        vectors = normalize(rng.normal(size=(500, 16)))
+        queries = normalize(rng.normal(size=(20, 16)))
+        exact = queries @ vectors.T
+
+        ivf = IVFIndex(n_lists=10, n_probe=10).fit(vectors)
+        approximate = np.zeros_like(exact)
+        for row, (ids, scores) in enumerate(ivf.search(queries)):
+            approximate[row, ids] = scores
+        assert np.allclose(approximate, exact, atol=1e-6)
+        assert recall_at_k(exact, approximate, 5) == 1.0
+
+        ivf.n_probe = 1
+        for ids, _ in ivf.search(queries):
+            assert len(ids) < len(vectors)
+
+        # Vectors added one at a time land in the same clusters as when
+        # added together, and earlier copies keep their own vectors
+        ivf = IVFIndex(n_lists=10, n_probe=10).fit(vectors[:300])
+        grown = [ivf]
+        for start in range(300, 500, 20):
+            grown.append(
+                grown[-1].add(
+                    vectors[start : start + 20], np.arange(start, start + 20)
+                )
+            )
+        together = ivf.add(vectors[300:], np.arange(300, 500))
+        for (ids, scores), (expected_ids, expected) in zip(
+            grown[-1].search(queries), together.search(queries)
+        ):
+            order, expected_order = np.argsort(ids), np.argsort(expected_ids)
+            assert np.array_equal(ids[order], expected_ids[expected_order])
+            assert np.allclose(scores[order], expected[expected_order])
+        for ids, _ in grown[1].search(queries):
+            assert np.array_equal(np.sort(ids), np.arange(320))
+
+        mapping = np.where(np.arange(500) % 2, np.arange(500) // 2, -1)
+        for ids, scores in grown[-1].reindex(mapping).search(queries):
+            assert np.array_equal(np.sort(ids), np.arange(250))
+
+    def test_functionsai_ann(self, function):
+        exact = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        approximate = FunctionsAI(
+            fai,
+            function,
+            embedder=HashingEmbedder(),
+            ann=IVFIndex(n_lists=4, n_probe=4),
+        )
+        assert approximate.index.description_ann.n_lists == 4
+        prompt_text = "embed a batch of texts"
+        assert approximate.top(prompt_text) == exact.top(prompt_text)
+
+    def test_incremental_index(self, function):
+        rng = np.random.default_rng(0)
+        functions = [Function(function, ["a"] * count) for count in (2, 1, 3)]
+        for f in functions:
+            f.description_vector = rng.normal(size=8)
+            f.prompts_vector = list(rng.normal(size=(len(f.prompts), 8)))
+        prompt_vec = rng.normal(size=(1, 8))
+        index = FunctionIndex(functions[:2], compaction=1.0)
+        index.add(functions[2:])
+        index.remove([0])
+        index.update_prompts([1], rng.normal(size=(2, 8)))
+        rebuilt = FunctionIndex(functions[1:])
+        rebuilt.update_prompts([0], index.prompt_matrix[index.prompt_alive])
+
+        assert len(index) == 3 and index.functions[0] is None
+        assert np.allclose(
+            description.similarity(prompt_vec, index)[0, 1:],
+            description.similarity(prompt_vec, rebuilt)[0],
+            atol=1e-6,
+        )
+        assert np.allclose(
+            prompt.similarity(prompt_vec, index)[0, 1:],
+            prompt.similarity(prompt_vec, rebuilt)[0],
+            atol=1e-6,
+        )
+        assert list(index.compact()) == [-1, 0, 1]
+        assert index.prompt_sorted == len(index.prompt_owners) == 5
+
+    def test_functionsai_add_remove(self, function):
+        functionsai = FunctionsAI(function, embedder=HashingEmbedder())
+        assert functionsai.add(fai).embedded > 0
+        assert len(functionsai.functions) == len(
+            FunctionsAI(fai, function, embedder=HashingEmbedder()).functions
+        )
+
+        functionsai.remove(fai)
+        assert functionsai.modules == []
+        assert [f.function for f in functionsai.functions] == [function]
+        assert [f["name"] for f in functionsai.top("plot", top=5)] == ["plot"]
+
+        functionsai.update_prompts(function, ["draw a chart"])
+        assert functionsai.functions[0].prompts == ["draw a chart"]
+        assert functionsai.index.prompt_mask[functionsai.index.alive].all()
+
+    def test_snapshot(self, function):
+        from concurrent.futures import ThreadPoolExecutor
+
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        snapshot = functionsai.snapshot
+        prompt_text = "plot a timeseries"
+        before = functionsai.top(prompt_text, 3)
+
+        functionsai.remove(function)
+        functionsai.scoring = Scoring(
+            name_scoring=lambda prompts, index: np.zeros(
+                (len(prompts), len(index))
+            )
+        )
+        assert snapshot.index.functions[-1].function is function
+        assert (
+            functionsai.scoring.name_scoring
+            is not snapshot.scoring.name_scoring
+        )
+
+        functionsai.add(function)
+        with ThreadPoolExecutor(4) as executor:
+            tops = list(
+                executor.map(
+                    lambda _: functionsai.top(prompt_text, 3), range(8)
+                )
+            )
+        assert all(top == tops[0] for top in tops)
+        functionsai.scoring = snapshot.scoring
+        assert functionsai.top(prompt_text, 3) == before
+
+    def test_functionsai_function_objects(self, function_with_prompt):
+        functionsai = FunctionsAI(
+            function_with_prompt, embedder=HashingEmbedder()
+        )
+        assert functionsai.functions == [function_with_prompt]
+        assert functionsai.build_stats.texts == 2
+        assert functionsai.index.prompt_mask.all()
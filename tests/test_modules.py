@@ -1,4 +1,5 @@
 from functionsai import Function, Module
+from functionsai.modules import discover
 import inspect
 
 
@@ -49,3 +50,33 @@ class TestModules:
         new_module = Module(module)
         assert module_without_prompt == module_without_prompt
         assert module_without_prompt == new_module
+
+    def test_modules_discover(self, module):
+        import types
+
+        package = types.ModuleType("package")
+
+        class Node:
+            def visit(self):
+                pass
+
+            def _hidden(self):
+                pass
+
+        Node.__module__ = "package"
+        Node.child = Node
+        Node.alias = Node.visit
+        package.Node = Node
+        package.run = lambda: None
+        package.run.__name__ = package.run.__qualname__ = "run"
+        package.run.__module__ = "package"
+
+        functions = discover(package)
+        assert isinstance(functions, types.GeneratorType)
+        assert list(functions) == [Node.visit, package.run]
+        assert list(discover(package, depth=0)) == [package.run]
+        assert list(discover(package, include=["*.Node.*"])) == [Node.visit]
+        assert list(discover(package, exclude=["*.Node"])) == [package.run]
+        assert len(Module(module, recursive=True).functions) > len(
+            Module(module).functions
+        )
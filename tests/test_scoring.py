@@ -0,0 +1,356 @@
+import pytest
+import types
+import asyncio
+import numpy as np
+import functionsai as fai
+from functionsai import (
+    FunctionsAI,
+    HashingEmbedder,
+    LatencyHistogram,
+    Metrics,
+    MicroBatcher,
+    Router,
+    Scoring,
+    ShardPool,
+)
+from functionsai.scoring import description, lexical, name, top_k
+
+
+class TestScoring:
+    def test_score(self, function):
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        prompt_text = "Make a plot of this timeseries"
+        prompt_vec = functionsai.embedder.embed(prompt_text)
+        index = functionsai.index
+
+        scores = Scoring().score(prompt_text, prompt_vec, index)
+
+        expected = np.maximum(
+            name.similarity([prompt_text], index)[0],
+            np.where(
+                index.description_mask,
+                description.similarity(prompt_vec.reshape(1, -1), index)[0],
+                0,
+            ),
+        ).clip(min=0)
+        assert isinstance(scores, np.ndarray)
+        assert scores.shape == (len(functionsai.functions),)
+        assert np.allclose(scores, expected)
+
+    def test_top_k(self):
+        scores = np.array([0.5, 0.9, 0.5, 0.1, 0.9, 0.5])
+        assert list(top_k(scores, 3)) == [1, 4, 0]
+        assert list(top_k(scores, 4)) == [1, 4, 0, 2]
+        assert list(top_k(scores, 10)) == list(
+            np.argsort(-scores, kind="stable")
+        )
+        assert len(top_k(scores, 0)) == 0
+
+    def test_top_matches_sort(self, function):
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        prompt_text = "sort the functions by a prompt"
+        sorted_names = [f.name for f, _ in functionsai.sort(prompt_text)]
+        top_names = [f["name"] for f in functionsai.top(prompt_text, 3)]
+        assert top_names == sorted_names[:3]
+
+        # Results are the caller's own, and modifying them leaves later ones
+        # unchanged
+        expected = functionsai.top(prompt_text, 3)
+        for schema in functionsai.top(prompt_text, 3):
+            schema["name"] = None
+            schema["parameters"]["properties"].clear()
+        for schema in functionsai.top_many([prompt_text], 3)[0]:
+            schema["parameters"]["required"].append("prompt")
+        assert functionsai.top(prompt_text, 3) == expected
+
+    def test_top_many(self, function):
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        prompts = ["plot a timeseries", "", "sort the functions by a prompt"]
+        assert functionsai.top_many(prompts, 2) == [
+            functionsai.top(prompt, 2) for prompt in prompts
+        ]
+        assert [
+            [(f.name, round(float(s), 5)) for f, s in pairs]
+            for pairs in functionsai.sort_many(prompts)
+        ] == [
+            [(f.name, round(float(s), 5)) for f, s in functionsai.sort(prompt)]
+            for prompt in prompts
+        ]
+
+    def test_atop(self, function):
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        prompts = ["plot a timeseries", "", "sort the functions by a prompt"]
+
+        async def search():
+            return await asyncio.gather(
+                *(functionsai.atop(prompt, 2) for prompt in prompts),
+                functionsai.asort(prompts[0]),
+            )
+
+        *tops, sorted_pairs = asyncio.run(search())
+        assert tops == [functionsai.top(prompt, 2) for prompt in prompts]
+        assert [f.name for f, _ in sorted_pairs] == [
+            f.name for f, _ in functionsai.sort(prompts[0])
+        ]
+
+    def test_atop_sequential(self, function):
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        prompts = ["plot a timeseries", "sort the functions by a prompt"]
+
+        async def search():
+            return [await functionsai.atop(prompt, 2) for prompt in prompts]
+
+        assert asyncio.run(asyncio.wait_for(search(), 10)) == [
+            functionsai.top(prompt, 2) for prompt in prompts
+        ]
+
+    def test_micro_batcher(self):
+        batches = []
+
+        def double(items):
+            batches.append(items)
+            return [2 * item for item in items]
+
+        async def submit_all(batcher):
+            return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+        results = asyncio.run(
+            submit_all(MicroBatcher(double, max_batch_size=3))
+        )
+        assert results == [0, 2, 4, 6, 8]
+        assert batches == [[0, 1, 2], [3, 4]]
+
+    def test_top_json(self, function):
+        import json
+
+        functionsai = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        prompts = ["plot a timeseries", "sort the functions by a prompt"]
+        for prompt, encoded in zip(
+            prompts, functionsai.top_json_many(prompts, 3)
+        ):
+            assert encoded == functionsai.top_json(prompt, 3)
+            assert [f["name"] for f in json.loads(encoded)] == [
+                f["name"] for f in functionsai.top(prompt, 3)
+            ]
+
+    def test_metrics(self, function):
+        with pytest.raises(TypeError):
+            Metrics()
+        metrics = LatencyHistogram()
+        functionsai = FunctionsAI(
+            fai, function, embedder=HashingEmbedder(), metrics=metrics
+        )
+        assert {"build.embed", "build.index"} <= set(metrics.stages)
+
+        functionsai.top_many(["plot a timeseries", "sort functions"], 2)
+        summary = metrics.summary()
+        for stage in ("embed", "name", "description", "combine", "select"):
+            assert summary[stage]["calls"] == 1
+        assert summary["select"]["items"] == 2
+        assert summary["name"]["items"] == 2 * len(functionsai.functions)
+        assert summary["query"]["p99_ms"] <= summary["query"]["max_ms"]
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram(smallest=1e-3, buckets_per_octave=1)
+        for milliseconds in range(1, 101):
+            histogram.record("query", milliseconds / 1000, 1)
+        assert histogram.percentile("query", 50) == 0.064
+        assert histogram.percentile("query", 100) == 0.1
+        histogram.reset()
+        assert histogram.stages == []
+
+    def test_cascade(self, function):
+        class CountingEmbedder(HashingEmbedder):
+            texts = []
+
+            def embed_many(self, texts):
+                self.texts.extend(texts)
+                return super().embed_many(texts)
+
+        embedder = CountingEmbedder()
+        functionsai = FunctionsAI(
+            fai, function, embedder=embedder, query_cache_size=0
+        )
+        prompts = ["plot this timeseries", "compact the index", "hello there"]
+        full = functionsai._score_many(prompts, functionsai.snapshot)
+        names = name.similarity(prompts, functionsai.index)
+
+        functionsai.scoring = Scoring(exact_match=100)
+        embedder.texts.clear()
+        cascade = functionsai._score_many(prompts, functionsai.snapshot)
+        assert embedder.texts == ["hello there"]
+        assert np.array_equal(cascade[:2], names[:2])
+        assert np.allclose(cascade[2], full[2])
+        assert np.argmax(cascade[0]) == np.argmax(full[0])
+
+        functionsai.scoring = Scoring(candidates=3)
+        cascade = functionsai._score_many(prompts, functionsai.snapshot)
+        for row in range(len(prompts)):
+            matched = np.flatnonzero(names[row] > 0)
+            if len(matched) == 0:
+                assert np.allclose(cascade[row], full[row])
+                continue
+            shortlist = matched[top_k(names[row, matched], 3)]
+            assert np.allclose(cascade[row, shortlist], full[row, shortlist])
+            others = np.setdiff1d(np.arange(len(names[row])), shortlist)
+            assert np.array_equal(cascade[row, others], names[row, others])
+
+    def test_lexical_scoring(self, function):
+        functionsai = FunctionsAI(
+            fai, function, embedder=HashingEmbedder(), query_cache_size=0
+        )
+        prompts = ["tombstoned compaction", "xyz"]
+        full = functionsai._score_many(prompts, functionsai.snapshot)
+        lexical_scores = lexical.similarity(prompts, functionsai.index)
+        assert lexical_scores.max() <= 1
+        assert not lexical_scores[1].any()
+
+        metrics = LatencyHistogram()
+        functionsai = FunctionsAI(
+            fai,
+            function,
+            embedder=HashingEmbedder(),
+            query_cache_size=0,
+            metrics=metrics,
+        )
+        functionsai.scoring = Scoring(lexical_scoring=lexical.similarity)
+        combined = functionsai._score_many(prompts, functionsai.snapshot)
+        assert np.allclose(combined, np.maximum(full, lexical_scores))
+        assert "lexical" in metrics.stages
+
+        functionsai.scoring = Scoring(
+            lexical_scoring=lexical.similarity, candidates=2
+        )
+        cascade = functionsai._score_many(prompts, functionsai.snapshot)
+        text_scores = np.maximum(
+            name.similarity(prompts, functionsai.index), lexical_scores
+        )
+        shortlist = top_k(text_scores[0], 2)
+        assert np.allclose(cascade[0, shortlist], combined[0, shortlist])
+
+    def test_router(self, function):
+        def make(name, doc, words):
+            module = types.ModuleType(name, doc)
+            for word in words:
+                code = f'def {word}():\n    """{doc} {word}"""\n'
+                exec(code, module.__dict__)
+            return module
+
+        weather = make(
+            "weather", "Weather forecasts", ["forecast", "temperature"]
+        )
+        billing = make("billing", "Invoices and payments", ["invoice", "pay"])
+        images = make("images", "Resize and crop images", ["resize", "crop"])
+        args = (weather, billing, function)
+        routed = FunctionsAI(
+            *args,
+            embedder=HashingEmbedder(),
+            router=Router(modules=1, confidence=0.3),
+            query_cache_size=0,
+        )
+        flat = FunctionsAI(*args, embedder=HashingEmbedder())
+        assert routed.router.routed == routed.modules
+
+        prompts = ["weather forecasts", "zzz qqq"]
+        scores = routed._score_many(prompts, routed.snapshot)
+        names = [f.name for f in routed.functions]
+        kept = [names[i] for i in np.flatnonzero(np.isfinite(scores[0]))]
+        assert sorted(kept) == sorted(
+            ["forecast", "temperature", function.__name__]
+        )
+        full = flat._score_many(prompts, flat.snapshot)
+        finite = np.isfinite(scores[0])
+        assert np.allclose(scores[0, finite], full[0, finite])
+        assert np.allclose(scores[1], full[1])
+
+        archive = make("archive", "Archived weather forecasts", [])
+        fallback = FunctionsAI(
+            archive,
+            weather,
+            embedder=HashingEmbedder(),
+            router=Router(modules=1, confidence=0.3),
+        )
+        prompt_vec = fallback._embed_prompts(["archived weather forecasts"])
+        assert fallback.router.route(prompt_vec)[0][0].name == "archive"
+        assert np.isfinite(
+            fallback._score_many(
+                ["archived weather forecasts"], fallback.snapshot
+            )
+        ).all()
+
+        routed.add(images)
+        assert len(routed.router.routed) == 3
+        assert routed.top("resize and crop images", 1)[0]["name"] in (
+            "resize",
+            "crop",
+        )
+        routed.remove(weather)
+        assert [module.name for module in routed.router.routed] == [
+            "billing",
+            "images",
+        ]
+
+    def test_shard_pool(self, function):
+        flat = FunctionsAI(fai, function, embedder=HashingEmbedder())
+        pool = ShardPool(workers=2, shard_size=25)
+        sharded = FunctionsAI(
+            fai, function, embedder=HashingEmbedder(), shards=pool
+        )
+        try:
+            assert len(sharded.snapshot.shards.starts) - 1 == -(
+                -len(flat.functions) // 25
+            )
+            prompts = ["sort the functions by a prompt", "save the index"]
+            assert sharded.top_many(prompts, 5) == flat.top_many(prompts, 5)
+            assert [f for f, _ in sharded.sort(prompts[0])] == [
+                f for f, _ in flat.sort(prompts[0])
+            ]
+
+            # BM25 statistics and cascade shortlists are those of the whole
+            # catalog, whatever shard a function lands on
+            for scoring in (
+                Scoring(lexical_scoring=lexical.similarity),
+                Scoring(lexical_scoring=lexical.similarity, candidates=3),
+                Scoring(lexical_scoring=lexical.similarity, exact_match=90),
+            ):
+                flat.scoring = sharded.scoring = scoring
+                for (f, score), (g, expected) in zip(
+                    sharded.sort(prompts[1]), flat.sort(prompts[1])
+                ):
+                    assert f == g
+                    assert score == pytest.approx(expected, abs=1e-6)
+                assert sharded.top_many(prompts, 5) == flat.top_many(prompts, 5)
+
+            # Only the shards a change touches are written again, and older
+            # partitions stay readable while a snapshot refers to them
+            old = sharded.snapshot
+            for functionsai in (sharded, flat):
+                functionsai.update_prompts(function, ["write the shards"])
+            shards = sharded.snapshot.shards
+            assert [
+                file is not kept
+                for file, kept in zip(shards.files, old.shards.files)
+            ] == [False] * (len(shards.files) - 1) + [True]
+            sharded.add(fai)
+            flat.add(fai)
+            assert sharded.snapshot.shards.files[0] is shards.files[0]
+            assert sharded.top_many(prompts, 5) == flat.top_many(prompts, 5)
+            assert np.array_equal(
+                pool.score(
+                    old.shards,
+                    prompts,
+                    HashingEmbedder().embed_many,
+                    old.index,
+                    old.scoring,
+                    None,
+                ),
+                old.scoring.score_cascade(
+                    prompts, HashingEmbedder().embed_many, old.index
+                ),
+            )
+
+            sharded.remove(function)
+            flat.remove(function)
+            assert sharded.top_many(prompts, 3) == flat.top_many(prompts, 3)
+        finally:
+            sharded.close()